@@ -1,17 +1,41 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Response, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, UploadFile, File, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.requests import ClientDisconnect
+from starlette.responses import FileResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
+import abc
 import logging
 import asyncio
+import multiprocessing
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
+import hashlib
+import heapq
+import time
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone, timedelta
 import jwt
+import math
+import re
+import json
+import base64
+import bisect
+import unicodedata
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlencode
 import bcrypt
 from io import BytesIO
 from reportlab.lib import colors
@@ -19,6 +43,11 @@ from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from openpyxl import Workbook, load_workbook
+from PIL import Image, ImageOps
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Sem a biblioteca os PDFs ficam pendentes até ser instalada
+    pdfium = None
 import resend
 
 ROOT_DIR = Path(__file__).parent
@@ -43,8 +72,100 @@ if not JWT_SECRET:
     logger.warning("JWT_SECRET not set! Using default for development only.")
 JWT_ALGORITHM = 'HS256'
 
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
+# Tempo máximo (s) até um logout/mudança de password ser visto por todos os workers
+TOKEN_VERSION_TTL = int(os.environ.get('TOKEN_VERSION_TTL', 30))
+
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', 15))
+REFRESH_TOKEN_DAYS = int(os.environ.get('REFRESH_TOKEN_DAYS', 7))
+# Intervalo (s) entre sincronizações da lista de tokens revogados com o Mongo
+REVOCATION_SYNC_SECONDS = int(os.environ.get('REVOCATION_SYNC_SECONDS', 10))
+
+# Token bucket de login: BURST tentativas seguidas, repostas a PER_MINUTE por minuto.
+# O limite por email só conta tentativas falhadas (logins bem sucedidos devolvem o token).
+LOGIN_EMAIL_BURST = int(os.environ.get('LOGIN_EMAIL_BURST', 5))
+LOGIN_EMAIL_PER_MINUTE = float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', 5))
+LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST', 60))
+LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE', 60))
+# "memory" (por worker) ou "mongo" (partilhado entre workers)
+LOGIN_THROTTLE_BACKEND = os.environ.get('LOGIN_THROTTLE_BACKEND', 'memory')
+
+# bcrypt corre num pool dedicado; acima de AUTH_HASH_MAX_PENDING pedidos rejeita logo
+AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))
+AUTH_HASH_MAX_PENDING = int(os.environ.get('AUTH_HASH_MAX_PENDING', 16))
+
 UPLOAD_DIR = ROOT_DIR / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
+# Ficheiros parciais ficam aqui até estarem completos (mesmo disco, para o rename ser atómico)
+UPLOAD_TMP_DIR = UPLOAD_DIR / '.tmp'
+UPLOAD_TMP_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE', 25 * 1024 * 1024))
+MAX_PDF_SIZE = 10 * 1024 * 1024
+# Nomes de upload são o hash do conteúdo e nunca mudam
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Onde ficam os ficheiros: local (UPLOAD_DIR, uma só instância), s3 (ou compatível, ex.: MinIO) ou gridfs
+UPLOAD_STORAGE = os.environ.get('UPLOAD_STORAGE', 'local')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+S3_REGION = os.environ.get('S3_REGION', '')
+S3_PREFIX = os.environ.get('S3_PREFIX', 'uploads/')
+# Acima do limiar o envio é feito em partes (multipart upload) enviadas em paralelo
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+S3_MULTIPART_CHUNK_SIZE = int(os.environ.get('S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024))
+GRIDFS_BUCKET = os.environ.get('GRIDFS_BUCKET', 'uploads_fs')
+
+# Versões redimensionadas das fotos (?w=&fmt=), geradas a pedido e guardadas em disco
+DERIVATIVE_DIR = UPLOAD_DIR / '.derivatives'
+DERIVATIVE_DIR.mkdir(exist_ok=True)
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get('DERIVATIVE_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+# Normalização à entrada das fotos (opcional): orientação EXIF aplicada, metadados removidos,
+# dimensão limitada e recodificação com perdas (jpeg ou webp)
+IMAGE_NORMALIZE = os.environ.get('IMAGE_NORMALIZE', 'false').lower() == 'true'
+IMAGE_NORMALIZE_FORMAT = os.environ.get('IMAGE_NORMALIZE_FORMAT', 'jpeg').lower()
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 2048))
+IMAGE_INGEST_QUALITY = int(os.environ.get('IMAGE_INGEST_QUALITY', 85))
+# Guarda também o ficheiro original (<sha256 normalizado>_original.<ext>); descartá-lo é opt-in
+IMAGE_KEEP_ORIGINAL = os.environ.get('IMAGE_KEEP_ORIGINAL', 'true').lower() == 'true'
+# Larguras permitidas; pedidos intermédios são arredondados para cima (limita o nº de variantes)
+DERIVATIVE_WIDTHS = (64, 128, 200, 256, 400, 640, 800, 1024, 1280, 1600, 2048)
+
+# Uploads retomáveis: sessões sem atividade expiram e os ficheiros em .tmp são limpos
+UPLOAD_SESSION_HOURS = int(os.environ.get('UPLOAD_SESSION_HOURS', 24))
+UPLOAD_SESSION_SWEEP_SECONDS = int(os.environ.get('UPLOAD_SESSION_SWEEP_SECONDS', 600))
+
+# Upload de vários ficheiros num só pedido, gravados em paralelo
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get('UPLOAD_BATCH_MAX_FILES', 50))
+UPLOAD_BATCH_CONCURRENCY = int(os.environ.get('UPLOAD_BATCH_CONCURRENCY', 4))
+
+# Ficheiros pequenos muito pedidos (fotos das listas) ficam em memória
+HOT_FILE_CACHE_BYTES = int(os.environ.get('HOT_FILE_CACHE_BYTES', 64 * 1024 * 1024))
+HOT_FILE_MAX_SIZE = int(os.environ.get('HOT_FILE_MAX_SIZE', 256 * 1024))
+# Limita quanto tempo outra instância pode servir um ficheiro entretanto apagado
+HOT_FILE_TTL = int(os.environ.get('HOT_FILE_TTL', 300))
+
+# Recolha de uploads que nenhum equipamento/viatura referencia (um lote por intervalo).
+# Apaga ficheiros: desligada até o operador a ativar (ou correr `python server.py upload-gc`)
+UPLOAD_GC_ENABLED = os.environ.get('UPLOAD_GC_ENABLED', 'false').lower() == 'true'
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS', 300))
+UPLOAD_GC_BATCH_SIZE = int(os.environ.get('UPLOAD_GC_BATCH_SIZE', 500))
+# Ficheiros mais recentes que isto nunca são tocados (o formulário pode ainda não ter sido gravado)
+UPLOAD_GC_GRACE_HOURS = int(os.environ.get('UPLOAD_GC_GRACE_HOURS', 24))
+# Tempo em quarentena antes de apagar; se voltar a ser referenciado entretanto é recuperado
+UPLOAD_GC_QUARANTINE_HOURS = int(os.environ.get('UPLOAD_GC_QUARANTINE_HOURS', 72))
+
+# Pré-visualização da 1ª página e texto dos PDFs, gerados em segundo plano
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 1))
+PDF_PREVIEW_WIDTH = int(os.environ.get('PDF_PREVIEW_WIDTH', 800))
+# Texto guardado por documento (um documento Mongo tem no máximo 16MB)
+PDF_TEXT_MAX_CHARS = int(os.environ.get('PDF_TEXT_MAX_CHARS', 200_000))
+# Trabalhos em "processing" há mais tempo que isto (ex.: instância reiniciada) voltam à fila
+PDF_JOB_TIMEOUT_SECONDS = int(os.environ.get('PDF_JOB_TIMEOUT_SECONDS', 600))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -65,9 +186,23 @@ class UserResponse(BaseModel):
     name: str
     email: str
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    content_type: str
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class TokenResponse(BaseModel):
     access_token: str
+    refresh_token: str = ""
     token_type: str = "bearer"
+    expires_in: int = ACCESS_TOKEN_MINUTES * 60
     user: UserResponse
 
 # ==================== EQUIPAMENTO MODEL ====================
@@ -95,6 +230,7 @@ class Equipamento(EquipamentoCreate):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     tipo: str = "Equipamento"
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== VIATURA MODEL ====================
 class ViaturaCreate(BaseModel):
@@ -129,6 +265,7 @@ class Viatura(ViaturaCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== MATERIAL MODEL ====================
 class MaterialCreate(BaseModel):
@@ -143,6 +280,7 @@ class Material(MaterialCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== OBRA MODEL ====================
 class ObraCreate(BaseModel):
@@ -156,6 +294,7 @@ class Obra(ObraCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== MOVIMENTO MODEL ====================
 class MovimentoCreate(BaseModel):
@@ -188,6 +327,7 @@ class Movimento(MovimentoCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== MOVIMENTO STOCK MODEL ====================
 class MovimentoStockCreate(BaseModel):
@@ -204,6 +344,7 @@ class MovimentoStock(MovimentoStockCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     data_hora: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== MOVIMENTO VIATURA MODEL ====================
 class MovimentoViaturaCreate(BaseModel):
@@ -219,6 +360,7 @@ class MovimentoViatura(MovimentoViaturaCreate):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 # ==================== AUTH FUNCTIONS ====================
 def hash_password(password: str) -> str:
@@ -227,20 +369,381 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed.encode())
 
-def create_token(user_id: str) -> str:
+class HashPool:
+    """Pool limitado para bcrypt, fora do event loop, com métricas de fila"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor ocupado, tente novamente",
+                headers={"Retry-After": "1"}
+            )
+        submitted = time.monotonic()
+
+        def job():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                self.running += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            running = self.running
+            completed = self.completed
+            total_wait = self.total_wait
+            max_wait = self.max_wait
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "running": running,
+            "queued": max(self.pending - running, 0),
+            "completed": completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(total_wait / completed * 1000, 2) if completed else 0.0,
+            "max_wait_ms": round(max_wait * 1000, 2)
+        }
+
+hash_pool = HashPool(AUTH_HASH_WORKERS, AUTH_HASH_MAX_PENDING)
+
+def create_token(user: dict) -> str:
+    payload = {
+        "sub": user["id"],
+        "name": user["name"],
+        "email": user["email"],
+        "ver": user.get("token_version", 0),
+        "type": "access",
+        "jti": uuid.uuid4().hex,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def create_refresh_token(user: dict) -> str:
     payload = {
-        "sub": user_id,
-        "exp": datetime.now(timezone.utc) + timedelta(days=7)
+        "sub": user["id"],
+        "ver": user.get("token_version", 0),
+        "type": "refresh",
+        "jti": uuid.uuid4().hex,
+        "exp": datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_DAYS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def issue_tokens(user: dict) -> TokenResponse:
+    return TokenResponse(
+        access_token=create_token(user),
+        refresh_token=create_refresh_token(user),
+        user=UserResponse(id=user["id"], name=user["name"], email=user["email"])
+    )
+
+# ==================== TOKEN REVOCATION ====================
+class RevocationList:
+    """Cópia em memória da coleção revoked_tokens, atualizada incrementalmente"""
+
+    def __init__(self):
+        self._expiry = {}  # jti -> timestamp de expiração do token
+        self._synced_until = None
+        self.syncs = 0
+
+    def __contains__(self, jti):
+        return jti in self._expiry
+
+    def _add_local(self, jti: str, expires_at: datetime):
+        self._expiry[jti] = expires_at.timestamp()
+
+    @staticmethod
+    def _document(payload: dict) -> dict:
+        return {
+            "jti": payload["jti"],
+            "user_id": payload.get("sub"),
+            "expires_at": datetime.fromtimestamp(payload["exp"], tz=timezone.utc),
+            "revoked_at": datetime.now(timezone.utc)
+        }
+
+    async def revoke(self, payload: dict):
+        jti = payload.get("jti")
+        if not jti or jti in self._expiry:
+            return
+        doc = self._document(payload)
+        self._add_local(jti, doc["expires_at"])
+        await db.revoked_tokens.update_one({"jti": jti}, {"$setOnInsert": doc}, upsert=True)
+
+    async def claim(self, payload: dict) -> bool:
+        """Revoga o token e diz se foi este pedido a fazê-lo. O índice único em jti garante
+        um só vencedor, mesmo entre pedidos concorrentes ou em workers diferentes"""
+        jti = payload.get("jti")
+        if not jti or jti in self._expiry:
+            return False
+        doc = self._document(payload)
+        try:
+            await db.revoked_tokens.insert_one(doc)
+            claimed = True
+        except DuplicateKeyError:
+            claimed = False
+        self._add_local(jti, doc["expires_at"])
+        return claimed
+
+    async def sync(self):
+        """Carrega apenas as revogações feitas desde a última sincronização"""
+        query = {}
+        if self._synced_until is not None:
+            # $gte: revogações com o mesmo timestamp não se perdem (o dict elimina repetidos)
+            query["revoked_at"] = {"$gte": self._synced_until}
+        async for doc in db.revoked_tokens.find(query, {"_id": 0, "jti": 1, "expires_at": 1, "revoked_at": 1}):
+            expires_at = doc["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._add_local(doc["jti"], expires_at)
+            revoked_at = doc["revoked_at"]
+            if self._synced_until is None or revoked_at > self._synced_until:
+                self._synced_until = revoked_at
+        self._prune()
+        self.syncs += 1
+
+    def _prune(self):
+        now = time.time()
+        for jti in [j for j, exp in self._expiry.items() if exp < now]:
+            del self._expiry[jti]
+
+    def stats(self):
+        return {"size": len(self._expiry), "syncs": self.syncs}
+
+revocation_list = RevocationList()
+
+# ==================== LOGIN THROTTLING ====================
+class TokenBucketLimiter:
+    """Token bucket por chave, em memória (LRU limitado) ou partilhado via Mongo"""
+
+    def __init__(self, name: str, capacity: int, per_minute: float, backend: str = "memory", maxsize: int = 10000):
+        self.name = name
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.backend = backend
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # chave -> (tokens, instante da última atualização)
+        self.allowed = 0
+        self.rejected = 0
+
+    def _retry_after(self, tokens: float) -> float:
+        return (1 - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def _take_memory(self, key: str, now: float) -> float:
+        tokens, updated = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = self._retry_after(tokens)
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def _take_mongo(self, key: str, now: float) -> float:
+        # Update atómico em pipeline: repõe tokens pelo tempo decorrido e consome um se houver
+        refilled = {"$min": [self.capacity, {"$add": [
+            {"$ifNull": ["$tokens", self.capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, self.rate]}
+        ]}]}
+        doc = await db.login_throttle.find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.capacity / self.rate if self.rate > 0 else 3600)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if doc["allowed"] else self._retry_after(doc["tokens"])
+
+    async def refund(self, key: str):
+        """Devolve uma tentativa consumida (ex.: login bem sucedido)"""
+        if self.backend == "mongo":
+            await db.login_throttle.update_one(
+                {"_id": f"{self.name}:{key}"},
+                [{"$set": {"tokens": {"$min": [self.capacity, {"$add": ["$tokens", 1]}]}}}]
+            )
+        elif key in self._buckets:
+            tokens, updated = self._buckets[key]
+            self._buckets[key] = (min(self.capacity, tokens + 1), updated)
+
+    async def take(self, key: str) -> float:
+        """Consome uma tentativa; devolve 0 se permitido ou os segundos até à próxima"""
+        now = time.time()
+        if self.backend == "mongo":
+            retry_after = await self._take_mongo(key, now)
+        else:
+            retry_after = self._take_memory(key, now)
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "capacity": self.capacity,
+            "per_minute": self.rate * 60,
+            "tracked_keys": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected
+        }
+
+login_ip_limiter = TokenBucketLimiter("ip", LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE, LOGIN_THROTTLE_BACKEND)
+login_email_limiter = TokenBucketLimiter("email", LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE, LOGIN_THROTTLE_BACKEND)
+
+async def check_login_throttle(request: Request, email: str):
+    """Rejeita tentativas abusivas antes de qualquer leitura ao Mongo ou bcrypt"""
+    client_ip = request.client.host if request.client else "unknown"
+    for limiter, key in [(login_ip_limiter, client_ip), (login_email_limiter, email.lower())]:
+        retry_after = await limiter.take(key)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Demasiadas tentativas de login, tente novamente mais tarde",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+async def revocation_sync_loop():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await revocation_list.sync()
+        except Exception as e:
+            logger.error(f"Failed to sync revoked tokens: {str(e)}")
+
+# ==================== USER CACHE ====================
+class TTLCache:
+    """Cache LRU limitado em tamanho, com expiração por entrada (TTL)"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+# Utilizadores autenticados, indexados pelo "sub" do JWT (nunca guarda a password)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# Versão atual dos tokens de cada utilizador (incrementada no logout/mudança de password)
+token_version_cache = TTLCache(USER_CACHE_SIZE, TOKEN_VERSION_TTL)
+
+async def get_token_version(user_id: str) -> Optional[int]:
+    version = token_version_cache.get(user_id)
+    if version is None:
+        doc = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "token_version": 1})
+        if doc is None:
+            return None
+        version = doc.get("token_version", 0)
+        token_version_cache.set(user_id, version)
+    return version
+
+async def bump_token_version(user_id: str):
+    """Revoga todos os tokens emitidos até agora para o utilizador"""
+    await db.users.update_one({"id": user_id}, {"$inc": {"token_version": 1}})
+    token_version_cache.invalidate(user_id)
+    user_cache.invalidate(user_id)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["sub"]}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        user_id = payload["sub"]
+        if payload.get("type") == "refresh":
+            raise HTTPException(status_code=401, detail="Invalid token")
+        if payload.get("jti") in revocation_list:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        if "ver" in payload:
+            # Token com claims próprias: autoriza sem ler o documento do utilizador
+            version = await get_token_version(user_id)
+            if version is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            if payload["ver"] != version:
+                raise HTTPException(status_code=401, detail="Token revoked")
+            return {"id": user_id, "name": payload["name"], "email": payload["email"], "claims": payload}
+        # Tokens antigos (só "sub") continuam válidos até expirarem
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+            if not user:
+                raise HTTPException(status_code=401, detail="User not found")
+            user_cache.set(user_id, user)
+        # Cópia para que alterações num pedido não contaminem o cache
+        return dict(user)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -322,42 +825,404 @@ async def register(data: UserCreate):
         "id": user_id,
         "name": data.name,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_pool.run(hash_password, data.password),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.users.insert_one(user_doc)
+    with unique_violation("Email already registered"):
+        await db.users.insert_one(user_doc)
     
-    token = create_token(user_id)
-    return TokenResponse(access_token=token, user=UserResponse(id=user_id, name=data.name, email=data.email))
+    return issue_tokens(user_doc)
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(data: UserLogin):
+async def login(data: UserLogin, request: Request):
+    await check_login_throttle(request, data.email)
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
-    if not user or not verify_password(data.password, user["password"]):
+    if not user or not await hash_pool.run(verify_password, data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_token(user["id"])
-    return TokenResponse(access_token=token, user=UserResponse(id=user["id"], name=user["name"], email=user["email"]))
+    await login_email_limiter.refund(data.email.lower())
+    return issue_tokens(user)
+
+@api_router.post("/auth/refresh", response_model=TokenResponse)
+async def refresh_tokens(data: RefreshRequest):
+    """Trocar um refresh token válido por um novo par de tokens"""
+    try:
+        payload = jwt.decode(data.refresh_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("jti") in revocation_list:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    user = await db.users.find_one({"id": payload["sub"]}, {"_id": 0, "password": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    if payload.get("ver") != user.get("token_version", 0):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    # Rotação: cada refresh token só pode ser usado uma vez
+    if not await revocation_list.claim(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return issue_tokens(user)
 
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(user=Depends(get_current_user)):
     return UserResponse(id=user["id"], name=user["name"], email=user["email"])
 
+@api_router.post("/auth/logout")
+async def logout(data: Optional[RefreshRequest] = None, user=Depends(get_current_user)):
+    """Termina a sessão atual (revoga o access token e, se enviado, o refresh token)"""
+    if user.get("claims"):
+        await revocation_list.revoke(user["claims"])
+    if data:
+        try:
+            payload = jwt.decode(data.refresh_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            if payload.get("type") == "refresh" and payload.get("sub") == user["id"]:
+                await revocation_list.revoke(payload)
+        except jwt.InvalidTokenError:
+            pass
+    return {"message": "Sessão terminada"}
+
+@api_router.post("/auth/logout-all")
+async def logout_all(user=Depends(get_current_user)):
+    """Termina todas as sessões do utilizador"""
+    await bump_token_version(user["id"])
+    return {"message": "Todas as sessões terminadas"}
+
+@api_router.post("/auth/change-password", response_model=TokenResponse)
+async def change_password(data: PasswordChange, user=Depends(get_current_user)):
+    """Alterar password; os tokens anteriores deixam de ser aceites"""
+    existing = await db.users.find_one({"id": user["id"]}, {"_id": 0})
+    if not existing or not await hash_pool.run(verify_password, data.current_password, existing["password"]):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    hashed = await hash_pool.run(hash_password, data.new_password)
+    await db.users.update_one({"id": user["id"]}, {"$set": {"password": hashed}})
+    await bump_token_version(user["id"])
+    
+    updated = await db.users.find_one({"id": user["id"]}, {"_id": 0, "password": 0})
+    return issue_tokens(updated)
+
+# ==================== UPLOAD STORAGE ====================
+# Todos os backends guardam por chave (o nome do ficheiro) e expõem a mesma interface async:
+# put_file, exists, stat, iter_range, delete, local_copy e local_path.
+
+class LocalStorage:
+    """Ficheiros num diretório local; FileResponse serve-os diretamente do disco"""
+    name = "local"
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.directory / key
+
+    async def put_file(self, key: str, src: Path, content_type: str):
+        """Move src (já completo) para a chave; src deixa de existir"""
+        await asyncio.to_thread(os.replace, src, self.directory / key)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread((self.directory / key).is_file)
+
+    async def stat(self, key: str) -> Optional[dict]:
+        try:
+            st = await asyncio.to_thread(os.stat, self.directory / key)
+        except FileNotFoundError:
+            return None
+        return {"size": st.st_size, "mtime": st.st_mtime, "mtime_ns": st.st_mtime_ns}
+
+    def iter_range(self, key: str, start: int, end: int):
+        return iter_file_range(self.directory / key, start, end)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread((self.directory / key).unlink, missing_ok=True)
+
+    def _list_keys(self, start_after: str, limit: int):
+        entries = heapq.nsmallest(limit, (
+            entry for entry in os.scandir(self.directory)
+            if entry.name > start_after and not entry.name.startswith(".") and entry.is_file()
+        ), key=lambda entry: entry.name)
+        return [(entry.name, entry.stat().st_mtime) for entry in entries]
+
+    async def list_keys(self, start_after: str = "", limit: int = 1000) -> list:
+        """(chave, mtime) por ordem de chave, a seguir a start_after"""
+        return await asyncio.to_thread(self._list_keys, start_after, limit)
+
+    @asynccontextmanager
+    async def local_copy(self, key: str):
+        yield self.directory / key
+
+class RemoteStorage:
+    """Base dos backends remotos: sem caminho local, cópias temporárias para o Pillow"""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return None
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    @asynccontextmanager
+    async def local_copy(self, key: str):
+        tmp_path = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.src"
+        try:
+            await self.download(key, tmp_path)
+            yield tmp_path
+        finally:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+
+    async def download(self, key: str, dst: Path):
+        info = await self.stat(key)
+        if info is None:
+            raise FileNotFoundError(key)
+        async with await anyio.open_file(dst, mode="wb") as f:
+            async for chunk in self.iter_range(key, 0, info["size"] - 1):
+                await f.write(chunk)
+
+class S3Storage(RemoteStorage):
+    """Bucket S3 ou compatível (MinIO via S3_ENDPOINT_URL); o boto3 é síncrono e corre em threads"""
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = "", region: str = ""):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.exceptions import ClientError
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE
+        )
+        self.client_error = ClientError
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def put_file(self, key: str, src: Path, content_type: str):
+        # upload_file passa a multipart acima de S3_MULTIPART_THRESHOLD (PDFs grandes)
+        await asyncio.to_thread(
+            self.client.upload_file, str(src), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type, "CacheControl": UPLOAD_CACHE_CONTROL},
+            Config=self.transfer_config
+        )
+        await asyncio.to_thread(src.unlink, missing_ok=True)
+
+    async def stat(self, key: str) -> Optional[dict]:
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except self.client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        mtime = head["LastModified"].timestamp()
+        return {"size": head["ContentLength"], "mtime": mtime, "mtime_ns": int(mtime * 1_000_000_000)}
+
+    async def iter_range(self, key: str, start: int, end: int):
+        if end < start:
+            return
+        obj = await asyncio.to_thread(
+            self.client.get_object, Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{end}"
+        )
+        body = obj["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def download(self, key: str, dst: Path):
+        await asyncio.to_thread(
+            self.client.download_file, self.bucket, self._key(key), str(dst), Config=self.transfer_config
+        )
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+    async def list_keys(self, start_after: str = "", limit: int = 1000) -> list:
+        response = await asyncio.to_thread(
+            self.client.list_objects_v2, Bucket=self.bucket, Prefix=self.prefix,
+            StartAfter=self._key(start_after), MaxKeys=limit
+        )
+        return [
+            (obj["Key"][len(self.prefix):], obj["LastModified"].timestamp())
+            for obj in response.get("Contents", [])
+        ]
+
+class GridFSStorage(RemoteStorage):
+    """GridFS na base de dados da aplicação; a chave é o filename (a revisão mais recente ganha)"""
+    name = "gridfs"
+
+    def __init__(self, database, bucket_name: str):
+        self.fs = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+        self.files = database[f"{bucket_name}.files"]
+
+    async def _find(self, key: str) -> Optional[dict]:
+        return await self.files.find_one({"filename": key}, sort=[("uploadDate", -1)])
+
+    async def put_file(self, key: str, src: Path, content_type: str):
+        grid_in = self.fs.open_upload_stream(key, metadata={"contentType": content_type})
+        try:
+            async with await anyio.open_file(src, mode="rb") as f:
+                while True:
+                    chunk = await f.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await grid_in.write(chunk)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await asyncio.to_thread(src.unlink, missing_ok=True)
+
+    async def stat(self, key: str) -> Optional[dict]:
+        doc = await self._find(key)
+        if doc is None:
+            return None
+        uploaded = doc["uploadDate"]
+        if uploaded.tzinfo is None:
+            uploaded = uploaded.replace(tzinfo=timezone.utc)
+        mtime = uploaded.timestamp()
+        return {"size": doc["length"], "mtime": mtime, "mtime_ns": int(mtime * 1_000_000_000)}
+
+    async def iter_range(self, key: str, start: int, end: int):
+        if end < start:
+            return
+        doc = await self._find(key)
+        if doc is None:
+            return
+        grid_out = await self.fs.open_download_stream(doc["_id"])
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, key: str):
+        async for doc in self.files.find({"filename": key}, {"_id": 1}):
+            await self.fs.delete(doc["_id"])
+
+    async def list_keys(self, start_after: str = "", limit: int = 1000) -> list:
+        # Revisões do mesmo filename aparecem repetidas; quem chama tolera duplicados
+        cursor = self.files.find({"filename": {"$gt": start_after}}, {"filename": 1, "uploadDate": 1})
+        keys = []
+        async for doc in cursor.sort("filename", 1).limit(limit):
+            uploaded = doc["uploadDate"]
+            if uploaded.tzinfo is None:
+                uploaded = uploaded.replace(tzinfo=timezone.utc)
+            keys.append((doc["filename"], uploaded.timestamp()))
+        return keys
+
+def create_upload_storage():
+    if UPLOAD_STORAGE == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("UPLOAD_STORAGE=s3 requer S3_BUCKET")
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    if UPLOAD_STORAGE == "gridfs":
+        return GridFSStorage(db, GRIDFS_BUCKET)
+    if UPLOAD_STORAGE != "local":
+        raise RuntimeError(f"UPLOAD_STORAGE inválido: {UPLOAD_STORAGE}")
+    return LocalStorage(UPLOAD_DIR)
+
 # ==================== UPLOAD ROUTES ====================
+def write_and_hash(f, hasher, chunk: bytes):
+    hasher.update(chunk)
+    f.write(chunk)
+
+async def save_upload_stream(file: UploadFile, max_size: int, too_large_detail: str):
+    """Grava o upload por blocos num ficheiro temporário, calculando o SHA-256 pelo caminho.
+    Devolve (caminho temporário, sha256, tamanho); quem chama move ou apaga o temporário.
+    O max_size limita a memória e o que se copia para uploads, não a transferência: o Starlette
+    já recebeu todo o multipart (em spool) antes do handler correr. O limite de rede fica no
+    proxy (client_max_body_size)."""
+    tmp_path = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.part"
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=400, detail=too_large_detail)
+            await asyncio.to_thread(write_and_hash, f, hasher, chunk)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        raise
+    return tmp_path, hasher.hexdigest(), size
+
+async def commit_upload(tmp_path: Path, sha256: str, size: int, ext: str, content_type: str) -> dict:
+    """Guarda o conteúdo pelo hash: uploads repetidos reutilizam o ficheiro existente"""
+    existing = await db.uploads.find_one({"_id": sha256}, {"filename": 1})
+    filename = existing["filename"] if existing else f"{sha256}.{ext}"
+    created = False
+    try:
+        if await upload_storage.exists(filename):
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        else:
+            await upload_storage.put_file(filename, tmp_path, content_type)
+            created = True
+    except BaseException:
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+        raise
+    
+    update = {
+        "$setOnInsert": {
+            "filename": filename,
+            "size": size,
+            "content_type": content_type,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        },
+        # Conta uploads deste conteúdo, não referências: não desce quando um documento deixa de o usar
+        "$inc": {"upload_count": 1},
+        "$set": {"last_uploaded_at": datetime.now(timezone.utc).isoformat()}
+    }
+    try:
+        doc = await db.uploads.find_one_and_update(
+            {"_id": sha256}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Dois upserts simultâneos do mesmo conteúdo: o outro inseriu primeiro, agora é só um update
+        doc = await db.uploads.find_one_and_update(
+            {"_id": sha256}, update, return_document=ReturnDocument.AFTER
+        )
+    if doc["filename"] != filename:
+        # Upload simultâneo do mesmo conteúdo com outra extensão: fica o primeiro registado
+        if created:
+            await upload_storage.delete(filename)
+            hot_file_cache.invalidate(filename)
+        filename = doc["filename"]
+    return {"filename": filename, "sha256": sha256, "size": size, "deduplicated": doc["upload_count"] > 1}
+
+def upload_extension(filename: str, default: str) -> str:
+    ext = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    return ext if ext.isalnum() and len(ext) <= 5 else default
+
 @api_router.post("/upload")
 async def upload_file(file: UploadFile = File(...), user=Depends(get_current_user)):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Only image files are allowed")
     
-    ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    filename = f"{uuid.uuid4()}.{ext}"
-    filepath = UPLOAD_DIR / filename
+    ext = upload_extension(file.filename, "jpg")
+    tmp_path, sha256, size = await save_upload_stream(file, MAX_IMAGE_SIZE, "Ficheiro demasiado grande")
+    tmp_path, sha256, size, ext, content_type = await normalize_upload(tmp_path, sha256, size, ext, file.content_type)
+    stored = await commit_upload(tmp_path, sha256, size, ext, content_type)
+    filename = stored["filename"]
     
-    content = await file.read()
-    with open(filepath, "wb") as f:
-        f.write(content)
-    
-    return {"url": f"/api/uploads/{filename}", "filename": filename}
+    return {"url": f"/api/uploads/{filename}", "filename": filename,
+            "sha256": sha256, "deduplicated": stored["deduplicated"]}
 
 @api_router.post("/upload/pdf")
 async def upload_pdf(file: UploadFile = File(...), user=Depends(get_current_user)):
@@ -365,62 +1230,1986 @@ async def upload_pdf(file: UploadFile = File(...), user=Depends(get_current_user
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Apenas ficheiros PDF são permitidos")
     
-    # Max 10MB
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="Ficheiro demasiado grande (máx. 10MB)")
+    # Max 10MB, verificado durante a cópia do spool
+    tmp_path, sha256, size = await save_upload_stream(file, MAX_PDF_SIZE, "Ficheiro demasiado grande (máx. 10MB)")
+    stored = await commit_upload(tmp_path, sha256, size, "pdf", file.content_type)
+    filename = stored["filename"]
+    # Idempotente: um duplicado já processado (ou em curso) é ignorado pelo pipeline
+    pdf_pipeline.submit(sha256)
     
-    filename = f"{uuid.uuid4()}.pdf"
-    filepath = UPLOAD_DIR / filename
+    return {"url": f"/api/uploads/{filename}", "filename": filename, "original_name": file.filename,
+            "sha256": sha256, "deduplicated": stored["deduplicated"],
+            "preview_url": f"/api/uploads/{filename}/preview"}
+
+# ==================== IMAGE NORMALIZATION ====================
+NORMALIZABLE_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+def normalize_image(src: str, dst: str, max_dimension: int, pil_format: str, quality: int) -> str:
+    """Corre no process pool: aplica a orientação EXIF, limita a maior dimensão e recodifica sem
+    EXIF/XMP (mantém só o perfil de cor). Imagens com transparência vão para WEBP. Devolve o formato."""
+    with Image.open(src) as img:
+        icc_profile = img.info.get("icc_profile")
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if pil_format == "JPEG" and has_alpha:
+            pil_format = "WEBP"
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode == "P":
+            img = img.convert("RGBA")
+        tmp = f"{dst}.{os.getpid()}.part"
+        options = {"icc_profile": icc_profile} if icc_profile else {}
+        img.save(tmp, format=pil_format, quality=quality, **options)
+    os.replace(tmp, dst)
+    return pil_format
+
+async def normalize_upload(tmp_path: Path, sha256: str, size: int, ext: str, content_type: str):
+    """Normaliza uma foto acabada de receber; devolve (caminho, sha256, tamanho, ext, content-type)
+    do ficheiro a guardar. Ficheiros que o Pillow não lê ficam como vieram."""
+    if not IMAGE_NORMALIZE or content_type not in NORMALIZABLE_TYPES:
+        return tmp_path, sha256, size, ext, content_type
+    out_path = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.norm"
+    target = DERIVATIVE_FORMATS[IMAGE_NORMALIZE_FORMAT][0]
+    try:
+        pil_format = await image_pool.run(
+            normalize_image, str(tmp_path), str(out_path), IMAGE_MAX_DIMENSION, target, IMAGE_INGEST_QUALITY
+        )
+    except Exception as e:
+        await asyncio.to_thread(out_path.unlink, missing_ok=True)
+        logger.warning(f"Image normalization skipped: {str(e)}")
+        return tmp_path, sha256, size, ext, content_type
     
-    with open(filepath, "wb") as f:
-        f.write(content)
+    _, new_ext, new_type = DERIVATIVE_FORMATS[pil_format.lower()]
+    new_sha256 = await asyncio.to_thread(hash_file, out_path)
+    new_size = (await asyncio.to_thread(os.stat, out_path)).st_size
+    if IMAGE_KEEP_ORIGINAL:
+        await upload_storage.put_file(f"{new_sha256}_original.{ext}", tmp_path, content_type)
+    else:
+        await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+    return out_path, new_sha256, new_size, new_ext, new_type
+
+# ==================== RESUMABLE UPLOADS ====================
+# Protocolo: POST /upload/sessions cria a sessão, PUT /upload/sessions/{id}?offset=N envia
+# bytes a partir de N, GET devolve o offset atual (para retomar) e POST .../complete finaliza.
+# Os bytes ficam num ficheiro em UPLOAD_TMP_DIR da instância que os recebeu.
+
+def upload_session_path(session_id: str) -> Path:
+    return UPLOAD_TMP_DIR / f"{session_id}.session"
+
+def upload_session_expiry() -> str:
+    return (datetime.now(timezone.utc) + timedelta(hours=UPLOAD_SESSION_HOURS)).isoformat()
+
+def upload_store_extension(content_type: str, filename: str) -> str:
+    return "pdf" if content_type == "application/pdf" else upload_extension(filename, "jpg")
+
+def upload_result(stored: dict, original_name: str, content_type: str) -> dict:
+    """Resposta comum aos uploads; PDFs entram na fila de pré-visualização"""
+    filename = stored["filename"]
+    result = {"url": f"/api/uploads/{filename}", "filename": filename, "original_name": original_name,
+              "sha256": stored["sha256"], "deduplicated": stored["deduplicated"]}
+    if content_type == "application/pdf":
+        pdf_pipeline.submit(stored["sha256"])
+        result["preview_url"] = f"/api/uploads/{filename}/preview"
+    return result
+
+def upload_limits(content_type: str):
+    if content_type == "application/pdf":
+        return MAX_PDF_SIZE, "Ficheiro demasiado grande (máx. 10MB)"
+    if content_type.startswith("image/"):
+        return MAX_IMAGE_SIZE, "Ficheiro demasiado grande"
+    raise HTTPException(status_code=400, detail="Apenas imagens ou ficheiros PDF são permitidos")
+
+async def get_upload_session(session_id: str, user: dict) -> dict:
+    session = await db.upload_sessions.find_one({"_id": session_id, "user_id": user["id"]})
+    if not session or session["expires_at"] < datetime.now(timezone.utc).isoformat():
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada ou expirada")
+    # O offset nunca passa do que está mesmo em disco (ex.: escrita perdida num crash)
+    try:
+        on_disk = (await asyncio.to_thread(os.stat, upload_session_path(session_id))).st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada ou expirada")
+    session["offset"] = min(session["offset"], on_disk)
+    return session
+
+def upload_session_response(session: dict) -> dict:
+    return {
+        "id": session["_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "offset": session["offset"],
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "expires_at": session["expires_at"]
+    }
+
+active_upload_sessions = set()
+
+@api_router.post("/upload/sessions")
+async def create_upload_session(data: UploadSessionCreate, user=Depends(get_current_user)):
+    max_size, too_large_detail = upload_limits(data.content_type)
+    if data.size > max_size:
+        raise HTTPException(status_code=400, detail=too_large_detail)
+    session = {
+        "_id": str(uuid.uuid4()),
+        "user_id": user["id"],
+        "filename": data.filename,
+        "size": data.size,
+        "content_type": data.content_type,
+        "offset": 0,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "expires_at": upload_session_expiry()
+    }
+    await asyncio.to_thread(upload_session_path(session["_id"]).touch)
+    await db.upload_sessions.insert_one(session)
+    return upload_session_response(session)
+
+@api_router.get("/upload/sessions/{session_id}")
+async def get_upload_session_status(session_id: str, user=Depends(get_current_user)):
+    """Offset atual, para o cliente retomar depois de uma falha de rede"""
+    return upload_session_response(await get_upload_session(session_id, user))
+
+def write_session_bytes(path: Path, offset: int, data: bytes, truncate: bool):
+    with open(path, "r+b") as f:
+        if truncate:
+            f.truncate(offset)  # Descarta restos de uma escrita anterior interrompida
+        f.seek(offset)
+        f.write(data)
+
+@api_router.put("/upload/sessions/{session_id}")
+async def put_upload_chunk(session_id: str, request: Request, offset: int = Query(..., ge=0),
+                           user=Depends(get_current_user)):
+    """Escreve o corpo do pedido a partir de offset; bytes recebidos antes de uma queda ficam gravados"""
+    session = await get_upload_session(session_id, user)
+    if offset != session["offset"]:
+        raise HTTPException(status_code=409, detail=f"Offset esperado: {session['offset']}")
+    if session_id in active_upload_sessions:
+        raise HTTPException(status_code=409, detail="Já existe um envio em curso para esta sessão")
     
-    return {"url": f"/api/uploads/{filename}", "filename": filename, "original_name": file.filename}
+    active_upload_sessions.add(session_id)
+    path = upload_session_path(session_id)
+    written = 0
+    buffer = bytearray()
+    try:
+        try:
+            async for chunk in request.stream():
+                if offset + written + len(buffer) + len(chunk) > session["size"]:
+                    raise HTTPException(status_code=400, detail="Dados para além do tamanho declarado")
+                buffer.extend(chunk)
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await asyncio.to_thread(write_session_bytes, path, offset + written, bytes(buffer), written == 0)
+                    written += len(buffer)
+                    buffer.clear()
+        except ClientDisconnect:
+            pass  # Guarda o que chegou; o cliente retoma a partir do novo offset
+        if buffer:
+            await asyncio.to_thread(write_session_bytes, path, offset + written, bytes(buffer), written == 0)
+            written += len(buffer)
+    finally:
+        if written:
+            await db.upload_sessions.update_one(
+                {"_id": session_id},
+                {"$set": {"offset": offset + written, "expires_at": upload_session_expiry()}}
+            )
+        active_upload_sessions.discard(session_id)
+    return {"id": session_id, "offset": offset + written, "size": session["size"]}
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+@api_router.post("/upload/sessions/{session_id}/complete")
+async def complete_upload_session(session_id: str, user=Depends(get_current_user)):
+    session = await get_upload_session(session_id, user)
+    if session["offset"] != session["size"]:
+        raise HTTPException(status_code=409, detail=f"Upload incompleto: {session['offset']} de {session['size']} bytes")
+    if session_id in active_upload_sessions:
+        raise HTTPException(status_code=409, detail="Já existe um envio em curso para esta sessão")
+    # Só um pedido finaliza: os restantes deixam de encontrar a sessão
+    claimed = await db.upload_sessions.find_one_and_delete({"_id": session_id, "user_id": user["id"]})
+    if claimed is None:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada ou expirada")
+    
+    path = upload_session_path(session_id)
+    await asyncio.to_thread(os.truncate, path, session["size"])
+    sha256 = await asyncio.to_thread(hash_file, path)
+    ext = upload_store_extension(session["content_type"], session["filename"])
+    path, sha256, size, ext, content_type = await normalize_upload(
+        path, sha256, session["size"], ext, session["content_type"]
+    )
+    stored = await commit_upload(path, sha256, size, ext, content_type)
+    return upload_result(stored, session["filename"], content_type)
+
+@api_router.delete("/upload/sessions/{session_id}")
+async def cancel_upload_session(session_id: str, user=Depends(get_current_user)):
+    result = await db.upload_sessions.delete_one({"_id": session_id, "user_id": user["id"]})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada ou expirada")
+    await asyncio.to_thread(upload_session_path(session_id).unlink, missing_ok=True)
+    return {"message": "Sessão cancelada"}
+
+def remove_stale_tmp_files(max_age_seconds: float) -> int:
+    """Apaga de UPLOAD_TMP_DIR o que não é tocado há max_age_seconds (sessões abandonadas, restos de crashes)"""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for entry in os.scandir(UPLOAD_TMP_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            Path(entry.path).unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+async def expire_upload_sessions() -> int:
+    now = datetime.now(timezone.utc).isoformat()
+    expired = 0
+    async for session in db.upload_sessions.find({"expires_at": {"$lt": now}}, {"_id": 1}):
+        await asyncio.to_thread(upload_session_path(session["_id"]).unlink, missing_ok=True)
+        await db.upload_sessions.delete_one({"_id": session["_id"], "expires_at": {"$lt": now}})
+        expired += 1
+    # Cada escrita renova o mtime, por isso um ficheiro parado há mais que a validade é lixo
+    await asyncio.to_thread(remove_stale_tmp_files, UPLOAD_SESSION_HOURS * 3600)
+    return expired
+
+async def upload_session_loop():
+    while True:
+        await asyncio.sleep(UPLOAD_SESSION_SWEEP_SECONDS)
+        try:
+            await expire_upload_sessions()
+        except Exception as e:
+            logger.error(f"Failed to expire upload sessions: {str(e)}")
+
+# ==================== BATCH UPLOAD ====================
+async def store_batch_file(file: UploadFile, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        try:
+            content_type = file.content_type or ""
+            max_size, too_large_detail = upload_limits(content_type)
+            tmp_path, sha256, size = await save_upload_stream(file, max_size, too_large_detail)
+            ext = upload_store_extension(content_type, file.filename)
+            tmp_path, sha256, size, ext, content_type = await normalize_upload(tmp_path, sha256, size, ext, content_type)
+            stored = await commit_upload(tmp_path, sha256, size, ext, content_type)
+        except HTTPException as e:
+            return {"original_name": file.filename, "ok": False, "error": e.detail}
+        except Exception as e:
+            logger.error(f"Batch upload failed for {file.filename}: {str(e)}")
+            return {"original_name": file.filename, "ok": False, "error": "Erro ao guardar o ficheiro"}
+        return {"ok": True, **upload_result(stored, file.filename, content_type)}
+
+@api_router.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...), user=Depends(get_current_user)):
+    """Vários ficheiros (imagens e PDFs) num pedido; cada um é validado e gravado à parte,
+    com até UPLOAD_BATCH_CONCURRENCY em simultâneo. Falhas individuais não anulam os restantes."""
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {UPLOAD_BATCH_MAX_FILES} ficheiros por pedido")
+    semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+    results = await asyncio.gather(*(store_batch_file(file, semaphore) for file in files))
+    return {
+        "results": results,
+        "uploaded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"])
+    }
+
+UPLOAD_CONTENT_TYPES = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png",
+    "gif": "image/gif", "webp": "image/webp", "pdf": "application/pdf"
+}
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(range_header: str, size: int):
+    """Devolve (início, fim) de um pedido Range de intervalo único, None se não aplicável"""
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None  # Formato não suportado (ex.: múltiplos intervalos): envia o ficheiro inteiro
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def iter_file_range(path: Path, start: int, end: int):
+    async with await anyio.open_file(path, mode="rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+# ==================== WORKER POOLS ====================
+class WorkerPool:
+    """ProcessPoolExecutor criado no primeiro uso. Usa spawn: os workers não herdam o socket
+    nem o estado do servidor (com fork herdariam). Se um worker morrer (ex.: falta de memória),
+    o pedido falha e o seguinte cria um pool novo."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Redimensionamento a pedido e normalização à entrada partilham os workers de imagem
+image_pool = WorkerPool(IMAGE_WORKERS)
+
+# ==================== IMAGE DERIVATIVES ====================
+# formato pedido -> (formato Pillow, extensão, content-type)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "jpg": ("JPEG", "jpg", "image/jpeg"),
+    "png": ("PNG", "png", "image/png")
+}
+RESIZABLE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+
+def render_image_derivative(src: str, dst: str, width: int, pil_format: str, quality: int) -> int:
+    """Corre no process pool: redimensiona (sem ampliar) e grava atomicamente em dst"""
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if width < img.width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode == "P":
+            img = img.convert("RGBA")
+        tmp = f"{dst}.{os.getpid()}.part"
+        img.save(tmp, format=pil_format, quality=quality)
+    os.replace(tmp, dst)
+    return os.path.getsize(dst)
+
+class DerivativeCache:
+    """Cache em disco das versões redimensionadas, limitado em bytes com remoção LRU"""
+
+    def __init__(self, directory: Path, max_bytes: int, pool: WorkerPool):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pool = pool
+        self._entries = OrderedDict()  # nome -> tamanho, do menos para o mais recente
+        self._inflight = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self):
+        """Reconstrói o índice a partir do disco; após reinício a ordem é a de geração (mtime)"""
+        files = []
+        for path in self.directory.iterdir():
+            if path.is_file() and not path.name.endswith(".part"):
+                st = path.stat()
+                files.append((st.st_mtime, path.name, st.st_size))
+        self._entries.clear()
+        self.total_bytes = 0
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+
+    async def get(self, key: str, width: int, fmt: str, storage) -> Path:
+        """Devolve o caminho local da variante, gerando-a a partir do original em storage se preciso"""
+        pil_format, ext, _ = DERIVATIVE_FORMATS[fmt]
+        name = f"{Path(key).stem}_w{width}.{ext}"
+        path = self.directory / name
+        if name in self._entries:
+            if await asyncio.to_thread(path.is_file):
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return path
+            self.total_bytes -= self._entries.pop(name)
+        self.misses += 1
+        future = self._inflight.get(name)
+        if future is None:
+            # Pedidos simultâneos da mesma variante partilham a mesma geração
+            future = asyncio.ensure_future(self._render(key, storage, path, width, pil_format))
+            self._inflight[name] = future
+            future.add_done_callback(lambda _: self._inflight.pop(name, None))
+        await asyncio.shield(future)
+        return path
+
+    async def _render(self, key: str, storage, path: Path, width: int, pil_format: str):
+        async with storage.local_copy(key) as src:
+            size = await self.pool.run(
+                render_image_derivative, str(src), str(path), width, pil_format, IMAGE_QUALITY
+            )
+        self._entries[path.name] = size
+        self.total_bytes += size
+        await self._evict()
+
+    async def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            await asyncio.to_thread((self.directory / name).unlink, missing_ok=True)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "files": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+upload_storage = create_upload_storage()
+derivative_cache = DerivativeCache(DERIVATIVE_DIR, DERIVATIVE_CACHE_MAX_BYTES, image_pool)
+
+def snap_width(width: int) -> int:
+    for allowed in DERIVATIVE_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return DERIVATIVE_WIDTHS[-1]
+
+class HotFileCache:
+    """Conteúdo de ficheiros pequenos em memória: LRU limitado em bytes, com TTL por entrada.
+    Cada entrada guarda o corpo e os cabeçalhos já calculados (ETag, Last-Modified)."""
+
+    def __init__(self, max_bytes: int, max_file_size: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # chave -> (expira_em, entrada)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict):
+        if len(value["body"]) > self.max_file_size:
+            return
+        self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self.total_bytes += len(value["body"])
+        while self.total_bytes > self.max_bytes and self._data:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1]["body"])
+
+    def invalidate(self, key: str):
+        """Remove o ficheiro e as suas variantes redimensionadas (chaves "<key>?...")"""
+        self._remove(key)
+        prefix = f"{key}?"
+        for cached in [k for k in self._data if k.startswith(prefix)]:
+            self._remove(cached)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "files": len(self._data),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_file_size": self.max_file_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+hot_file_cache = HotFileCache(HOT_FILE_CACHE_BYTES, HOT_FILE_MAX_SIZE, HOT_FILE_TTL)
+
+async def read_upload_body(filepath: Optional[Path], key: str, size: int) -> bytes:
+    if filepath is not None:
+        return await asyncio.to_thread(filepath.read_bytes)
+    return b"".join([chunk async for chunk in upload_storage.iter_range(key, 0, size - 1)])
+
+def upload_headers(etag: str, mtime: float) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": UPLOAD_CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+
+def requested_range(request: Request, etag: str, size: int):
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        return parse_range(range_header, size)
+    return None
+
+def serve_hot_file(request: Request, hot: dict) -> Response:
+    headers = upload_headers(hot["etag"], hot["mtime"])
+    if not_modified(request, hot["etag"], hot["mtime"]):
+        return Response(status_code=304, headers=headers)
+    body = hot["body"]
+    byte_range = requested_range(request, hot["etag"], len(body))
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(body[start:end + 1], status_code=206, media_type=hot["media_type"], headers=headers)
+    return Response(body, media_type=hot["media_type"], headers=headers)
 
 @api_router.get("/uploads/{filename}")
-async def get_upload(filename: str):
-    filepath = UPLOAD_DIR / filename
-    if not filepath.exists():
+async def get_upload(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1),
+    fmt: Optional[str] = None
+):
+    if Path(filename).name != filename or filename.startswith("."):
         raise HTTPException(status_code=404, detail="File not found")
-    
+    filepath = upload_storage.local_path(filename)
     ext = filename.split(".")[-1].lower()
-    content_types = {
-        "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", 
-        "gif": "image/gif", "webp": "image/webp", "pdf": "application/pdf"
-    }
+    media_type = UPLOAD_CONTENT_TYPES.get(ext, "application/octet-stream")
+    
+    cache_key = filename
+    if w or fmt:
+        if ext not in RESIZABLE_EXTENSIONS:
+            raise HTTPException(status_code=400, detail="Redimensionamento só disponível para imagens")
+        fmt = (fmt or ("jpeg" if ext == "jpg" else ext)).lower()
+        if fmt == "gif":
+            fmt = "png"
+        if fmt not in DERIVATIVE_FORMATS:
+            raise HTTPException(status_code=400, detail="Formato inválido (webp, jpeg, png)")
+        width = snap_width(w or DERIVATIVE_WIDTHS[-1])
+        cache_key = f"{filename}?w={width}&fmt={fmt}"
+    
+    # Ficheiros pequenos e muito pedidos não chegam ao disco nem ao storage
+    hot = hot_file_cache.get(cache_key)
+    if hot is not None:
+        return serve_hot_file(request, hot)
+    
+    if cache_key != filename:
+        if not await upload_storage.exists(filename):
+            raise HTTPException(status_code=404, detail="File not found")
+        try:
+            filepath = await derivative_cache.get(filename, width, fmt, upload_storage)
+        except (OSError, Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logger.error(f"Failed to resize {filename}: {str(e)}")
+            raise HTTPException(status_code=400, detail="Imagem inválida")
+        media_type = DERIVATIVE_FORMATS[fmt][2]
+    
+    stat_result = None
+    if filepath is not None:
+        try:
+            stat_result = await asyncio.to_thread(os.stat, filepath)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        info = {"size": stat_result.st_size, "mtime": stat_result.st_mtime, "mtime_ns": stat_result.st_mtime_ns}
+    else:
+        info = await upload_storage.stat(filename)
+        if info is None:
+            raise HTTPException(status_code=404, detail="File not found")
+    
+    size = info["size"]
+    etag = f'"{size:x}-{info["mtime_ns"]:x}"'
+    
+    if size <= hot_file_cache.max_file_size:
+        try:
+            body = await read_upload_body(filepath, filename, size)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        hot = {"body": body, "etag": etag, "mtime": info["mtime"], "media_type": media_type}
+        hot_file_cache.set(cache_key, hot)
+        return serve_hot_file(request, hot)
     
-    with open(filepath, "rb") as f:
-        content = f.read()
+    headers = upload_headers(etag, info["mtime"])
+    if not_modified(request, etag, info["mtime"]):
+        return Response(status_code=304, headers=headers)
     
-    return Response(content=content, media_type=content_types.get(ext, "application/octet-stream"))
+    byte_range = requested_range(request, etag, size)
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        body = (iter_file_range(filepath, start, end) if filepath is not None
+                else upload_storage.iter_range(filename, start, end))
+        return StreamingResponse(body, status_code=206, media_type=media_type, headers=headers)
+    
+    if filepath is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(upload_storage.iter_range(filename, 0, size - 1),
+                                 media_type=media_type, headers=headers)
+    # FileResponse usa http.response.pathsend (zero-copy) quando o servidor o suporta
+    return FileResponse(filepath, media_type=media_type, headers=headers, stat_result=stat_result)
+
+# ==================== PDF PROCESSING ====================
+def process_pdf(src: str, preview_dst: str, width: int, quality: int, max_chars: int) -> dict:
+    """Corre no process pool: pré-visualização WEBP da 1ª página e texto de todas as páginas"""
+    pdf = pdfium.PdfDocument(src)
+    try:
+        page_count = len(pdf)
+        if page_count == 0:
+            raise ValueError("PDF sem páginas")
+        first = pdf[0]
+        img = first.render(scale=width / first.get_width()).to_pil()
+        first.close()
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        tmp = f"{preview_dst}.{os.getpid()}.part"
+        img.save(tmp, format="WEBP", quality=quality)
+        os.replace(tmp, preview_dst)
+        
+        parts = []
+        length = 0
+        for index in range(page_count):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            page.close()
+            parts.append(text)
+            length += len(text)
+            if length >= max_chars:
+                break
+        return {"pages": page_count, "text": "\n".join(parts)[:max_chars]}
+    finally:
+        pdf.close()
+
+def pdf_job_filter(sha256: Optional[str] = None) -> dict:
+    """PDFs por processar: sem estado, pendentes, ou presos em "processing" além do timeout"""
+    stale = (datetime.now(timezone.utc) - timedelta(seconds=PDF_JOB_TIMEOUT_SECONDS)).isoformat()
+    query = {
+        "content_type": "application/pdf",
+        "$or": [
+            {"pdf.status": {"$in": [None, "pending"]}},
+            {"pdf.status": "processing", "pdf.claimed_at": {"$lt": stale}}
+        ]
+    }
+    if sha256:
+        query["_id"] = sha256
+    return query
+
+class PdfPipeline:
+    """Fila de PDFs a processar por workers em background; o estado fica em db.uploads.pdf,
+    por isso sobrevive a reinícios e várias instâncias não processam o mesmo ficheiro"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pool = WorkerPool(workers)
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self.processed = 0
+        self.failed = 0
+
+    def submit(self, sha256: str):
+        self._queue.put_nowait(sha256)
+
+    async def start(self):
+        if pdfium is None:
+            logger.warning("pypdfium2 not installed: PDF previews disabled")
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Retoma o que ficou por fazer (uploads durante um reinício, instâncias que morreram)
+        async for doc in db.uploads.find(pdf_job_filter(), {"_id": 1}):
+            self.submit(doc["_id"])
+
+    async def _worker(self):
+        while True:
+            sha256 = await self._queue.get()
+            try:
+                await self._process(sha256)
+            except Exception as e:
+                logger.error(f"PDF pipeline error for {sha256}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, sha256: str):
+        doc = await db.uploads.find_one_and_update(
+            pdf_job_filter(sha256),
+            {"$set": {"pdf.status": "processing", "pdf.claimed_at": datetime.now(timezone.utc).isoformat()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return  # Já processado ou reclamado por outra instância
+        preview_key = f"{Path(doc['filename']).stem}_preview.webp"
+        preview_tmp = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.webp"
+        try:
+            async with upload_storage.local_copy(doc["filename"]) as src:
+                result = await self.pool.run(
+                    process_pdf, str(src), str(preview_tmp), PDF_PREVIEW_WIDTH, IMAGE_QUALITY, PDF_TEXT_MAX_CHARS
+                )
+            await upload_storage.put_file(preview_key, preview_tmp, "image/webp")
+            hot_file_cache.invalidate(preview_key)
+        except Exception as e:
+            await asyncio.to_thread(preview_tmp.unlink, missing_ok=True)
+            self.failed += 1
+            logger.warning(f"PDF processing failed for {doc['filename']}: {str(e)}")
+            await db.uploads.update_one({"_id": sha256}, {"$set": {"pdf.status": "failed", "pdf.error": str(e)[:500]}})
+            return
+        
+        await db.uploads.update_one({"_id": sha256}, {"$set": {"pdf": {
+            "status": "done",
+            "pages": result["pages"],
+            "preview": preview_key,
+            "text": result["text"],
+            "processed_at": datetime.now(timezone.utc).isoformat()
+        }}})
+        self.processed += 1
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        self.pool.shutdown()
+
+    def stats(self):
+        return {
+            "available": pdfium is not None,
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed
+        }
+
+pdf_pipeline = PdfPipeline(PDF_WORKERS)
+
+async def find_pdf_upload(filename: str) -> dict:
+    # O nome é <sha256>.pdf, a chave do registo em db.uploads
+    doc = await db.uploads.find_one({"_id": Path(filename).stem}, {"filename": 1, "content_type": 1, "pdf": 1})
+    if not doc or doc["filename"] != filename or doc.get("content_type") != "application/pdf":
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    return doc
+
+@api_router.get("/uploads/{filename}/preview")
+async def get_upload_preview(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1),
+    fmt: Optional[str] = None
+):
+    """Imagem da 1ª página de um PDF (404 enquanto não estiver pronta); aceita ?w=&fmt= como as fotos"""
+    doc = await find_pdf_upload(filename)
+    preview = doc.get("pdf", {}).get("preview")
+    if not preview:
+        raise HTTPException(status_code=404, detail="Pré-visualização ainda não disponível")
+    return await get_upload(preview, request, w, fmt)
+
+@api_router.get("/uploads/{filename}/text")
+async def get_upload_text(filename: str, user=Depends(get_current_user)):
+    """Texto extraído de um PDF e estado do processamento"""
+    doc = await find_pdf_upload(filename)
+    pdf = doc.get("pdf", {})
+    return {
+        "filename": filename,
+        "status": pdf.get("status", "pending"),
+        "pages": pdf.get("pages"),
+        "text": pdf.get("text", "")
+    }
+
+# ==================== UPLOAD GC ====================
+# Campos que guardam URLs de /api/uploads, por coleção
+UPLOAD_REFERENCE_FIELDS = {
+    "equipamentos": ["foto", "manual_url", "certificado_url", "ficha_manutencao_url"],
+    "viaturas": ["foto", "dua_url", "seguro_url", "ipo_url", "carta_verde_url", "manual_url"]
+}
+
+def upload_key_from_url(url) -> Optional[str]:
+    if not isinstance(url, str) or "/api/uploads/" not in url:
+        return None
+    key = url.rsplit("/api/uploads/", 1)[1].split("?", 1)[0]
+    return key or None
+
+def upload_owner_stem(key: str) -> str:
+    """Nome base do upload a que o ficheiro pertence: a pré-visualização de um PDF e o original de
+    uma foto normalizada vivem enquanto esse upload for referenciado"""
+    stem = Path(key).stem
+    for suffix in ("_preview", "_original"):
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+class UploadGC:
+    """Recolha incremental de uploads órfãos. Cada passo lista um lote do storage a partir do
+    checkpoint guardado em db.upload_gc_state, põe em quarentena os ficheiros sem referências e
+    apaga os que já estão em quarentena há UPLOAD_GC_QUARANTINE_HOURS e continuam órfãos."""
+
+    def __init__(self, database, storage, batch_size: int, grace_seconds: int,
+                 quarantine_seconds: int, lease_seconds: int):
+        self.db = database
+        self.storage = storage
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self.quarantine_seconds = quarantine_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._referenced = None  # Nomes base referenciados, recolhidos no início de cada passagem
+        self.scanned = 0
+        self.quarantined = 0
+        self.restored = 0
+        self.deleted = 0
+        self.passes = 0
+
+    async def collect_references(self) -> set:
+        keys = set()
+        for collection, fields in UPLOAD_REFERENCE_FIELDS.items():
+            projection = {"_id": 0, **{field: 1 for field in fields}}
+            async for doc in self.db[collection].find({}, projection):
+                for field in fields:
+                    key = upload_key_from_url(doc.get(field))
+                    if key:
+                        keys.add(Path(key).stem)
+        return keys
+
+    async def is_referenced(self, key: str) -> bool:
+        """Verificação atual (não usa o conjunto da passagem) antes de apagar"""
+        pattern = {"$regex": f"/api/uploads/{re.escape(upload_owner_stem(key))}\\.[A-Za-z0-9]+(\\?|$)"}
+        for collection, fields in UPLOAD_REFERENCE_FIELDS.items():
+            if await self.db[collection].find_one({"$or": [{field: pattern} for field in fields]}, {"_id": 1}):
+                return True
+        return False
+
+    async def _recently_uploaded(self, key: str) -> bool:
+        # Um upload repetido do mesmo conteúdo reutiliza o ficheiro (deduplicação por hash)
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.grace_seconds)).isoformat()
+        doc = await self.db.uploads.find_one(
+            {"_id": upload_owner_stem(key), "last_uploaded_at": {"$gt": cutoff}}, {"_id": 1}
+        )
+        return doc is not None
+
+    async def _acquire(self) -> Optional[dict]:
+        """Lease para só uma instância recolher de cada vez; devolve o estado (com o checkpoint)"""
+        now = datetime.now(timezone.utc)
+        try:
+            return await self.db.upload_gc_state.find_one_and_update(
+                {"_id": "gc", "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now.isoformat()}}]},
+                {"$set": {
+                    "owner": self.owner,
+                    "lease_until": (now + timedelta(seconds=self.lease_seconds)).isoformat()
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+
+    async def step(self) -> dict:
+        """Processa um lote e avança o checkpoint; no fim da listagem recomeça do início"""
+        state = await self._acquire()
+        if state is None:
+            return {"skipped": True}
+        cursor = state.get("cursor", "")
+        if cursor == "" or self._referenced is None:
+            self._referenced = await self.collect_references()
+        
+        keys = await self.storage.list_keys(cursor, self.batch_size)
+        now = time.time()
+        referenced = []
+        orphans = []
+        for key, mtime in keys:
+            if upload_owner_stem(key) in self._referenced:
+                referenced.append(key)
+            elif now - mtime > self.grace_seconds:
+                orphans.append(key)
+        
+        summary = {"scanned": len(keys), "quarantined": 0, "restored": 0, "deleted": 0}
+        if referenced:
+            result = await self.db.upload_quarantine.delete_many({"_id": {"$in": referenced}})
+            summary["restored"] += result.deleted_count
+        quarantined_at = datetime.now(timezone.utc).isoformat()
+        for key in orphans:
+            result = await self.db.upload_quarantine.update_one(
+                {"_id": key}, {"$setOnInsert": {"quarantined_at": quarantined_at}}, upsert=True
+            )
+            if result.upserted_id is not None:
+                summary["quarantined"] += 1
+        
+        restored, deleted = await self._purge()
+        summary["restored"] += restored
+        summary["deleted"] = deleted
+        
+        next_cursor = keys[-1][0] if len(keys) == self.batch_size else ""
+        summary["pass_complete"] = next_cursor == ""
+        if summary["pass_complete"]:
+            self._referenced = None
+            self.passes += 1
+        await self.db.upload_gc_state.update_one(
+            {"_id": "gc"},
+            {"$set": {"cursor": next_cursor, "last_run_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        self.scanned += summary["scanned"]
+        self.quarantined += summary["quarantined"]
+        self.restored += summary["restored"]
+        self.deleted += summary["deleted"]
+        return summary
+
+    async def _purge(self):
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.quarantine_seconds)).isoformat()
+        restored = deleted = 0
+        expired = self.db.upload_quarantine.find({"quarantined_at": {"$lt": cutoff}})
+        for entry in await expired.to_list(self.batch_size):
+            key = entry["_id"]
+            if await self.is_referenced(key) or await self._recently_uploaded(key):
+                restored += 1
+            else:
+                await self.storage.delete(key)
+                hot_file_cache.invalidate(key)
+                await self.db.uploads.delete_one({"_id": Path(key).stem, "filename": key})
+                deleted += 1
+            await self.db.upload_quarantine.delete_one({"_id": key})
+        return restored, deleted
+
+    async def run_pass(self) -> dict:
+        """Corre passos até completar uma passagem pelo storage (uso manual)"""
+        totals = {"scanned": 0, "quarantined": 0, "restored": 0, "deleted": 0, "steps": 0}
+        while True:
+            summary = await self.step()
+            if summary.get("skipped"):
+                totals["skipped"] = True
+                return totals
+            totals["steps"] += 1
+            for field in ("scanned", "quarantined", "restored", "deleted"):
+                totals[field] += summary[field]
+            if summary["pass_complete"]:
+                return totals
+
+    def stats(self):
+        return {
+            "enabled": UPLOAD_GC_ENABLED,
+            "scanned": self.scanned,
+            "quarantined": self.quarantined,
+            "restored": self.restored,
+            "deleted": self.deleted,
+            "passes": self.passes
+        }
+
+upload_gc = UploadGC(
+    db, upload_storage, UPLOAD_GC_BATCH_SIZE,
+    UPLOAD_GC_GRACE_HOURS * 3600, UPLOAD_GC_QUARANTINE_HOURS * 3600,
+    UPLOAD_GC_INTERVAL_SECONDS * 3
+)
+
+async def upload_gc_loop():
+    while True:
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+        try:
+            await upload_gc.step()
+        except Exception as e:
+            logger.error(f"Upload GC step failed: {str(e)}")
+
+# ==================== MIGRATIONS ====================
+MIGRATIONS_ON_STARTUP = os.environ.get('MIGRATIONS_ON_STARTUP', 'true').lower() == 'true'
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '1000'))
+MIGRATION_LOCK_SECONDS = int(os.environ.get('MIGRATION_LOCK_SECONDS', '600'))
+
+# Campos acrescentados depois de já existirem dados; os documentos antigos são preenchidos por migração
+EQUIPAMENTO_DEFAULTS = {
+    "em_manutencao": False,
+    "descricao_avaria": "",
+    "manual_url": "",
+    "certificado_url": "",
+    "ficha_manutencao_url": "",
+}
+VIATURA_DEFAULTS = {
+    "em_manutencao": False,
+    "descricao_avaria": "",
+    "dua_url": "",
+    "seguro_url": "",
+    "ipo_url": "",
+    "carta_verde_url": "",
+    "manual_url": "",
+    "data_ipo": None,
+    "data_proxima_revisao": None,
+    "kms_atual": 0,
+    "kms_proxima_revisao": 0,
+}
+
+async def backfill_defaults(database, name: str, defaults: dict, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Preenche campos em falta por lotes. Cada lote fica gravado e a consulta só devolve
+    documentos ainda incompletos, por isso uma migração interrompida retoma ao correr de novo"""
+    missing = {"$or": [{field: {"$exists": False}} for field in defaults]}
+    projection = {field: 1 for field in defaults}
+    updated = 0
+    while True:
+        docs = await database[name].find(missing, projection).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return updated
+        await database[name].bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {f: v for f, v in defaults.items() if f not in doc}})
+            for doc in docs
+        ], ordered=False)
+        updated += len(docs)
+
+async def migrate_equipamento_defaults(database) -> int:
+    """Campos de manutenção e documentos em equipamentos"""
+    return await backfill_defaults(database, "equipamentos", EQUIPAMENTO_DEFAULTS)
+
+async def migrate_viatura_defaults(database) -> int:
+    """Campos de documentos, manutenção e alertas em viaturas"""
+    return await backfill_defaults(database, "viaturas", VIATURA_DEFAULTS)
+
+async def migrate_updated_at(database) -> int:
+    """updated_at para o /api/sync: nos documentos antigos, a data de criação"""
+    updated = 0
+    for name, source in [("equipamentos", "created_at"), ("viaturas", "created_at"), ("materiais", "created_at"),
+                         ("obras", "created_at"), ("movimentos", "created_at"), ("movimentos_stock", "data_hora"),
+                         ("movimentos_viaturas", "created_at")]:
+        while True:
+            docs = await database[name].find(
+                {"updated_at": {"$exists": False}}, {source: 1}
+            ).limit(MIGRATION_BATCH_SIZE).to_list(MIGRATION_BATCH_SIZE)
+            if not docs:
+                break
+            await database[name].bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"updated_at": doc.get(source) or ""}})
+                for doc in docs
+            ], ordered=False)
+            updated += len(docs)
+    return updated
+
+async def migrate_upload_count(database) -> int:
+    """uploads.refs contava uploads, não referências: passa a chamar-se upload_count"""
+    result = await database.uploads.update_many({"refs": {"$exists": True}}, {"$rename": {"refs": "upload_count"}})
+    return result.modified_count
+
+# (versão, função); só se acrescenta no fim, nunca se renumera
+MIGRATIONS = [
+    (1, migrate_equipamento_defaults),
+    (2, migrate_viatura_defaults),
+    (3, migrate_updated_at),
+    (4, migrate_upload_count),
+]
+
+class MigrationRunner:
+    """Aplica MIGRATIONS por ordem e regista a versão do esquema em schema_migrations"""
+
+    def __init__(self, database, migrations: list, lock_seconds: int):
+        self.db = database
+        self.migrations = migrations
+        self.lock_seconds = lock_seconds
+        self.owner = uuid.uuid4().hex
+
+    async def version(self) -> int:
+        state = await self.db.schema_migrations.find_one({"_id": "schema"})
+        return state.get("version", 0) if state else 0
+
+    async def pending(self) -> list:
+        version = await self.version()
+        return [(v, migration) for v, migration in self.migrations if v > version]
+
+    async def _acquire(self) -> bool:
+        """Lease para só uma instância migrar de cada vez"""
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.schema_migrations.find_one_and_update(
+                {"_id": "lock", "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now.isoformat()}}]},
+                {"$set": {
+                    "owner": self.owner,
+                    "lease_until": (now + timedelta(seconds=self.lock_seconds)).isoformat()
+                }},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def run(self, wait_seconds: Optional[float] = None) -> list:
+        """Aplica as migrações pendentes; espera se outra instância estiver a migrar"""
+        deadline = time.monotonic() + (self.lock_seconds if wait_seconds is None else wait_seconds)
+        while not await self._acquire():
+            if time.monotonic() > deadline:
+                raise RuntimeError("Migrações bloqueadas por outra instância")
+            await asyncio.sleep(1)
+        applied = []
+        try:
+            # Lido já com o lock: outra instância pode ter migrado enquanto esperávamos
+            for version, migration in await self.pending():
+                await self._acquire()  # renova o lease antes de cada migração
+                started = time.monotonic()
+                documents = await migration(self.db)
+                entry = {
+                    "version": version,
+                    "name": migration.__name__,
+                    "documents": documents,
+                    "applied_at": datetime.now(timezone.utc).isoformat()
+                }
+                await self.db.schema_migrations.update_one(
+                    {"_id": "schema"},
+                    {"$set": {"version": version}, "$push": {"history": entry}},
+                    upsert=True
+                )
+                logger.info(f"Migration {version} ({migration.__name__}) updated {documents} documents "
+                            f"in {time.monotonic() - started:.1f}s")
+                applied.append(entry)
+        finally:
+            await self.db.schema_migrations.delete_one({"_id": "lock", "owner": self.owner})
+        return applied
+
+migration_runner = MigrationRunner(db, MIGRATIONS, MIGRATION_LOCK_SECONDS)
+
+# ==================== CHANGE VERSIONS ====================
+CHANGE_VERSION_TTL_SECONDS = float(os.environ.get('CHANGE_VERSION_TTL_SECONDS', '2'))
+
+class ChangeVersions:
+    """Contador de escritas por coleção (collection_versions) para os ETags das listagens.
+    As escritas deste processo atualizam a cópia em memória na hora; as dos outros
+    workers chegam no refresh seguinte (TTL)"""
+
+    def __init__(self, database, ttl: float):
+        self.db = database
+        self.ttl = ttl
+        self.versions = {}
+        self.loaded_at = None
+        self.refreshes = 0
+        self.not_modified = 0
+
+    def _merge(self, name: str, epoch: str, version: int):
+        # Um refresh lento não pode recuar um bump local mais recente
+        current = self.versions.get(name)
+        if current and current[0] == epoch and current[1] > version:
+            return
+        self.versions[name] = (epoch, version)
+
+    async def refresh(self):
+        async for doc in self.db.collection_versions.find({}):
+            self._merge(doc["_id"], doc["epoch"], doc["version"])
+        self.loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    async def get(self, name: str) -> str:
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            await self.refresh()
+        # O epoch muda se a base de dados for reposta, para um ETag antigo nunca voltar a coincidir
+        epoch, version = self.versions.get(name, ("", 0))
+        return f"{epoch}.{version}"
+
+    async def bump(self, *names: str):
+        for name in names:
+            doc = await self.db.collection_versions.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._merge(name, doc["epoch"], doc["version"])
+
+    def stats(self) -> dict:
+        return {
+            "versions": {name: version for name, (_, version) in self.versions.items()},
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified
+        }
+
+change_versions = ChangeVersions(db, CHANGE_VERSION_TTL_SECONDS)
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Comparação fraca do If-None-Match (aceita vários valores e *)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+async def conditional_list(name: str, request: Request, response: Response) -> Optional[Response]:
+    """ETag da listagem a partir da versão da coleção e da query; devolve o 304
+    (sem ir ao Mongo) quando o cliente já tem esta resposta"""
+    version = await change_versions.get(name)
+    query = urlencode(sorted(request.query_params.multi_items()))
+    etag = 'W/"' + hashlib.sha1(f"{name}|{version}|{query}".encode()).hexdigest()[:24] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        change_versions.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# ==================== PAGINATION ====================
+# Tamanho de página quando só vem ?cursor=; sem limit nem cursor a lista vem completa
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', '100'))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', '500'))
+
+# Ordem das listagens: campo indexado, com o id como desempate estável
+LIST_SORT_KEYS = {
+    "equipamentos": "created_at",
+    "viaturas": "created_at",
+    "materiais": "created_at",
+    "obras": "created_at",
+    "movimentos": "created_at",
+    "movimentos_stock": "data_hora",
+    "movimentos_viaturas": "created_at",
+}
+
+# Ordenações aceites em ?sort= (prefixo "-" para descendente), cada uma com índice próprio
+LIST_SORT_FIELDS = {
+    "equipamentos": ["created_at", "codigo", "descricao", "categoria"],
+    "viaturas": ["created_at", "matricula", "kms_atual", "data_ipo", "data_proxima_revisao"],
+}
+
+# Filtros de igualdade; indexados à frente da ordem por defeito
+LIST_FILTER_FIELDS = {
+    "equipamentos": ["categoria", "ativo", "obra_id", "em_manutencao", "estado_conservacao"],
+    "viaturas": ["combustivel", "ativa", "obra_id", "em_manutencao"],
+}
+
+def list_indexes(name: str) -> list:
+    default = LIST_SORT_KEYS[name]
+    indexes = [[(default, -1), ("id", -1)]]
+    for field in LIST_SORT_FIELDS.get(name, []):
+        if field != default:
+            indexes.append([(field, -1), ("id", -1)])
+    for field in LIST_FILTER_FIELDS.get(name, []):
+        indexes.append([(field, 1), (default, -1), ("id", -1)])
+    return indexes
+
+def parse_sort(name: str, sort: Optional[str]) -> tuple:
+    if not sort:
+        return LIST_SORT_KEYS[name], -1
+    field = sort.removeprefix("-")
+    if field not in LIST_SORT_FIELDS.get(name, [LIST_SORT_KEYS[name]]):
+        raise HTTPException(status_code=400, detail=f"Ordenação inválida: {sort}")
+    return field, -1 if sort.startswith("-") else 1
+
+def resource_filters(obra_id: Optional[str], atribuido: Optional[bool],
+                     em_manutencao: Optional[bool], **fields) -> dict:
+    """Filtros comuns a equipamentos e viaturas; valores None são ignorados"""
+    query = {field: value for field, value in fields.items() if value is not None}
+    if obra_id is not None:
+        query["obra_id"] = obra_id
+    elif atribuido is not None:
+        query["obra_id"] = {"$nin": [None, ""]} if atribuido else {"$in": [None, ""]}
+    if em_manutencao is not None:
+        # Documentos antigos sem o campo contam como fora de manutenção
+        query["em_manutencao"] = True if em_manutencao else {"$ne": True}
+    return query
+
+def encode_cursor(field: str, value, item_id: str) -> str:
+    raw = json.dumps([field, value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, field: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_field, value, item_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if cursor_field != field or not isinstance(item_id, str):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return value, item_id
+
+def keyset_filter(field: str, direction: int, value, item_id: str) -> dict:
+    """Documentos depois de (value, item_id) na ordem (field, id) indicada"""
+    op = "$lt" if direction < 0 else "$gt"
+    after = [{field: value, "id": {op: item_id}}]
+    # Campos em falta ordenam como null, antes de qualquer valor
+    if value is None:
+        if direction > 0:
+            after.append({field: {"$ne": None}})
+    else:
+        after.append({field: {op: value}})
+        if direction < 0:
+            after.append({field: None})
+    return {"$or": after}
+
+async def paginate(collection, query: dict, field: str, direction: int, limit: Optional[int],
+                   cursor: Optional[str], projection: Optional[dict] = None):
+    """Sem limit nem cursor devolve a lista completa (como antes, sem truncar); com um deles,
+    uma página por keyset: {"items": [...], "next_cursor": ... ou null na última}"""
+    # O cursor só vale para a mesma ordenação em que foi emitido
+    sort_key = f"-{field}" if direction < 0 else field
+    paged = limit is not None or cursor is not None
+    if cursor:
+        after = keyset_filter(field, direction, *decode_cursor(cursor, sort_key))
+        query = {"$and": [query, after]} if query else after
+    # O cursor precisa do campo de ordenação e do id, mesmo que não tenham sido pedidos
+    find_projection = {**projection, field: 1, "id": 1} if projection else {"_id": 0}
+    find = collection.find(query, find_projection).sort([(field, direction), ("id", direction)])
+    next_cursor = None
+    if paged:
+        limit = limit or LIST_PAGE_SIZE
+        items = await find.limit(limit + 1).to_list(limit + 1)
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = encode_cursor(sort_key, last.get(field), last["id"])
+    else:
+        items = await find.to_list(None)
+    if projection:
+        apply_projection(items, projection)
+    return {"items": items, "next_cursor": next_cursor} if paged else items
+
+async def paginate_list(name: str, limit: Optional[int], cursor: Optional[str], request: Request, response: Response,
+                        query: Optional[dict] = None, sort: Optional[str] = None,
+                        projection: Optional[dict] = None):
+    field, direction = parse_sort(name, sort)
+    # A versão é lida antes da query: uma escrita a meio dá, no pior caso, um ETag já ultrapassado
+    not_modified = await conditional_list(name, request, response)
+    if not_modified:
+        return not_modified
+    return await paginate(db[name], query or {}, field, direction, limit, cursor, projection)
+
+# ==================== FIELD PROJECTION ====================
+# O modelo de cada coleção define os campos aceites em ?fields=
+PROJECTION_MODELS = {
+    "equipamentos": Equipamento,
+    "viaturas": Viatura,
+    "materiais": Material,
+    "obras": Obra,
+    "movimentos": Movimento,
+    "movimentos_stock": MovimentoStock,
+    "movimentos_viaturas": MovimentoViatura,
+}
+
+# Presets com nome; "picker" serve os selects dos formulários de movimentos
+PROJECTION_PRESETS = {
+    "equipamentos": {
+        "picker": ["codigo", "descricao", "obra_id", "ativo"],
+        "table": ["codigo", "descricao", "marca", "modelo", "categoria", "numero_serie", "estado_conservacao",
+                  "foto", "obra_id", "ativo", "em_manutencao"],
+    },
+    "viaturas": {
+        "picker": ["matricula", "marca", "modelo", "obra_id", "ativa"],
+        "table": ["matricula", "marca", "modelo", "combustivel", "foto", "obra_id", "ativa", "em_manutencao",
+                  "data_vistoria", "data_seguro", "data_ipo", "data_proxima_revisao", "kms_atual",
+                  "kms_proxima_revisao"],
+    },
+    "materiais": {
+        "picker": ["codigo", "descricao", "unidade", "stock_atual"],
+        "table": ["codigo", "descricao", "unidade", "stock_atual", "stock_minimo", "ativo"],
+    },
+    "obras": {
+        "picker": ["codigo", "nome", "estado"],
+        "table": ["codigo", "nome", "endereco", "cliente", "estado"],
+    },
+}
+
+def parse_fields(name: str, fields: Optional[str]) -> Optional[dict]:
+    """?fields=codigo,descricao ou um preset (?fields=picker) -> projeção Mongo; None devolve tudo"""
+    if not fields:
+        return None
+    allowed = PROJECTION_MODELS[name].model_fields
+    presets = PROJECTION_PRESETS.get(name, {})
+    selected = {"id"}
+    for part in fields.split(","):
+        part = part.strip()
+        if part in presets:
+            selected.update(presets[part])
+        elif part in allowed:
+            selected.add(part)
+        elif part:
+            raise HTTPException(status_code=400, detail=f"Campo inválido: {part}")
+    return {"_id": 0, **{field: 1 for field in sorted(selected)}}
+
+def apply_projection(items: list, projection: dict):
+    """Retira campos não pedidos (ex.: valores por defeito ou campos usados internamente)"""
+    for item in items:
+        for key in [k for k in item if k not in projection]:
+            del item[key]
+
+# ==================== SEARCH ====================
+SEARCH_REFRESH_SECONDS = int(os.environ.get('SEARCH_REFRESH_SECONDS', '300'))
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '50'))
+
+# Campos pesquisáveis por coleção e o peso de cada um no ranking
+SEARCH_FIELDS = {
+    "equipamentos": {"codigo": 4, "numero_serie": 4, "descricao": 2, "marca": 1, "modelo": 1},
+    "viaturas": {"matricula": 4, "marca": 1, "modelo": 1},
+    "materiais": {"codigo": 4, "descricao": 2},
+    "obras": {"codigo": 4, "nome": 2},
+}
+SEARCH_TIPOS = {"equipamentos": "equipamento", "viaturas": "viatura", "materiais": "material", "obras": "obra"}
+# Identificadores também ficam indexados sem separadores ("AA-00-BB" -> "aa00bb")
+SEARCH_IDENTIFIER_FIELDS = {"codigo", "numero_serie", "matricula"}
+
+# Autocomplete: o primeiro campo é a chave (normalizada), os restantes vão na resposta
+AUTOCOMPLETE_FIELDS = {
+    "equipamentos": ["codigo", "descricao"],
+    "viaturas": ["matricula", "marca", "modelo"],
+}
+
+def search_terms(value) -> list:
+    """Minúsculas, sem acentos, partido em sequências alfanuméricas"""
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode().lower()
+    return re.findall(r"[a-z0-9]+", text)
+
+class MirroredIndex(abc.ABC):
+    """Base dos índices em memória espelhados do Mongo: as rotas aplicam as escritas
+    locais e um rebuild periódico apanha as feitas noutros workers"""
+
+    def __init__(self, fields: dict):
+        self.fields = fields  # coleção -> campos indexados
+        self._pending = None  # escritas recebidas durante um rebuild
+        self.rebuilds = 0
+        self.queries = 0
+
+    def put(self, name: str, doc: dict):
+        if name not in self.fields:
+            return
+        if self._pending is not None:
+            self._pending.append((name, doc["id"], doc))
+        self._put(name, doc)
+
+    def remove(self, name: str, doc_id: str):
+        if name not in self.fields:
+            return
+        if self._pending is not None:
+            self._pending.append((name, doc_id, None))
+        self._remove(name, doc_id)
+
+    async def rebuild(self, database):
+        fresh = type(self)(self.fields)
+        self._pending = []
+        try:
+            for name, fields in self.fields.items():
+                projection = {"_id": 0, "id": 1, **{field: 1 for field in fields}}
+                async for doc in database[name].find({}, projection):
+                    fresh._load(name, doc)
+            fresh._finish_load()
+            pending = self._pending
+        finally:
+            self._pending = None
+        self._swap(fresh)
+        # Escritas feitas enquanto o rebuild lia o Mongo
+        for name, doc_id, doc in pending:
+            if doc is None:
+                self._remove(name, doc_id)
+            else:
+                self._put(name, doc)
+        self.rebuilds += 1
+
+    @abc.abstractmethod
+    def _put(self, name: str, doc: dict):
+        ...
+
+    @abc.abstractmethod
+    def _remove(self, name: str, doc_id: str):
+        ...
+
+    def _load(self, name: str, doc: dict):
+        """Carregamento em massa num índice novo; _finish_load ordena no fim"""
+        self._put(name, doc)
+
+    def _finish_load(self):
+        pass
+
+    @abc.abstractmethod
+    def _swap(self, fresh):
+        ...
+
+class SearchIndex(MirroredIndex):
+    """Índice invertido em memória sobre SEARCH_FIELDS, com procura por prefixo de termo"""
+
+    def __init__(self, fields: dict):
+        super().__init__(fields)
+        self._postings = {}  # termo -> {(coleção, id): peso}
+        self._terms = []     # vocabulário ordenado, para intervalos de prefixo com bisect
+        self._docs = {}      # (coleção, id) -> (campos indexados, {termo: peso})
+
+    def _doc_terms(self, name: str, doc: dict) -> dict:
+        weights = {}
+        for field, weight in self.fields[name].items():
+            if not doc.get(field):
+                continue
+            terms = search_terms(doc[field])
+            if field in SEARCH_IDENTIFIER_FIELDS and len(terms) > 1:
+                terms.append("".join(terms))
+            for term in terms:
+                weights[term] = max(weights.get(term, 0), weight)
+        return weights
+
+    def _index(self, name: str, doc: dict) -> list:
+        """Acrescenta o documento às postings; devolve os termos novos no vocabulário"""
+        key = (name, doc["id"])
+        weights = self._doc_terms(name, doc)
+        new_terms = []
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                new_terms.append(term)
+            postings[key] = weight
+        self._docs[key] = ({field: doc.get(field) for field in self.fields[name]}, weights)
+        return new_terms
+
+    def _put(self, name: str, doc: dict):
+        self._remove(name, doc["id"])
+        for term in self._index(name, doc):
+            bisect.insort(self._terms, term)
+
+    def _remove(self, name: str, doc_id: str):
+        entry = self._docs.pop((name, doc_id), None)
+        if not entry:
+            return
+        for term in entry[1]:
+            postings = self._postings[term]
+            postings.pop((name, doc_id), None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _load(self, name: str, doc: dict):
+        self._index(name, doc)
+
+    def _finish_load(self):
+        self._terms = sorted(self._postings)
+
+    def _swap(self, fresh):
+        self._postings, self._terms, self._docs = fresh._postings, fresh._terms, fresh._docs
+
+    def _candidates(self, term: str) -> list:
+        """Termos do vocabulário que começam por term (só exatos para termos de 1 carácter)"""
+        if len(term) < 2:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._terms, term)
+        return self._terms[start:bisect.bisect_left(self._terms, term + "\uffff", start)]
+
+    def _cost(self, term: str, cap: float) -> float:
+        cost = 0
+        for candidate in self._candidates(term):
+            cost += len(self._postings[candidate])
+            if cost >= cap:
+                break
+        return cost
+
+    def _match(self, term: str) -> dict:
+        """Documentos com um termo que começa por term; correspondência exata vale o dobro"""
+        scores = {}
+        # A lista maior é copiada de uma vez; as restantes fundem-se nela
+        candidates = sorted(self._candidates(term), key=lambda c: len(self._postings[c]), reverse=True)
+        for candidate in candidates:
+            bonus = 2 if candidate == term else 1
+            postings = self._postings[candidate]
+            if not scores:
+                scores = {key: weight * bonus for key, weight in postings.items()}
+                continue
+            for key, weight in postings.items():
+                if weight * bonus > scores.get(key, 0):
+                    scores[key] = weight * bonus
+        return scores
+
+    def _term_score(self, key: tuple, term: str) -> int:
+        """O mesmo que _match, mas para um só documento (sem percorrer postings)"""
+        best = 0
+        for doc_term, weight in self._docs[key][1].items():
+            if doc_term == term:
+                best = max(best, weight * 2)
+            elif len(term) >= 2 and doc_term.startswith(term):
+                best = max(best, weight)
+        return best
+
+    def search(self, query: str, names: Optional[set] = None, limit: int = 20) -> list:
+        self.queries += 1
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Todos os termos têm de corresponder e a pontuação soma-se; parte-se do termo
+        # mais seletivo e os restantes só são verificados nos documentos candidatos
+        costs = {}
+        for term in sorted(terms, key=len, reverse=True):
+            costs[term] = self._cost(term, min(costs.values(), default=math.inf))
+        first = min(costs, key=costs.get)
+        scores = self._match(first)
+        for term in terms:
+            if term is first or not scores:
+                continue
+            narrowed = {}
+            for key, score in scores.items():
+                term_score = self._term_score(key, term)
+                if term_score:
+                    narrowed[key] = score + term_score
+            scores = narrowed
+        if len(terms) > 1:
+            # "aa 00 bb" também encontra a matrícula AA-00-BB pelo termo compacto
+            for key, score in self._match("".join(terms)).items():
+                scores[key] = max(scores.get(key, 0), score * len(terms))
+        if names:
+            scores = {key: score for key, score in scores.items() if key[0] in names}
+        best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [
+            {"tipo": SEARCH_TIPOS[name], "id": doc_id, "score": score, **self._docs[(name, doc_id)][0]}
+            for (name, doc_id), score in best
+        ]
+
+    def stats(self):
+        return {
+            "documents": len(self._docs),
+            "terms": len(self._terms),
+            "rebuilds": self.rebuilds,
+            "queries": self.queries
+        }
+
+def compact_key(value) -> str:
+    """Código ou matrícula sem maiúsculas nem separadores: "AA-00-BB" -> "aa00bb" """
+    return "".join(search_terms(value))
+
+class PrefixIndex(MirroredIndex):
+    """Arrays ordenados de chaves normalizadas (o primeiro campo de cada coleção), por prefixo com bisect"""
+
+    def __init__(self, fields: dict):
+        super().__init__(fields)
+        self._keys = {name: [] for name in fields}  # coleção -> [(chave, id)] ordenado
+        self._docs = {}  # (coleção, id) -> (chave, campos)
+
+    def _entry(self, name: str, doc: dict):
+        key = compact_key(doc.get(self.fields[name][0]) or "")
+        return key, {field: doc.get(field) for field in self.fields[name]}
+
+    def _put(self, name: str, doc: dict):
+        self._remove(name, doc["id"])
+        key, fields = self._entry(name, doc)
+        if key:
+            bisect.insort(self._keys[name], (key, doc["id"]))
+            self._docs[(name, doc["id"])] = (key, fields)
+
+    def _remove(self, name: str, doc_id: str):
+        entry = self._docs.pop((name, doc_id), None)
+        if entry:
+            keys = self._keys[name]
+            del keys[bisect.bisect_left(keys, (entry[0], doc_id))]
+
+    def _load(self, name: str, doc: dict):
+        key, fields = self._entry(name, doc)
+        if key:
+            self._keys[name].append((key, doc["id"]))
+            self._docs[(name, doc["id"])] = (key, fields)
+
+    def _finish_load(self):
+        for keys in self._keys.values():
+            keys.sort()
+
+    def _swap(self, fresh):
+        self._keys, self._docs = fresh._keys, fresh._docs
+
+    def complete(self, prefix: str, names: Optional[set] = None, limit: int = 10) -> list:
+        self.queries += 1
+        prefix = compact_key(prefix)
+        if not prefix:
+            return []
+        matches = []
+        for name, keys in self._keys.items():
+            if names and name not in names:
+                continue
+            start = bisect.bisect_left(keys, (prefix,))
+            for key, doc_id in keys[start:start + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append((key, name, doc_id))
+        return [
+            {"tipo": SEARCH_TIPOS[name], "id": doc_id, **self._docs[(name, doc_id)][1]}
+            for key, name, doc_id in heapq.nsmallest(limit, matches)
+        ]
+
+    def stats(self):
+        return {
+            "keys": {name: len(keys) for name, keys in self._keys.items()},
+            "rebuilds": self.rebuilds,
+            "queries": self.queries
+        }
+
+search_index = SearchIndex(SEARCH_FIELDS)
+autocomplete_index = PrefixIndex(AUTOCOMPLETE_FIELDS)
+mirrored_indexes = [search_index, autocomplete_index]
+
+def index_document(name: str, doc: dict):
+    for index in mirrored_indexes:
+        index.put(name, doc)
+
+def unindex_document(name: str, doc_id: str):
+    for index in mirrored_indexes:
+        index.remove(name, doc_id)
+
+async def search_refresh_loop():
+    while True:
+        await asyncio.sleep(SEARCH_REFRESH_SECONDS)
+        for index in mirrored_indexes:
+            try:
+                await index.rebuild(db)
+            except Exception as e:
+                logger.error(f"Search index rebuild failed: {str(e)}")
+
+def search_names(tipo: Optional[str], allowed) -> Optional[set]:
+    if not tipo:
+        return None
+    names = {name for name in allowed if SEARCH_TIPOS[name] == tipo}
+    if not names:
+        raise HTTPException(status_code=400, detail=f"Tipo inválido: {tipo}")
+    return names
+
+@api_router.get("/search")
+async def search(q: str = Query(..., min_length=1, max_length=100), tipo: Optional[str] = None,
+                 limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS), user=Depends(get_current_user)):
+    """Pesquisa em equipamentos, viaturas, materiais e obras, ordenada por relevância"""
+    return {"q": q, "results": search_index.search(q, search_names(tipo, SEARCH_FIELDS), limit)}
+
+@api_router.get("/autocomplete")
+async def autocomplete(q: str = Query(..., min_length=1, max_length=50), tipo: Optional[str] = None,
+                       limit: int = Query(10, ge=1, le=SEARCH_MAX_RESULTS), user=Depends(get_current_user)):
+    """Sugestões por prefixo de código de equipamento ou matrícula, ignorando maiúsculas e separadores"""
+    return {"q": q, "results": autocomplete_index.complete(q, search_names(tipo, AUTOCOMPLETE_FIELDS), limit)}
+
+# ==================== SYNC ====================
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+# Só se entrega o que tem updated_at anterior a agora - SYNC_SETTLE_SECONDS: uma escrita
+# com timestamp já tirado mas ainda não gravada não pode ficar atrás do token
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', '2'))
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', '30'))
+
+SYNC_COLLECTIONS = ["equipamentos", "viaturas", "materiais", "obras",
+                    "movimentos", "movimentos_stock", "movimentos_viaturas"]
+
+async def write_tombstone(name: str, doc_id: str):
+    now = datetime.now(timezone.utc)
+    await db.tombstones.insert_one({
+        "id": doc_id,
+        "collection": name,
+        "deleted_at": now.isoformat(),
+        "expires_at": now + timedelta(days=SYNC_TOMBSTONE_DAYS)
+    })
+
+def encode_sync_token(positions: dict) -> str:
+    raw = json.dumps(positions, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_sync_token(token: str) -> dict:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        positions = {key: tuple(raw[key]) for key in sync_streams()}
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+    for key, position in positions.items():
+        # Só os streams de documentos começam em null (antes de qualquer updated_at)
+        if len(position) != 2 or not isinstance(position[1], str) or not (
+                isinstance(position[0], str) or (position[0] is None and not key.startswith("-"))):
+            raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+    return positions
+
+def sync_streams() -> list:
+    """Um stream de alterações e um de tombstones por coleção, cada um com a sua posição"""
+    return SYNC_COLLECTIONS + [f"-{name}" for name in SYNC_COLLECTIONS]
+
+def initial_positions(horizon: str) -> dict:
+    # Um cliente novo recebe tudo, mas nenhum tombstone anterior
+    return {**{name: (None, "") for name in SYNC_COLLECTIONS},
+            **{f"-{name}": (horizon, "") for name in SYNC_COLLECTIONS}}
+
+async def read_stream(stream: str, position: tuple, horizon: str, limit: int) -> tuple:
+    """Documentos do stream depois de position e antes de horizon; devolve (docs, nova posição, completo)"""
+    deleted = stream.startswith("-")
+    name = stream.removeprefix("-")
+    field = "deleted_at" if deleted else "updated_at"
+    query = {"$and": [keyset_filter(field, 1, *position), {field: {"$lt": horizon}}]}
+    if deleted:
+        query["collection"] = name
+        collection, projection = db.tombstones, {"_id": 0, "id": 1, "deleted_at": 1}
+    else:
+        collection, projection = db[name], {"_id": 0}
+    docs = await collection.find(query, projection).sort([(field, 1), ("id", 1)]).limit(limit).to_list(limit)
+    if len(docs) < limit:
+        # Em dia: a posição avança até ao horizonte, mesmo sem alterações
+        return docs, (horizon, ""), True
+    return docs, (docs[-1].get(field), docs[-1]["id"]), False
+
+@api_router.get("/sync")
+async def sync(since: Optional[str] = None, limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_PAGE_SIZE * 4),
+               user=Depends(get_current_user)):
+    """Alterações desde o último token: documentos novos ou alterados e ids eliminados, por coleção.
+    reset=true pede ao cliente para descartar a cópia local; more=true para pedir já a seguinte"""
+    now = datetime.now(timezone.utc)
+    horizon = (now - timedelta(seconds=SYNC_SETTLE_SECONDS)).isoformat()
+    retention = (now - timedelta(days=SYNC_TOMBSTONE_DAYS)).isoformat()
+    positions = decode_sync_token(since) if since else None
+    # Tombstones mais antigos podem já ter expirado: só uma cópia completa é segura
+    reset = positions is None or any(positions[f"-{name}"][0] < retention for name in SYNC_COLLECTIONS)
+    if reset:
+        positions = initial_positions(horizon)
+    
+    changes, deleted, more = {}, {}, False
+    for stream in sync_streams():
+        docs, positions[stream], complete = await read_stream(stream, positions[stream], horizon, limit)
+        more = more or not complete
+        if stream.startswith("-"):
+            if docs:
+                deleted[stream[1:]] = [doc["id"] for doc in docs]
+        elif docs:
+            changes[stream] = docs
+    return {
+        "token": encode_sync_token(positions),
+        "reset": reset,
+        "more": more,
+        "changes": changes,
+        "deleted": deleted
+    }
+
+# ==================== INDEXES ====================
+INDEXES_ON_STARTUP = os.environ.get('INDEXES_ON_STARTUP', 'true').lower() == 'true'
+
+def index_spec() -> dict:
+    """Índices declarados por coleção: keys + opções de create_index"""
+    spec = {
+        "users": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("email", 1)], "unique": True},
+        ],
+        "equipamentos": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("codigo", 1)], "unique": True},
+        ],
+        "viaturas": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("matricula", 1)], "unique": True},
+        ],
+        "materiais": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("codigo", 1)], "unique": True},
+        ],
+        "obras": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("codigo", 1)], "unique": True},
+        ],
+        "movimentos": [
+            {"keys": [("id", 1)], "unique": True},
+            # Histórico de um recurso (detalhe e relatório por recurso)
+            {"keys": [("recurso_id", 1), ("tipo_recurso", 1), ("created_at", -1)]},
+            # Relatórios de movimentos por obra ou tipo, por período
+            {"keys": [("obra_id", 1), ("created_at", -1)]},
+            {"keys": [("tipo_recurso", 1), ("created_at", -1)]},
+        ],
+        "movimentos_stock": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("material_id", 1), ("data_hora", -1)]},
+            {"keys": [("obra_id", 1), ("data_hora", -1)]},
+        ],
+        "movimentos_viaturas": [
+            {"keys": [("id", 1)], "unique": True},
+            {"keys": [("viatura_id", 1), ("created_at", -1)]},
+        ],
+        "revoked_tokens": [
+            {"keys": [("jti", 1)], "unique": True},
+            # Entradas saem do Mongo sozinhas quando o token revogado expiraria
+            {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+        ],
+        "upload_quarantine": [{"keys": [("quarantined_at", 1)]}],
+        "upload_sessions": [{"keys": [("expires_at", 1)]}],
+    }
+    if LOGIN_THROTTLE_BACKEND == "mongo":
+        spec["login_throttle"] = [{"keys": [("expires_at", 1)], "expireAfterSeconds": 0}]
+    # Paginação por keyset (nos dois sentidos) e filtros das listagens
+    for name in LIST_SORT_KEYS:
+        spec.setdefault(name, []).extend({"keys": keys} for keys in list_indexes(name))
+    # /api/sync: alterações por (updated_at, id) e tombstones por coleção
+    for name in SYNC_COLLECTIONS:
+        spec.setdefault(name, []).append({"keys": [("updated_at", 1), ("id", 1)]})
+    spec["tombstones"] = [
+        {"keys": [("collection", 1), ("deleted_at", 1), ("id", 1)]},
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+    ]
+    return spec
+
+def index_name(keys: list) -> str:
+    """O nome que o Mongo dá por defeito (codigo_1, obra_id_1_created_at_-1)"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def reconcile_indexes(database, spec: dict, create: bool = True) -> dict:
+    """Compara os índices existentes com os declarados: cria os que faltam (ou só os lista,
+    com create=False) e reporta os que sobram ou têm opções diferentes; nada é apagado"""
+    report = {}
+    for name, declared in spec.items():
+        existing = {tuple(info["key"]): (index, info) for index, info in (await database[name].index_information()).items()}
+        result = {"created": [], "missing": [], "extra": [], "conflicts": [], "failed": []}
+        for entry in declared:
+            keys = [tuple(key) for key in entry["keys"]]
+            options = {option: value for option, value in entry.items() if option != "keys"}
+            found = existing.pop(tuple(keys), None)
+            if found:
+                index, info = found
+                if any(info.get(option) != value for option, value in options.items()):
+                    result["conflicts"].append(index)
+                continue
+            if not create:
+                result["missing"].append(index_name(keys))
+                continue
+            try:
+                result["created"].append(await database[name].create_index(keys, background=True, **options))
+            except OperationFailure as e:
+                # Ex.: duplicados já gravados impedem um índice único
+                logger.error(f"Index {name}.{index_name(keys)} failed: {e}")
+                result["failed"].append(index_name(keys))
+        result["extra"] = sorted(index for index, _ in existing.values() if index != "_id_")
+        report[name] = result
+    return report
+
+async def bootstrap_indexes():
+    report = await reconcile_indexes(db, index_spec())
+    for name, result in report.items():
+        if result["created"]:
+            logger.info(f"Created indexes on {name}: {', '.join(result['created'])}")
+        if result["extra"] or result["conflicts"]:
+            logger.warning(f"Undeclared indexes on {name}: {', '.join(result['extra'] + result['conflicts'])}")
+    return report
+
+@contextmanager
+def unique_violation(detail: str):
+    """Um índice único violado (escrita concorrente que passou a verificação) é um 400"""
+    try:
+        yield
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=detail)
 
 # ==================== EQUIPAMENTO ROUTES ====================
 @api_router.get("/equipamentos")
-async def get_equipamentos(user=Depends(get_current_user)):
-    items = await db.equipamentos.find({}, {"_id": 0}).to_list(1000)
-    # Garantir que os campos novos têm valores por defeito
-    for item in items:
-        item.setdefault("em_manutencao", False)
-        item.setdefault("descricao_avaria", "")
-        item.setdefault("manual_url", "")
-        item.setdefault("certificado_url", "")
-        item.setdefault("ficha_manutencao_url", "")
-    return items
+async def get_equipamentos(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                           sort: Optional[str] = None, categoria: Optional[str] = None, ativo: Optional[bool] = None,
+                           obra_id: Optional[str] = None, atribuido: Optional[bool] = None,
+                           em_manutencao: Optional[bool] = None, estado_conservacao: Optional[str] = None,
+                           fields: Optional[str] = None, user=Depends(get_current_user)):
+    query = resource_filters(obra_id, atribuido, em_manutencao, categoria=categoria, ativo=ativo,
+                             estado_conservacao=estado_conservacao)
+    projection = parse_fields("equipamentos", fields)
+    return await paginate_list("equipamentos", limit, cursor, request, response, query, sort, projection)
 
 @api_router.get("/equipamentos/{equipamento_id}")
-async def get_equipamento(equipamento_id: str, user=Depends(get_current_user)):
-    item = await db.equipamentos.find_one({"id": equipamento_id}, {"_id": 0})
+async def get_equipamento(equipamento_id: str, fields: Optional[str] = None, user=Depends(get_current_user)):
+    projection = parse_fields("equipamentos", fields)
+    item = await db.equipamentos.find_one({"id": equipamento_id}, {**projection, "obra_id": 1} if projection else {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Equipamento não encontrado")
     
-    # Garantir que os campos novos têm valores por defeito
-    item.setdefault("em_manutencao", False)
-    item.setdefault("descricao_avaria", "")
-    item.setdefault("manual_url", "")
-    item.setdefault("certificado_url", "")
-    item.setdefault("ficha_manutencao_url", "")
-    
     # Get obra info if assigned
     obra = None
     if item.get("obra_id"):
@@ -440,6 +3229,8 @@ async def get_equipamento(equipamento_id: str, user=Depends(get_current_user)):
                 mov["obra_nome"] = obra_mov.get("nome", "")
                 mov["obra_codigo"] = obra_mov.get("codigo", "")
     
+    if projection:
+        apply_projection([item], projection)
     return {"equipamento": item, "obra_atual": obra, "historico": movimentos}
 
 class ManutencaoUpdate(BaseModel):
@@ -453,8 +3244,13 @@ async def update_equipamento_manutencao(equipamento_id: str, data: ManutencaoUpd
     if not existing:
         raise HTTPException(status_code=404, detail="Equipamento não encontrado")
     
-    update_data = {"em_manutencao": data.em_manutencao, "descricao_avaria": data.descricao_avaria}
+    update_data = {
+        "em_manutencao": data.em_manutencao,
+        "descricao_avaria": data.descricao_avaria,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
     await db.equipamentos.update_one({"id": equipamento_id}, {"$set": update_data})
+    await change_versions.bump("equipamentos")
     
     updated = await db.equipamentos.find_one({"id": equipamento_id}, {"_id": 0})
     return updated
@@ -466,7 +3262,10 @@ async def create_equipamento(data: EquipamentoCreate, user=Depends(get_current_u
         raise HTTPException(status_code=400, detail="Código já existe")
     
     equipamento = Equipamento(**data.model_dump())
-    await db.equipamentos.insert_one(equipamento.model_dump())
+    with unique_violation("Código já existe"):
+        await db.equipamentos.insert_one(equipamento.model_dump())
+    await change_versions.bump("equipamentos")
+    index_document("equipamentos", equipamento.model_dump())
     return equipamento
 
 @api_router.put("/equipamentos/{equipamento_id}")
@@ -475,47 +3274,41 @@ async def update_equipamento(equipamento_id: str, data: EquipamentoCreate, user=
     if not existing:
         raise HTTPException(status_code=404, detail="Equipamento não encontrado")
     
-    await db.equipamentos.update_one({"id": equipamento_id}, {"$set": data.model_dump()})
-    return await db.equipamentos.find_one({"id": equipamento_id}, {"_id": 0})
+    with unique_violation("Código já existe"):
+        await db.equipamentos.update_one({"id": equipamento_id}, {"$set": {**data.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("equipamentos")
+    updated = await db.equipamentos.find_one({"id": equipamento_id}, {"_id": 0})
+    index_document("equipamentos", updated)
+    return updated
 
 @api_router.delete("/equipamentos/{equipamento_id}")
 async def delete_equipamento(equipamento_id: str, user=Depends(get_current_user)):
     result = await db.equipamentos.delete_one({"id": equipamento_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Equipamento não encontrado")
+    await write_tombstone("equipamentos", equipamento_id)
+    await change_versions.bump("equipamentos")
+    unindex_document("equipamentos", equipamento_id)
     return {"message": "Equipamento eliminado"}
 
 # ==================== VIATURA ROUTES ====================
-def set_viatura_defaults(item):
-    """Garantir valores por defeito nos campos novos"""
-    item.setdefault("em_manutencao", False)
-    item.setdefault("descricao_avaria", "")
-    item.setdefault("dua_url", "")
-    item.setdefault("seguro_url", "")
-    item.setdefault("ipo_url", "")
-    item.setdefault("carta_verde_url", "")
-    item.setdefault("manual_url", "")
-    item.setdefault("data_ipo", None)
-    item.setdefault("data_proxima_revisao", None)
-    item.setdefault("kms_atual", 0)
-    item.setdefault("kms_proxima_revisao", 0)
-    return item
-
 @api_router.get("/viaturas")
-async def get_viaturas(user=Depends(get_current_user)):
-    items = await db.viaturas.find({}, {"_id": 0}).to_list(1000)
-    for item in items:
-        set_viatura_defaults(item)
-    return items
+async def get_viaturas(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                       sort: Optional[str] = None, combustivel: Optional[str] = None, ativa: Optional[bool] = None,
+                       obra_id: Optional[str] = None, atribuido: Optional[bool] = None,
+                       em_manutencao: Optional[bool] = None, fields: Optional[str] = None,
+                       user=Depends(get_current_user)):
+    query = resource_filters(obra_id, atribuido, em_manutencao, combustivel=combustivel, ativa=ativa)
+    projection = parse_fields("viaturas", fields)
+    return await paginate_list("viaturas", limit, cursor, request, response, query, sort, projection)
 
 @api_router.get("/viaturas/{viatura_id}")
-async def get_viatura(viatura_id: str, user=Depends(get_current_user)):
-    item = await db.viaturas.find_one({"id": viatura_id}, {"_id": 0})
+async def get_viatura(viatura_id: str, fields: Optional[str] = None, user=Depends(get_current_user)):
+    projection = parse_fields("viaturas", fields)
+    item = await db.viaturas.find_one({"id": viatura_id}, {**projection, "obra_id": 1} if projection else {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Viatura não encontrada")
     
-    set_viatura_defaults(item)
-    
     obra = None
     if item.get("obra_id"):
         obra = await db.obras.find_one({"id": item["obra_id"]}, {"_id": 0})
@@ -541,6 +3334,8 @@ async def get_viatura(viatura_id: str, user=Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
     
+    if projection:
+        apply_projection([item], projection)
     return {
         "viatura": item,
         "obra_atual": obra,
@@ -554,8 +3349,13 @@ async def update_viatura_manutencao(viatura_id: str, data: ManutencaoUpdate, use
     if not existing:
         raise HTTPException(status_code=404, detail="Viatura não encontrada")
     
-    update_data = {"em_manutencao": data.em_manutencao, "descricao_avaria": data.descricao_avaria}
+    update_data = {
+        "em_manutencao": data.em_manutencao,
+        "descricao_avaria": data.descricao_avaria,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
     await db.viaturas.update_one({"id": viatura_id}, {"$set": update_data})
+    await change_versions.bump("viaturas")
     
     updated = await db.viaturas.find_one({"id": viatura_id}, {"_id": 0})
     return updated
@@ -567,7 +3367,10 @@ async def create_viatura(data: ViaturaCreate, user=Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Matrícula já existe")
     
     viatura = Viatura(**data.model_dump())
-    await db.viaturas.insert_one(viatura.model_dump())
+    with unique_violation("Matrícula já existe"):
+        await db.viaturas.insert_one(viatura.model_dump())
+    await change_versions.bump("viaturas")
+    index_document("viaturas", viatura.model_dump())
     return viatura
 
 @api_router.put("/viaturas/{viatura_id}")
@@ -576,20 +3379,28 @@ async def update_viatura(viatura_id: str, data: ViaturaCreate, user=Depends(get_
     if not existing:
         raise HTTPException(status_code=404, detail="Viatura não encontrada")
     
-    await db.viaturas.update_one({"id": viatura_id}, {"$set": data.model_dump()})
-    return await db.viaturas.find_one({"id": viatura_id}, {"_id": 0})
+    with unique_violation("Matrícula já existe"):
+        await db.viaturas.update_one({"id": viatura_id}, {"$set": {**data.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("viaturas")
+    updated = await db.viaturas.find_one({"id": viatura_id}, {"_id": 0})
+    index_document("viaturas", updated)
+    return updated
 
 @api_router.delete("/viaturas/{viatura_id}")
 async def delete_viatura(viatura_id: str, user=Depends(get_current_user)):
     result = await db.viaturas.delete_one({"id": viatura_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Viatura não encontrada")
+    await write_tombstone("viaturas", viatura_id)
+    await change_versions.bump("viaturas")
+    unindex_document("viaturas", viatura_id)
     return {"message": "Viatura eliminada"}
 
 # ==================== MATERIAL ROUTES ====================
 @api_router.get("/materiais")
-async def get_materiais(user=Depends(get_current_user)):
-    return await db.materiais.find({}, {"_id": 0}).to_list(1000)
+async def get_materiais(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                        fields: Optional[str] = None, user=Depends(get_current_user)):
+    return await paginate_list("materiais", limit, cursor, request, response, projection=parse_fields("materiais", fields))
 
 @api_router.post("/materiais")
 async def create_material(data: MaterialCreate, user=Depends(get_current_user)):
@@ -598,7 +3409,10 @@ async def create_material(data: MaterialCreate, user=Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Código já existe")
     
     material = Material(**data.model_dump())
-    await db.materiais.insert_one(material.model_dump())
+    with unique_violation("Código já existe"):
+        await db.materiais.insert_one(material.model_dump())
+    await change_versions.bump("materiais")
+    index_document("materiais", material.model_dump())
     return material
 
 @api_router.put("/materiais/{material_id}")
@@ -607,13 +3421,17 @@ async def update_material(material_id: str, data: MaterialCreate, user=Depends(g
     if not existing:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     
-    await db.materiais.update_one({"id": material_id}, {"$set": data.model_dump()})
-    return await db.materiais.find_one({"id": material_id}, {"_id": 0})
+    with unique_violation("Código já existe"):
+        await db.materiais.update_one({"id": material_id}, {"$set": {**data.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("materiais")
+    updated = await db.materiais.find_one({"id": material_id}, {"_id": 0})
+    index_document("materiais", updated)
+    return updated
 
 @api_router.get("/materiais/{material_id}")
-async def get_material_detail(material_id: str, user=Depends(get_current_user)):
+async def get_material_detail(material_id: str, fields: Optional[str] = None, user=Depends(get_current_user)):
     """Get material with movement history"""
-    material = await db.materiais.find_one({"id": material_id}, {"_id": 0})
+    material = await db.materiais.find_one({"id": material_id}, parse_fields("materiais", fields) or {"_id": 0})
     if not material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     
@@ -630,16 +3448,20 @@ async def delete_material(material_id: str, user=Depends(get_current_user)):
     result = await db.materiais.delete_one({"id": material_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Material não encontrado")
+    await write_tombstone("materiais", material_id)
+    await change_versions.bump("materiais")
+    unindex_document("materiais", material_id)
     return {"message": "Material eliminado"}
 
 # ==================== OBRA ROUTES ====================
 @api_router.get("/obras")
-async def get_obras(user=Depends(get_current_user)):
-    return await db.obras.find({}, {"_id": 0}).to_list(1000)
+async def get_obras(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                    fields: Optional[str] = None, user=Depends(get_current_user)):
+    return await paginate_list("obras", limit, cursor, request, response, projection=parse_fields("obras", fields))
 
 @api_router.get("/obras/{obra_id}")
-async def get_obra(obra_id: str, user=Depends(get_current_user)):
-    obra = await db.obras.find_one({"id": obra_id}, {"_id": 0})
+async def get_obra(obra_id: str, fields: Optional[str] = None, user=Depends(get_current_user)):
+    obra = await db.obras.find_one({"id": obra_id}, parse_fields("obras", fields) or {"_id": 0})
     if not obra:
         raise HTTPException(status_code=404, detail="Obra não encontrada")
     
@@ -655,7 +3477,10 @@ async def create_obra(data: ObraCreate, user=Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Código já existe")
     
     obra = Obra(**data.model_dump())
-    await db.obras.insert_one(obra.model_dump())
+    with unique_violation("Código já existe"):
+        await db.obras.insert_one(obra.model_dump())
+    await change_versions.bump("obras")
+    index_document("obras", obra.model_dump())
     return obra
 
 @api_router.put("/obras/{obra_id}")
@@ -664,18 +3489,26 @@ async def update_obra(obra_id: str, data: ObraCreate, user=Depends(get_current_u
     if not existing:
         raise HTTPException(status_code=404, detail="Obra não encontrada")
     
-    await db.obras.update_one({"id": obra_id}, {"$set": data.model_dump()})
-    return await db.obras.find_one({"id": obra_id}, {"_id": 0})
+    with unique_violation("Código já existe"):
+        await db.obras.update_one({"id": obra_id}, {"$set": {**data.model_dump(), "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("obras")
+    updated = await db.obras.find_one({"id": obra_id}, {"_id": 0})
+    index_document("obras", updated)
+    return updated
 
 @api_router.delete("/obras/{obra_id}")
 async def delete_obra(obra_id: str, user=Depends(get_current_user)):
     result = await db.obras.delete_one({"id": obra_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Obra não encontrada")
+    await write_tombstone("obras", obra_id)
+    unindex_document("obras", obra_id)
     
     # Remove obra association from resources
-    await db.equipamentos.update_many({"obra_id": obra_id}, {"$set": {"obra_id": None}})
-    await db.viaturas.update_many({"obra_id": obra_id}, {"$set": {"obra_id": None}})
+    released = {"obra_id": None, "updated_at": datetime.now(timezone.utc).isoformat()}
+    await db.equipamentos.update_many({"obra_id": obra_id}, {"$set": released})
+    await db.viaturas.update_many({"obra_id": obra_id}, {"$set": released})
+    await change_versions.bump("obras", "equipamentos", "viaturas")
     return {"message": "Obra eliminada"}
 
 # ==================== MOVIMENTO (Atribuição) ROUTES ====================
@@ -709,7 +3542,8 @@ async def atribuir_recurso(data: AtribuirRecursoRequest, user=Depends(get_curren
     await db.movimentos.insert_one(movimento.model_dump())
     
     # Update resource
-    await collection.update_one({"id": data.recurso_id}, {"$set": {"obra_id": data.obra_id}})
+    await collection.update_one({"id": data.recurso_id}, {"$set": {"obra_id": data.obra_id, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("movimentos", collection.name)
     
     return {"message": "Recurso atribuído com sucesso", "movimento_id": movimento.id}
 
@@ -735,18 +3569,21 @@ async def devolver_recurso(data: DevolverRecursoRequest, user=Depends(get_curren
     await db.movimentos.insert_one(movimento.model_dump())
     
     # Remove obra association
-    await collection.update_one({"id": data.recurso_id}, {"$set": {"obra_id": None}})
+    await collection.update_one({"id": data.recurso_id}, {"$set": {"obra_id": None, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await change_versions.bump("movimentos", collection.name)
     
     return {"message": "Recurso devolvido com sucesso", "movimento_id": movimento.id}
 
 @api_router.get("/movimentos")
-async def get_movimentos(user=Depends(get_current_user)):
-    return await db.movimentos.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+async def get_movimentos(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                         fields: Optional[str] = None, user=Depends(get_current_user)):
+    return await paginate_list("movimentos", limit, cursor, request, response, projection=parse_fields("movimentos", fields))
 
 # ==================== MOVIMENTO STOCK ROUTES ====================
 @api_router.get("/movimentos/stock")
-async def get_movimentos_stock(user=Depends(get_current_user)):
-    return await db.movimentos_stock.find({}, {"_id": 0}).to_list(1000)
+async def get_movimentos_stock(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                               fields: Optional[str] = None, user=Depends(get_current_user)):
+    return await paginate_list("movimentos_stock", limit, cursor, request, response, projection=parse_fields("movimentos_stock", fields))
 
 @api_router.post("/movimentos/stock")
 async def create_movimento_stock(data: MovimentoStockCreate, user=Depends(get_current_user)):
@@ -760,19 +3597,25 @@ async def create_movimento_stock(data: MovimentoStockCreate, user=Depends(get_cu
             new_stock += data.quantidade
         else:
             new_stock -= data.quantidade
-        await db.materiais.update_one({"id": data.material_id}, {"$set": {"stock_atual": new_stock}})
+        await db.materiais.update_one({"id": data.material_id}, {"$set": {
+            "stock_atual": new_stock,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }})
+    await change_versions.bump("movimentos_stock", "materiais")
     
     return movimento
 
 # ==================== MOVIMENTO VIATURA ROUTES ====================
 @api_router.get("/movimentos/viaturas")
-async def get_movimentos_viaturas(user=Depends(get_current_user)):
-    return await db.movimentos_viaturas.find({}, {"_id": 0}).to_list(1000)
+async def get_movimentos_viaturas(request: Request, response: Response, limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                                  fields: Optional[str] = None, user=Depends(get_current_user)):
+    return await paginate_list("movimentos_viaturas", limit, cursor, request, response, projection=parse_fields("movimentos_viaturas", fields))
 
 @api_router.post("/movimentos/viaturas")
 async def create_movimento_viatura(data: MovimentoViaturaCreate, user=Depends(get_current_user)):
     movimento = MovimentoViatura(**data.model_dump())
     await db.movimentos_viaturas.insert_one(movimento.model_dump())
+    await change_versions.bump("movimentos_viaturas")
     return movimento
 
 # ==================== ALERTS ROUTES ====================
@@ -833,114 +3676,135 @@ async def import_excel(file: UploadFile = File(...), user=Depends(get_current_us
     content = await file.read()
     wb = load_workbook(BytesIO(content))
     imported = {"equipamentos": 0, "viaturas": 0, "materiais": 0, "obras": 0}
-    
-    # Import Equipamentos
-    if "Equipamentos" in wb.sheetnames or "Equipamento" in wb.sheetnames:
-        ws = wb["Equipamentos"] if "Equipamentos" in wb.sheetnames else wb["Equipamento"]
-        headers = [cell.value for cell in ws[1]]
+    # Um só bump por coleção no fim, mesmo que uma linha rebente a meio
+    try:
+        # Import Equipamentos
+        if "Equipamentos" in wb.sheetnames or "Equipamento" in wb.sheetnames:
+            ws = wb["Equipamentos"] if "Equipamentos" in wb.sheetnames else wb["Equipamento"]
+            headers = [cell.value for cell in ws[1]]
         
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row[0]:
-                continue
-            data = dict(zip(headers, row))
-            codigo = str(data.get("Codigo", data.get("codigo", data.get("Código", ""))))
-            if not codigo:
-                continue
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                if not row[0]:
+                    continue
+                data = dict(zip(headers, row))
+                codigo = str(data.get("Codigo", data.get("codigo", data.get("Código", ""))))
+                if not codigo:
+                    continue
             
-            existing = await db.equipamentos.find_one({"codigo": codigo})
-            if existing:
-                continue
+                existing = await db.equipamentos.find_one({"codigo": codigo})
+                if existing:
+                    continue
             
-            equipamento = Equipamento(
-                codigo=codigo,
-                descricao=str(data.get("Descricao", data.get("descricao", data.get("Descrição", "")))),
-                marca=str(data.get("Marca", data.get("marca", "")) or ""),
-                modelo=str(data.get("Modelo", data.get("modelo", "")) or ""),
-                categoria=str(data.get("Categoria", data.get("categoria", "")) or ""),
-                numero_serie=str(data.get("Numero_Serie", data.get("numero_serie", data.get("Nº Série", ""))) or ""),
-                estado_conservacao=str(data.get("Estado_Conservacao", data.get("estado_conservacao", data.get("Estado", "Bom"))) or "Bom"),
-                ativo=str(data.get("Ativo", data.get("ativo", "Sim"))).lower() in ["sim", "true", "1", "yes"]
-            )
-            await db.equipamentos.insert_one(equipamento.model_dump())
-            imported["equipamentos"] += 1
+                equipamento = Equipamento(
+                    codigo=codigo,
+                    descricao=str(data.get("Descricao", data.get("descricao", data.get("Descrição", "")))),
+                    marca=str(data.get("Marca", data.get("marca", "")) or ""),
+                    modelo=str(data.get("Modelo", data.get("modelo", "")) or ""),
+                    categoria=str(data.get("Categoria", data.get("categoria", "")) or ""),
+                    numero_serie=str(data.get("Numero_Serie", data.get("numero_serie", data.get("Nº Série", ""))) or ""),
+                    estado_conservacao=str(data.get("Estado_Conservacao", data.get("estado_conservacao", data.get("Estado", "Bom"))) or "Bom"),
+                    ativo=str(data.get("Ativo", data.get("ativo", "Sim"))).lower() in ["sim", "true", "1", "yes"]
+                )
+                try:
+                    await db.equipamentos.insert_one(equipamento.model_dump())
+                except DuplicateKeyError:
+                    continue
+                index_document("equipamentos", equipamento.model_dump())
+                imported["equipamentos"] += 1
     
-    # Import Viaturas
-    if "Viaturas" in wb.sheetnames or "Viatura" in wb.sheetnames:
-        ws = wb["Viaturas"] if "Viaturas" in wb.sheetnames else wb["Viatura"]
-        headers = [cell.value for cell in ws[1]]
+        # Import Viaturas
+        if "Viaturas" in wb.sheetnames or "Viatura" in wb.sheetnames:
+            ws = wb["Viaturas"] if "Viaturas" in wb.sheetnames else wb["Viatura"]
+            headers = [cell.value for cell in ws[1]]
         
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row[0]:
-                continue
-            data = dict(zip(headers, row))
-            matricula = str(data.get("Matricula", data.get("matricula", data.get("Matrícula", ""))))
-            if not matricula:
-                continue
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                if not row[0]:
+                    continue
+                data = dict(zip(headers, row))
+                matricula = str(data.get("Matricula", data.get("matricula", data.get("Matrícula", ""))))
+                if not matricula:
+                    continue
             
-            existing = await db.viaturas.find_one({"matricula": matricula})
-            if existing:
-                continue
+                existing = await db.viaturas.find_one({"matricula": matricula})
+                if existing:
+                    continue
             
-            viatura = Viatura(
-                matricula=matricula,
-                marca=str(data.get("Marca", data.get("marca", "")) or ""),
-                modelo=str(data.get("Modelo", data.get("modelo", "")) or ""),
-                combustivel=str(data.get("Combustivel", data.get("combustivel", data.get("Combustível", "Gasoleo"))) or "Gasoleo"),
-                ativa=str(data.get("Ativa", data.get("ativa", "Sim"))).lower() in ["sim", "true", "1", "yes"]
-            )
-            await db.viaturas.insert_one(viatura.model_dump())
-            imported["viaturas"] += 1
+                viatura = Viatura(
+                    matricula=matricula,
+                    marca=str(data.get("Marca", data.get("marca", "")) or ""),
+                    modelo=str(data.get("Modelo", data.get("modelo", "")) or ""),
+                    combustivel=str(data.get("Combustivel", data.get("combustivel", data.get("Combustível", "Gasoleo"))) or "Gasoleo"),
+                    ativa=str(data.get("Ativa", data.get("ativa", "Sim"))).lower() in ["sim", "true", "1", "yes"]
+                )
+                try:
+                    await db.viaturas.insert_one(viatura.model_dump())
+                except DuplicateKeyError:
+                    continue
+                index_document("viaturas", viatura.model_dump())
+                imported["viaturas"] += 1
     
-    # Import Materiais
-    if "Materiais" in wb.sheetnames or "Material" in wb.sheetnames:
-        ws = wb["Materiais"] if "Materiais" in wb.sheetnames else wb["Material"]
-        headers = [cell.value for cell in ws[1]]
+        # Import Materiais
+        if "Materiais" in wb.sheetnames or "Material" in wb.sheetnames:
+            ws = wb["Materiais"] if "Materiais" in wb.sheetnames else wb["Material"]
+            headers = [cell.value for cell in ws[1]]
         
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row[0]:
-                continue
-            data = dict(zip(headers, row))
-            codigo = str(data.get("Codigo", data.get("codigo", data.get("Código", "")))  or data.get("ID_Material", ""))
-            if not codigo:
-                continue
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                if not row[0]:
+                    continue
+                data = dict(zip(headers, row))
+                codigo = str(data.get("Codigo", data.get("codigo", data.get("Código", "")))  or data.get("ID_Material", ""))
+                if not codigo:
+                    continue
             
-            existing = await db.materiais.find_one({"codigo": codigo})
-            if existing:
-                continue
+                existing = await db.materiais.find_one({"codigo": codigo})
+                if existing:
+                    continue
             
-            material = Material(
-                codigo=codigo,
-                descricao=str(data.get("Descricao", data.get("descricao", data.get("Descrição", ""))) or ""),
-                unidade=str(data.get("Unidade", data.get("unidade", "unidade")) or "unidade"),
-                stock_minimo=float(data.get("Stock_Minimo", data.get("stock_minimo", 0)) or 0)
-            )
-            await db.materiais.insert_one(material.model_dump())
-            imported["materiais"] += 1
+                material = Material(
+                    codigo=codigo,
+                    descricao=str(data.get("Descricao", data.get("descricao", data.get("Descrição", ""))) or ""),
+                    unidade=str(data.get("Unidade", data.get("unidade", "unidade")) or "unidade"),
+                    stock_minimo=float(data.get("Stock_Minimo", data.get("stock_minimo", 0)) or 0)
+                )
+                try:
+                    await db.materiais.insert_one(material.model_dump())
+                except DuplicateKeyError:
+                    continue
+                index_document("materiais", material.model_dump())
+                imported["materiais"] += 1
     
-    # Import Obras
-    if "Obras" in wb.sheetnames or "Obra" in wb.sheetnames:
-        ws = wb["Obras"] if "Obras" in wb.sheetnames else wb["Obra"]
-        headers = [cell.value for cell in ws[1]]
+        # Import Obras
+        if "Obras" in wb.sheetnames or "Obra" in wb.sheetnames:
+            ws = wb["Obras"] if "Obras" in wb.sheetnames else wb["Obra"]
+            headers = [cell.value for cell in ws[1]]
         
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if not row[0]:
-                continue
-            data = dict(zip(headers, row))
-            codigo = str(data.get("Codigo", data.get("codigo", data.get("ID_Obra", ""))))
-            if not codigo:
-                continue
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                if not row[0]:
+                    continue
+                data = dict(zip(headers, row))
+                codigo = str(data.get("Codigo", data.get("codigo", data.get("ID_Obra", ""))))
+                if not codigo:
+                    continue
             
-            existing = await db.obras.find_one({"codigo": codigo})
-            if existing:
-                continue
+                existing = await db.obras.find_one({"codigo": codigo})
+                if existing:
+                    continue
             
-            obra = Obra(
-                codigo=codigo,
-                nome=str(data.get("Nome", data.get("nome", "")) or ""),
-                estado=str(data.get("Estado", data.get("estado", "Ativa")) or "Ativa")
-            )
-            await db.obras.insert_one(obra.model_dump())
-            imported["obras"] += 1
+                obra = Obra(
+                    codigo=codigo,
+                    nome=str(data.get("Nome", data.get("nome", "")) or ""),
+                    estado=str(data.get("Estado", data.get("estado", "Ativa")) or "Ativa")
+                )
+                try:
+                    await db.obras.insert_one(obra.model_dump())
+                except DuplicateKeyError:
+                    continue
+                index_document("obras", obra.model_dump())
+                imported["obras"] += 1
+    finally:
+        touched = [name for name, count in imported.items() if count]
+        if touched:
+            await change_versions.bump(*touched)
     
     return {"message": "Importação concluída", "imported": imported}
 
@@ -1361,7 +4225,6 @@ async def get_relatorio_manutencoes(
     if not tipo_recurso or tipo_recurso == "viatura":
         viaturas = await db.viaturas.find({"em_manutencao": True}, {"_id": 0}).to_list(1000)
         for v in viaturas:
-            set_viatura_defaults(v)
             v["tipo"] = "viatura"
             viaturas_manutencao.append(v)
     
@@ -1389,8 +4252,6 @@ async def get_relatorio_alertas(
         viaturas = await db.viaturas.find({"ativa": True}, {"_id": 0}).to_list(1000)
         
         for v in viaturas:
-            set_viatura_defaults(v)
-            
             # Verificar datas de expiração
             campos_data = [
                 ("data_seguro", "Seguro"),
@@ -1475,8 +4336,6 @@ async def get_relatorio_utilizacao(
         equipamentos = await db.equipamentos.find(query_eq, {"_id": 0}).to_list(1000)
         
         for eq in equipamentos:
-            eq.setdefault("em_manutencao", False)
-            
             # Contar movimentos
             mov_query = {"recurso_id": eq["id"], "tipo_recurso": "equipamento"}
             if data_inicio and data_fim:
@@ -1515,8 +4374,6 @@ async def get_relatorio_utilizacao(
         viaturas = await db.viaturas.find(query_vt, {"_id": 0}).to_list(1000)
         
         for v in viaturas:
-            set_viatura_defaults(v)
-            
             # Contar movimentos
             mov_query = {"recurso_id": v["id"], "tipo_recurso": "viatura"}
             if data_inicio and data_fim:
@@ -1570,6 +4427,34 @@ async def get_relatorio_utilizacao(
         }
     }
 
+# ==================== MÉTRICAS ====================
+@api_router.get("/metrics")
+async def get_metrics(user=Depends(get_current_user)):
+    """Contadores internos do processo (caches, pools)"""
+    return {
+        "user_cache": user_cache.stats(),
+        "token_version_cache": token_version_cache.stats(),
+        "hash_pool": hash_pool.stats(),
+        "revoked_tokens": revocation_list.stats(),
+        "image_derivatives": derivative_cache.stats(),
+        "image_normalization": {
+            "enabled": IMAGE_NORMALIZE,
+            "format": IMAGE_NORMALIZE_FORMAT,
+            "keep_original": IMAGE_KEEP_ORIGINAL
+        },
+        "hot_files": hot_file_cache.stats(),
+        "upload_storage": upload_storage.name,
+        "pdf_pipeline": pdf_pipeline.stats(),
+        "upload_gc": upload_gc.stats(),
+        "search_index": search_index.stats(),
+        "autocomplete": autocomplete_index.stats(),
+        "change_versions": change_versions.stats(),
+        "login_throttle": {
+            "ip": login_ip_limiter.stats(),
+            "email": login_email_limiter.stats()
+        }
+    }
+
 @api_router.get("/")
 async def root():
     return {"message": "José Firmino - API de Gestão de Armazém"}
@@ -1582,8 +4467,79 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+@app.on_event("startup")
+async def startup_migrations():
+    # Antes das restantes: as leituras já não completam documentos antigos
+    if MIGRATIONS_ON_STARTUP and await migration_runner.run():
+        # Documentos reescritos: os ETags emitidos antes deixam de valer
+        await change_versions.bump(*LIST_SORT_KEYS)
+
+@app.on_event("startup")
+async def startup_indexes():
+    # Em segundo plano: construir índices numa coleção grande não atrasa o arranque
+    if INDEXES_ON_STARTUP:
+        app.state.index_task = asyncio.create_task(bootstrap_indexes())
+
+@app.on_event("startup")
+async def startup_auth():
+    await revocation_list.sync()
+    app.state.revocation_task = asyncio.create_task(revocation_sync_loop())
+
+@app.on_event("startup")
+async def startup_lists():
+    for index in mirrored_indexes:
+        await index.rebuild(db)
+    app.state.search_task = asyncio.create_task(search_refresh_loop())
+
+@app.on_event("startup")
+async def startup_uploads():
+    await asyncio.to_thread(derivative_cache.load)
+    await pdf_pipeline.start()
+    app.state.upload_session_task = asyncio.create_task(upload_session_loop())
+    if UPLOAD_GC_ENABLED:
+        app.state.upload_gc_task = asyncio.create_task(upload_gc_loop())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for name in ("index_task", "revocation_task", "upload_gc_task", "upload_session_task", "search_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
     client.close()
+    hash_pool.shutdown()
+    image_pool.shutdown()
+    pdf_pipeline.shutdown()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tarefas de manutenção da base de dados")
+    parser.add_argument("command", choices=["migrate", "migrate-status", "indexes", "indexes-status", "upload-gc"])
+    args = parser.parse_args()
+
+    async def main():
+        if args.command == "upload-gc":
+            # Uma passagem completa, mesmo com o loop em background desligado
+            print(await upload_gc.run_pass())
+            return
+        if args.command.startswith("indexes"):
+            report = await reconcile_indexes(db, index_spec(), create=args.command == "indexes")
+            for name, result in report.items():
+                for status, indexes in result.items():
+                    for index in indexes:
+                        print(f"{name}.{index}: {status}")
+            return
+        if args.command == "migrate":
+            applied = await migration_runner.run()
+            for entry in applied:
+                print(f"{entry['version']} {entry['name']}: {entry['documents']} documentos")
+            if applied:
+                await change_versions.bump(*LIST_SORT_KEYS)
+        print(f"Versão do esquema: {await migration_runner.version()}")
+        for version, migration in await migration_runner.pending():
+            print(f"Pendente: {version} {migration.__name__}")
+
+    asyncio.run(main())
@@ -0,0 +1,12 @@
+"""
+Shared setup for the backend tests: server.py reads its settings at import time,
+so the unit tests need these defaults and the backend directory on sys.path.
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,63 @@
+"""
+Test in-process authenticated user cache
+- GET /api/auth/me keeps working when served from the user cache
+- GET /api/metrics exposes user_cache hit/miss counters
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUserCache(TestAuth):
+    """Test user cache behaviour and metrics"""
+
+    def test_metrics_exposes_user_cache(self, headers):
+        """Test /api/metrics returns user cache counters"""
+        response = requests.get(f"{BASE_URL}/api/metrics", headers=headers)
+        assert response.status_code == 200, f"Metrics failed: {response.text}"
+        stats = response.json()["user_cache"]
+        for key in ["size", "maxsize", "ttl", "hits", "misses", "evictions", "hit_ratio"]:
+            assert key in stats, f"Missing '{key}' in user_cache stats"
+        print(f"✓ User cache stats: {stats}")
+
+    def test_repeated_requests_succeed(self, headers):
+        """Test repeated authenticated requests keep returning the same user"""
+        ids = set()
+        for _ in range(3):
+            response = requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+            assert response.status_code == 200
+            ids.add(response.json()["id"])
+        assert len(ids) == 1, "Cached user should be stable across requests"
+        print("✓ Repeated /auth/me requests return the same user")
+
+    def test_me_does_not_expose_password(self, headers):
+        """Test cached user does not leak the password hash"""
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+        assert response.status_code == 200
+        assert "password" not in response.json()
+        print("✓ /auth/me does not expose password")
+
+    def test_invalid_token_rejected(self):
+        """Test invalid tokens are still rejected"""
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers={"Authorization": "Bearer invalid"})
+        assert response.status_code == 401
+        print("✓ Invalid token rejected")
@@ -0,0 +1,94 @@
+"""
+Test self-contained JWT claims and token-version revocation
+- Tokens carry sub, name, email and ver claims
+- POST /api/auth/logout revokes existing tokens
+- POST /api/auth/change-password revokes old tokens and returns a new one
+"""
+import base64
+import json
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def decode_claims(token):
+    """Read JWT payload without verifying the signature"""
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))
+
+
+class TestTokenClaims:
+    """Test claims and revocation with a dedicated user"""
+
+    @pytest.fixture
+    def new_user(self):
+        email = f"TEST_tokens_{uuid.uuid4().hex[:8]}@test.com"
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "name": "Token Tester",
+            "email": email,
+            "password": "original123"
+        })
+        assert response.status_code == 200, f"Register failed: {response.text}"
+        return {"email": email, "token": response.json()["access_token"]}
+
+    def test_token_contains_claims(self, new_user):
+        """Test token carries name, email and version"""
+        claims = decode_claims(new_user["token"])
+        assert claims["email"] == new_user["email"]
+        assert claims["name"] == "Token Tester"
+        assert claims["ver"] == 0
+        assert "sub" in claims and "exp" in claims
+        print(f"✓ Token claims: {sorted(claims)}")
+
+    def test_me_from_claims(self, new_user):
+        """Test /auth/me returns the user described by the token"""
+        headers = {"Authorization": f"Bearer {new_user['token']}"}
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["email"] == new_user["email"]
+        print("✓ /auth/me served from token claims")
+
+    def test_logout_revokes_token(self, new_user):
+        """Test logout makes the current token invalid"""
+        headers = {"Authorization": f"Bearer {new_user['token']}"}
+        response = requests.post(f"{BASE_URL}/api/auth/logout", headers=headers)
+        assert response.status_code == 200
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Token revoked"
+        print("✓ Logout revoked token")
+
+    def test_change_password(self, new_user):
+        """Test password change revokes old tokens and issues a new one"""
+        headers = {"Authorization": f"Bearer {new_user['token']}"}
+        response = requests.post(f"{BASE_URL}/api/auth/change-password", headers=headers, json={
+            "current_password": "original123",
+            "new_password": "changed456"
+        })
+        assert response.status_code == 200, f"Change password failed: {response.text}"
+        new_token = response.json()["access_token"]
+        assert decode_claims(new_token)["ver"] == 1
+
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=headers).status_code == 401
+        new_headers = {"Authorization": f"Bearer {new_token}"}
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=new_headers).status_code == 200
+
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": new_user["email"], "password": "changed456"
+        })
+        assert response.status_code == 200
+        print("✓ Password changed and old token revoked")
+
+    def test_change_password_wrong_current(self, new_user):
+        """Test password change requires the current password"""
+        headers = {"Authorization": f"Bearer {new_user['token']}"}
+        response = requests.post(f"{BASE_URL}/api/auth/change-password", headers=headers, json={
+            "current_password": "wrong",
+            "new_password": "changed456"
+        })
+        assert response.status_code == 401
+        print("✓ Wrong current password rejected")
@@ -0,0 +1,154 @@
+"""
+Test prefix autocomplete for equipment codes and license plates
+- GET /api/autocomplete?q= matches regardless of case and separators ("AA-00-BB" == "aa00bb")
+- new, renamed and deleted resources are reflected immediately
+- PrefixIndex ordering, limits and keystroke latency on ~20k keys (unit)
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+import requests
+
+from server import AUTOCOMPLETE_FIELDS, PrefixIndex, compact_key
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestAutocompleteEndpoint(TestAuth):
+    """Test /api/autocomplete against live data"""
+
+    @pytest.fixture(scope="class")
+    def viatura(self, headers):
+        tag = uuid.uuid4().hex[:4].upper()
+        response = requests.post(f"{BASE_URL}/api/viaturas", json={
+            "matricula": f"QX-{tag}-ZW",
+            "marca": "Toyota",
+            "modelo": "Hilux"
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        viatura = response.json()
+        yield viatura
+        requests.delete(f"{BASE_URL}/api/viaturas/{viatura['id']}", headers=headers)
+
+    def complete(self, headers, **params):
+        response = requests.get(f"{BASE_URL}/api/autocomplete", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()["results"]
+
+    def test_plate_ignores_case_and_separators(self, headers, viatura):
+        """Test "qx<tag>" and "QX-<tag>" both complete the plate"""
+        tag = viatura["matricula"].split("-")[1]
+        for q in [f"qx{tag.lower()}", f"QX-{tag}", f"qx {tag[:2]}"]:
+            results = self.complete(headers, q=q, tipo="viatura")
+            assert viatura["id"] in [r["id"] for r in results], q
+        result = next(r for r in results if r["id"] == viatura["id"])
+        assert result["matricula"] == viatura["matricula"]
+        assert result["marca"] == "Toyota"
+        print("✓ Plate completed regardless of case and separators")
+
+    def test_equipment_code_lifecycle(self, headers):
+        """Test codes appear on create, move on rename and vanish on delete"""
+        tag = uuid.uuid4().hex[:6]
+        equipamento = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"AC-{tag}", "descricao": "Rebarbadora"
+        }, headers=headers).json()
+        assert [r["id"] for r in self.complete(headers, q=f"ac{tag}")] == [equipamento["id"]]
+
+        requests.put(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", json={
+            "codigo": f"AD-{tag}", "descricao": "Rebarbadora"
+        }, headers=headers)
+        assert not self.complete(headers, q=f"ac{tag}")
+        assert [r["codigo"] for r in self.complete(headers, q=f"ad-{tag}")] == [f"AD-{tag}"]
+
+        requests.delete(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", headers=headers)
+        assert not self.complete(headers, q=f"ad{tag}")
+        print("✓ Index follows writes")
+
+    def test_tipo_outside_autocomplete_rejected(self, headers):
+        """Test tipos without an autocomplete key are rejected"""
+        response = requests.get(f"{BASE_URL}/api/autocomplete", params={"q": "a", "tipo": "material"},
+                                headers=headers)
+        assert response.status_code == 400
+        print("✓ Unsupported tipo rejected")
+
+
+def make_index(docs):
+    index = PrefixIndex(AUTOCOMPLETE_FIELDS)
+    for name, doc in docs:
+        index.put(name, doc)
+    return index
+
+
+class TestPrefixIndex:
+    """Unit tests for the sorted-array prefix index"""
+
+    def test_compact_key(self):
+        assert compact_key("AA-00-BB") == compact_key("aa00bb") == compact_key(" aa 00.bb ") == "aa00bb"
+
+    def test_ordered_and_limited(self):
+        index = make_index([
+            ("viaturas", {"id": "v2", "matricula": "12-AB-34"}),
+            ("viaturas", {"id": "v1", "matricula": "12-AA-99"}),
+            ("equipamentos", {"id": "e1", "codigo": "12A-X", "descricao": "Serra"}),
+            ("viaturas", {"id": "v3", "matricula": "13-AA-00"}),
+        ])
+        # Ordem das chaves normalizadas: 12aa99 < 12ab34 < 12ax
+        assert [r["id"] for r in index.complete("12a")] == ["v1", "v2", "e1"]
+        assert [r["id"] for r in index.complete("12a", limit=2)] == ["v1", "v2"]
+        assert [r["id"] for r in index.complete("12a", {"viaturas"})] == ["v1", "v2"]
+        assert index.complete("--") == []
+
+    def test_ignores_other_collections(self):
+        index = make_index([("materiais", {"id": "m1", "codigo": "MAT-1"})])
+        assert index.complete("mat") == []
+
+    def test_rebuild(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        database = mongomock_motor.AsyncMongoMockClient()["autocomplete"]
+
+        async def scenario():
+            await database.viaturas.insert_many([
+                {"id": "v1", "matricula": "BB-11-CC"}, {"id": "v2", "matricula": "AA-11-CC"}
+            ])
+            index = PrefixIndex(AUTOCOMPLETE_FIELDS)
+            await index.rebuild(database)
+            return index
+
+        index = asyncio.run(scenario())
+        assert [r["id"] for r in index.complete("")] == []
+        assert [r["matricula"] for r in index.complete("a")] == ["AA-11-CC"]
+        assert index.stats()["keys"]["viaturas"] == 2
+
+    def test_keystroke_latency(self):
+        docs = [("equipamentos", {"id": f"e{i}", "codigo": f"EQ-{i:05d}"}) for i in range(15000)]
+        docs += [("viaturas", {"id": f"v{i}", "matricula": f"{i % 90 + 10:02d}-{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}-{i % 100:02d}"})
+                 for i in range(5000)]
+        index = make_index(docs)
+        typed = "EQ-0123"
+        start = time.perf_counter()
+        for _ in range(50):
+            for n in range(1, len(typed) + 1):
+                index.complete(typed[:n])
+        per_key_ms = (time.perf_counter() - start) * 1000 / (50 * len(typed))
+        print(f"✓ {per_key_ms:.3f} ms per keystroke over {len(docs)} keys")
+        assert per_key_ms < 5
@@ -0,0 +1,126 @@
+"""
+Test ?fields= projection on list and detail endpoints
+- explicit field lists and named presets ("picker", "table") trim the response
+- id is always returned, defaults are not re-added and cursor paging still works
+- unknown fields and presets are rejected
+- parse_fields builds the Mongo projection from the model whitelist (unit)
+"""
+import os
+import uuid
+
+import pytest
+import requests
+
+from fastapi import HTTPException
+
+from server import PROJECTION_PRESETS, parse_fields
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestFieldProjection(TestAuth):
+    """Test fields= on live routes"""
+
+    @pytest.fixture(scope="class")
+    def equipamentos(self, headers):
+        categoria = f"TEST_PROJ_{uuid.uuid4().hex[:8]}"
+        ids = []
+        for i in range(3):
+            response = requests.post(f"{BASE_URL}/api/equipamentos", json={
+                "codigo": f"{categoria}_{i}",
+                "descricao": "Equipamento projeção",
+                "categoria": categoria,
+                "descricao_avaria": "texto longo " * 50,
+                "manual_url": "/api/uploads/manual.pdf"
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["id"])
+        yield {"categoria": categoria, "ids": ids}
+        for item_id in ids:
+            requests.delete(f"{BASE_URL}/api/equipamentos/{item_id}", headers=headers)
+
+    def test_picker_preset(self, headers, equipamentos):
+        """Test fields=picker returns only the picker fields"""
+        response = requests.get(f"{BASE_URL}/api/equipamentos", params={
+            "categoria": equipamentos["categoria"], "fields": "picker"
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        items = response.json()
+        assert len(items) == 3
+        expected = {"id", *PROJECTION_PRESETS["equipamentos"]["picker"]}
+        for item in items:
+            assert set(item) == expected
+        print(f"✓ Picker fields: {sorted(expected)}")
+
+    def test_explicit_fields_with_paging(self, headers, equipamentos):
+        """Test an explicit list keeps paging by cursor without leaking the sort key"""
+        params = {"categoria": equipamentos["categoria"], "fields": "codigo", "limit": 2, "sort": "codigo"}
+        first = requests.get(f"{BASE_URL}/api/equipamentos", params=params, headers=headers)
+        assert first.status_code == 200
+        assert [set(i) for i in first.json()["items"]] == [{"id", "codigo"}] * 2
+        second = requests.get(f"{BASE_URL}/api/equipamentos",
+                              params={**params, "cursor": first.json()["next_cursor"]}, headers=headers)
+        assert [i["codigo"][-1] for i in second.json()["items"]] == ["2"]
+        print("✓ Projection + cursor paging")
+
+    def test_detail_projection(self, headers, equipamentos):
+        """Test fields= on a detail route trims the resource, not the history"""
+        item_id = equipamentos["ids"][0]
+        response = requests.get(f"{BASE_URL}/api/equipamentos/{item_id}", params={"fields": "codigo"},
+                                headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["equipamento"] == {"id": item_id, "codigo": f"{equipamentos['categoria']}_0"}
+        assert "historico" in data
+        print("✓ Detail projection")
+
+    def test_obra_picker(self, headers):
+        """Test the obra picker used by the movimento forms"""
+        response = requests.get(f"{BASE_URL}/api/obras", params={"fields": "picker"}, headers=headers)
+        assert response.status_code == 200
+        for obra in response.json():
+            assert set(obra) <= {"id", "codigo", "nome", "estado"}
+        print("✓ Obra picker")
+
+    def test_unknown_field_rejected(self, headers):
+        """Test fields outside the model whitelist are rejected"""
+        for fields in ["password", "picker,segredo", "grid"]:
+            response = requests.get(f"{BASE_URL}/api/viaturas", params={"fields": fields}, headers=headers)
+            assert response.status_code == 400, fields
+        response = requests.get(f"{BASE_URL}/api/movimentos", params={"fields": "picker"}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Unknown fields rejected")
+
+
+class TestParseFields:
+    """Unit tests for projection parsing"""
+
+    def test_none_means_everything(self):
+        assert parse_fields("obras", None) is None
+        assert parse_fields("obras", "") is None
+
+    def test_fields_and_presets_combine(self):
+        projection = parse_fields("obras", "picker, cliente")
+        assert projection == {"_id": 0, "id": 1, "codigo": 1, "nome": 1, "estado": 1, "cliente": 1}
+
+    def test_unknown_field(self):
+        with pytest.raises(HTTPException) as exc:
+            parse_fields("materiais", "codigo,preco")
+        assert exc.value.status_code == 400
@@ -0,0 +1,62 @@
+"""
+Unit tests for the bounded bcrypt worker pool (HashPool)
+- runs password hashing/verification off the event loop
+- rejects fast with 503 + Retry-After when saturated
+- exposes queueing metrics
+"""
+import asyncio
+import threading
+
+import pytest
+
+from fastapi import HTTPException
+from server import HashPool, hash_password, verify_password
+
+
+class TestHashPool:
+    def test_hash_and_verify_in_pool(self):
+        pool = HashPool(workers=1, max_pending=4)
+
+        async def scenario():
+            hashed = await pool.run(hash_password, "segredo")
+            ok = await pool.run(verify_password, "segredo", hashed)
+            bad = await pool.run(verify_password, "errado", hashed)
+            return ok, bad
+
+        ok, bad = asyncio.run(scenario())
+        pool.shutdown()
+        assert ok is True
+        assert bad is False
+        stats = pool.stats()
+        assert stats["completed"] == 3
+        assert stats["pending"] == 0
+        assert stats["rejected"] == 0
+
+    def test_rejects_when_saturated(self):
+        pool = HashPool(workers=1, max_pending=2)
+        release = threading.Event()
+
+        def blocking():
+            release.wait(5)
+            return True
+
+        async def scenario():
+            first = asyncio.ensure_future(pool.run(blocking))
+            second = asyncio.ensure_future(pool.run(blocking))
+            await asyncio.sleep(0.05)
+            assert pool.stats()["running"] == 1
+            assert pool.stats()["queued"] == 1
+            with pytest.raises(HTTPException) as exc:
+                await pool.run(blocking)
+            release.set()
+            await asyncio.gather(first, second)
+            return exc.value
+
+        error = asyncio.run(scenario())
+        pool.shutdown()
+        assert error.status_code == 503
+        assert error.headers["Retry-After"] == "1"
+        stats = pool.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 2
+        assert stats["max_wait_ms"] > 0
@@ -0,0 +1,114 @@
+"""
+Test the in-memory hot-file cache used by /api/uploads/{filename}
+- LRU eviction by byte budget, size threshold and TTL expiry (unit)
+- invalidation also drops resized variants (unit)
+- cached responses keep ETag, 304 and Range behaviour (integration)
+"""
+import io
+import os
+
+import pytest
+import requests
+
+import server
+from server import HotFileCache
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def entry(size):
+    return {"body": b"x" * size, "etag": '"e"', "mtime": 0.0, "media_type": "image/jpeg"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHotFileCacheUnit:
+    def test_lru_eviction_by_bytes(self):
+        cache = HotFileCache(max_bytes=300, max_file_size=200, ttl=60)
+        cache.set("a", entry(100))
+        cache.set("b", entry(100))
+        cache.set("c", entry(100))
+        assert cache.get("a") is not None  # "a" passa a ser o mais recente
+        cache.set("d", entry(100))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["bytes"] == 300
+        assert cache.stats()["evictions"] == 1
+
+    def test_large_files_not_cached(self):
+        cache = HotFileCache(max_bytes=1000, max_file_size=10, ttl=60)
+        cache.set("big", entry(11))
+        assert cache.get("big") is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_ttl_expiry(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(server.time, "monotonic", clock)
+        cache = HotFileCache(max_bytes=1000, max_file_size=100, ttl=10)
+        cache.set("a", entry(10))
+        clock.now += 9
+        assert cache.get("a") is not None
+        clock.now += 2
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_replace_and_invalidate_variants(self):
+        cache = HotFileCache(max_bytes=1000, max_file_size=100, ttl=60)
+        cache.set("a.jpg", entry(10))
+        cache.set("a.jpg", entry(20))
+        assert cache.stats()["bytes"] == 20
+        cache.set("a.jpg?w=128&fmt=webp", entry(5))
+        cache.set("ab.jpg", entry(5))
+        cache.invalidate("a.jpg")
+        assert cache.get("a.jpg") is None
+        assert cache.get("a.jpg?w=128&fmt=webp") is None
+        assert cache.get("ab.jpg") is not None
+        assert cache.stats()["bytes"] == 5
+
+    def test_counters(self):
+        cache = HotFileCache(max_bytes=1000, max_file_size=100, ttl=60)
+        cache.set("a", entry(10))
+        cache.get("a")
+        cache.get("missing")
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+class TestHotFileServing:
+    @pytest.fixture(scope="class")
+    def photo(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        content = b"\xff\xd8\xff\xe0" + os.urandom(2048)
+        files = {"file": ("foto.jpg", io.BytesIO(content), "image/jpeg")}
+        upload = requests.post(f"{BASE_URL}/api/upload", files=files, headers=headers).json()
+        return f"{BASE_URL}{upload['url']}", content
+
+    def test_repeated_requests_identical(self, photo):
+        url, content = photo
+        first = requests.get(url)
+        second = requests.get(url)
+        assert first.content == second.content == content
+        assert first.headers["etag"] == second.headers["etag"]
+        assert second.headers["cache-control"] == "public, max-age=31536000, immutable"
+        print("✓ Cached file served with the same ETag")
+
+    def test_conditional_and_range_from_cache(self, photo):
+        url, content = photo
+        etag = requests.get(url).headers["etag"]
+        assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+        partial = requests.get(url, headers={"Range": "bytes=0-9"})
+        assert partial.status_code == 206
+        assert partial.content == content[:10]
+        assert partial.headers["content-range"] == f"bytes 0-9/{len(content)}"
+        print("✓ 304 and Range served from cache")
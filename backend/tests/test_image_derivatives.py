@@ -0,0 +1,133 @@
+"""
+Test on-demand image resizing for /api/uploads/{filename}?w=&fmt=
+- Resized derivatives are smaller, in the requested format and width
+- Widths snap to the allowed set, so equivalent requests share one derivative
+- DerivativeCache LRU eviction by byte budget (unit)
+"""
+import asyncio
+import io
+import os
+
+import pytest
+import requests
+from PIL import Image
+
+from server import DerivativeCache, LocalStorage, WorkerPool, snap_width
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def make_jpeg(width=1200, height=800):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestImageDerivatives(TestAuth):
+    """Test resized image variants"""
+
+    @pytest.fixture(scope="class")
+    def photo_url(self, headers):
+        files = {"file": ("foto.jpg", io.BytesIO(make_jpeg()), "image/jpeg")}
+        response = requests.post(f"{BASE_URL}/api/upload", files=files, headers=headers)
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        return f"{BASE_URL}{response.json()['url']}"
+
+    def test_resize_to_webp(self, photo_url):
+        """Test ?w=200&fmt=webp returns a 200px wide WebP"""
+        original = requests.get(photo_url)
+        response = requests.get(photo_url, params={"w": 200, "fmt": "webp"})
+        assert response.status_code == 200, response.text
+        assert response.headers["Content-Type"] == "image/webp"
+        assert "immutable" in response.headers["Cache-Control"]
+        img = Image.open(io.BytesIO(response.content))
+        assert img.format == "WEBP"
+        assert img.size == (200, 133)
+        assert len(response.content) < len(original.content)
+        print(f"✓ Thumbnail {len(original.content)}B -> {len(response.content)}B")
+
+    def test_width_snaps_to_allowed_set(self, photo_url):
+        """Test intermediate widths reuse the same derivative"""
+        first = requests.get(photo_url, params={"w": 150, "fmt": "webp"})
+        second = requests.get(photo_url, params={"w": 200, "fmt": "webp"})
+        assert first.status_code == 200
+        assert first.headers["ETag"] == second.headers["ETag"]
+        print("✓ w=150 and w=200 share a derivative")
+
+    def test_no_upscaling(self, photo_url):
+        """Test widths larger than the original keep the original size"""
+        response = requests.get(photo_url, params={"w": 2000, "fmt": "jpeg"})
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.content)).size == (1200, 800)
+        print("✓ No upscaling")
+
+    def test_invalid_format(self, photo_url):
+        """Test unknown formats are rejected"""
+        response = requests.get(photo_url, params={"w": 200, "fmt": "bmp"})
+        assert response.status_code == 400
+        print("✓ Invalid format rejected")
+
+    def test_pdf_not_resizable(self, headers):
+        """Test resize parameters are rejected for PDFs"""
+        files = {"file": ("doc.pdf", io.BytesIO(b"%PDF-1.4\n%%EOF"), "application/pdf")}
+        url = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers).json()["url"]
+        response = requests.get(f"{BASE_URL}{url}", params={"w": 200})
+        assert response.status_code == 400
+        print("✓ PDF resize rejected")
+
+
+class TestDerivativeCache:
+    """Unit tests for the on-disk LRU"""
+
+    def test_snap_width(self):
+        assert snap_width(1) == 64
+        assert snap_width(150) == 200
+        assert snap_width(200) == 200
+        assert snap_width(99999) == 2048
+
+    def test_lru_eviction_by_bytes(self, tmp_path):
+        src_dir = tmp_path / "src"
+        src_dir.mkdir()
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        sources = []
+        for name in ["a", "b", "c"]:
+            path = src_dir / f"{name}.jpg"
+            path.write_bytes(make_jpeg(800, 600))
+            sources.append(path)
+
+        pool = WorkerPool(1)
+        pool._get_executor = lambda: None  # thread pool por defeito nos testes
+        cache = DerivativeCache(cache_dir, max_bytes=1, pool=pool)
+
+        storage = LocalStorage(src_dir)
+
+        async def scenario():
+            for src in sources:
+                await cache.get(src.name, 64, "webp", storage)
+
+        asyncio.run(scenario())
+        # Só a variante mais recente sobrevive ao orçamento de bytes
+        assert [p.name for p in cache_dir.iterdir()] == ["c_w64.webp"]
+        assert cache.stats()["evictions"] == 2
+
+        reloaded = DerivativeCache(cache_dir, max_bytes=1, pool=pool)
+        reloaded.load()
+        assert reloaded.stats()["files"] == 1
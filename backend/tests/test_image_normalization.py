@@ -0,0 +1,126 @@
+"""
+Test ingest-time photo normalization
+- EXIF orientation applied, metadata stripped, dimension capped (unit)
+- transparent images are encoded as WEBP instead of JPEG (unit)
+- uploaded photos are stored normalized; undecodable files are kept as sent
+"""
+import io
+import os
+
+import pytest
+import requests
+from PIL import Image
+
+from server import normalize_image
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ORIENTATION = 0x0112
+MAKE = 0x010F
+
+
+def make_phone_jpeg(width=3000, height=2000):
+    """JPEG "de telemóvel": rodado por EXIF (orientação 6 = 90º) e com metadados"""
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    exif[MAKE] = "Telemovel"
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (90, 140, 200)).save(buffer, format="JPEG", quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+class TestNormalizeImage:
+    def test_orientation_metadata_and_size(self, tmp_path):
+        src = tmp_path / "foto.jpg"
+        src.write_bytes(make_phone_jpeg())
+        dst = tmp_path / "out.jpg"
+
+        assert normalize_image(str(src), str(dst), 1024, "JPEG", 85) == "JPEG"
+        with Image.open(dst) as img:
+            assert img.format == "JPEG"
+            # Rodada: retrato, com a maior dimensão limitada
+            assert (img.width, img.height) == (683, 1024)
+            assert not img.getexif()
+        assert dst.stat().st_size < src.stat().st_size
+
+    def test_small_image_not_upscaled(self, tmp_path):
+        src = tmp_path / "pequena.png"
+        Image.new("RGB", (300, 200), (1, 2, 3)).save(src)
+        dst = tmp_path / "out"
+        assert normalize_image(str(src), str(dst), 1024, "WEBP", 85) == "WEBP"
+        with Image.open(dst) as img:
+            assert (img.format, img.size) == ("WEBP", (300, 200))
+
+    def test_transparency_kept_as_webp(self, tmp_path):
+        src = tmp_path / "logo.png"
+        Image.new("RGBA", (100, 100), (255, 0, 0, 128)).save(src)
+        dst = tmp_path / "out"
+        assert normalize_image(str(src), str(dst), 1024, "JPEG", 85) == "WEBP"
+        with Image.open(dst) as img:
+            assert img.mode == "RGBA"
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUploadNormalization(TestAuth):
+    """Test /api/upload stores normalized photos (only when the server has IMAGE_NORMALIZE on)"""
+
+    @pytest.fixture(scope="class", autouse=True)
+    def normalization_enabled(self, headers):
+        metrics = requests.get(f"{BASE_URL}/api/metrics", headers=headers).json()
+        if not metrics["image_normalization"]["enabled"]:
+            pytest.skip("IMAGE_NORMALIZE is off on this server")
+
+    def test_photo_normalized_on_upload(self, headers):
+        """Test a large rotated phone photo is stored upright, smaller and without EXIF"""
+        content = make_phone_jpeg(3000, 2000)
+        files = {"file": ("IMG_0001.JPG", io.BytesIO(content), "image/jpeg")}
+        response = requests.post(f"{BASE_URL}/api/upload", files=files, headers=headers)
+        assert response.status_code == 200, response.text
+        upload = response.json()
+        assert upload["filename"] == f"{upload['sha256']}.jpg"
+
+        stored = requests.get(f"{BASE_URL}{upload['url']}")
+        assert len(stored.content) < len(content)
+        with Image.open(io.BytesIO(stored.content)) as img:
+            assert img.height > img.width
+            assert max(img.size) <= 2048
+            assert not img.getexif()
+        # Por defeito o original fica guardado ao lado
+        original = requests.get(f"{BASE_URL}/api/uploads/{upload['sha256']}_original.jpg")
+        assert original.status_code == 200 and original.content == content
+        print(f"✓ Photo normalized: {len(content)} -> {len(stored.content)} bytes")
+
+    def test_same_photo_deduplicated_after_normalization(self, headers):
+        """Test normalization is deterministic, so re-uploads still deduplicate"""
+        content = make_phone_jpeg(1600, 1200)
+        first = requests.post(f"{BASE_URL}/api/upload", headers=headers,
+                              files={"file": ("a.jpg", io.BytesIO(content), "image/jpeg")}).json()
+        second = requests.post(f"{BASE_URL}/api/upload", headers=headers,
+                               files={"file": ("b.jpg", io.BytesIO(content), "image/jpeg")}).json()
+        assert first["filename"] == second["filename"]
+        assert second["deduplicated"] is True
+        print("✓ Normalized photo deduplicated")
+
+    def test_undecodable_image_kept(self, headers):
+        """Test files Pillow cannot read are stored unchanged"""
+        content = b"\xff\xd8\xff\xe0" + os.urandom(1024)
+        upload = requests.post(f"{BASE_URL}/api/upload", headers=headers,
+                               files={"file": ("x.jpg", io.BytesIO(content), "image/jpeg")}).json()
+        assert requests.get(f"{BASE_URL}{upload['url']}").content == content
+        print("✓ Undecodable image kept as sent")
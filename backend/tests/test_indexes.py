@@ -0,0 +1,151 @@
+"""
+Test the declarative index bootstrap
+- reconcile_indexes creates missing indexes once and reports extra and conflicting ones
+- a unique index that cannot be built over existing duplicates is reported, not fatal
+- the spec covers the lookup, movement and list queries (unit)
+- concurrent creates with the same codigo yield exactly one equipamento (live)
+"""
+import asyncio
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from server import LIST_SORT_KEYS, index_spec, list_indexes, reconcile_indexes
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUniqueCodigo(TestAuth):
+    """Test the unique index closes the check-then-insert race"""
+
+    def test_concurrent_creates(self, headers):
+        codigo = f"TEST_RACE_{uuid.uuid4().hex[:8]}"
+
+        def create(_):
+            return requests.post(f"{BASE_URL}/api/equipamentos", json={
+                "codigo": codigo, "descricao": "Corrida"
+            }, headers=headers)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(create, range(8)))
+        created = [r for r in responses if r.status_code == 200]
+        assert len(created) == 1
+        assert all(r.status_code == 400 for r in responses if r.status_code != 200)
+        requests.delete(f"{BASE_URL}/api/equipamentos/{created[0].json()['id']}", headers=headers)
+        print("✓ One equipamento per codigo")
+
+    def test_rename_to_existing_codigo(self, headers):
+        tag = uuid.uuid4().hex[:8]
+        first = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"TEST_UNQ_{tag}_A", "descricao": "A"
+        }, headers=headers).json()
+        second = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"TEST_UNQ_{tag}_B", "descricao": "B"
+        }, headers=headers).json()
+        response = requests.put(f"{BASE_URL}/api/equipamentos/{second['id']}", json={
+            "codigo": first["codigo"], "descricao": "B"
+        }, headers=headers)
+        assert response.status_code == 400
+        for item in (first, second):
+            requests.delete(f"{BASE_URL}/api/equipamentos/{item['id']}", headers=headers)
+        print("✓ Rename onto an existing codigo rejected")
+
+
+class TestReconcileIndexes:
+    """Unit tests for the reconciliation against an in-memory Mongo"""
+
+    @pytest.fixture
+    def database(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        return mongomock_motor.AsyncMongoMockClient()["indexes"]
+
+    def test_creates_missing_once(self, database):
+        spec = {"equipamentos": [
+            {"keys": [("codigo", 1)], "unique": True},
+            {"keys": [("obra_id", 1), ("created_at", -1)]},
+        ]}
+
+        async def scenario():
+            first = await reconcile_indexes(database, spec)
+            second = await reconcile_indexes(database, spec)
+            return first, second, await database.equipamentos.index_information()
+
+        first, second, info = asyncio.run(scenario())
+        assert first["equipamentos"]["created"] == ["codigo_1", "obra_id_1_created_at_-1"]
+        assert second["equipamentos"] == {"created": [], "missing": [], "extra": [], "conflicts": [], "failed": []}
+        assert info["codigo_1"]["unique"] is True
+
+    def test_reports_extra_and_conflicts(self, database):
+        spec = {"viaturas": [{"keys": [("matricula", 1)], "unique": True}]}
+
+        async def scenario():
+            await database.viaturas.create_index("matricula")
+            await database.viaturas.create_index("cor")
+            return await reconcile_indexes(database, spec)
+
+        result = asyncio.run(scenario())["viaturas"]
+        assert result["conflicts"] == ["matricula_1"]
+        assert result["extra"] == ["cor_1"]
+        assert result["created"] == []
+
+    def test_dry_run_lists_missing(self, database):
+        spec = {"obras": [{"keys": [("codigo", 1)], "unique": True}]}
+
+        async def scenario():
+            report = await reconcile_indexes(database, spec, create=False)
+            return report, await database.obras.index_information()
+
+        report, info = asyncio.run(scenario())
+        assert report["obras"]["missing"] == ["codigo_1"]
+        assert "codigo_1" not in info
+
+    def test_duplicates_block_unique_index(self, database):
+        spec = {"materiais": [{"keys": [("codigo", 1)], "unique": True}, {"keys": [("id", 1)], "unique": True}]}
+
+        async def scenario():
+            await database.materiais.insert_many([{"id": "m1", "codigo": "X"}, {"id": "m2", "codigo": "X"}])
+            return await reconcile_indexes(database, spec)
+
+        result = asyncio.run(scenario())["materiais"]
+        assert result["failed"] == ["codigo_1"]
+        assert result["created"] == ["id_1"]
+
+
+class TestIndexSpec:
+    """Unit tests for the declared specification"""
+
+    def test_unique_lookups(self):
+        spec = index_spec()
+        unique = {(name, entry["keys"][0][0]) for name, entries in spec.items()
+                  for entry in entries if entry.get("unique")}
+        for name in ["users", "equipamentos", "viaturas", "materiais", "obras"]:
+            assert (name, "id") in unique
+        assert {("users", "email"), ("equipamentos", "codigo"), ("viaturas", "matricula"),
+                ("materiais", "codigo"), ("obras", "codigo")} <= unique
+
+    def test_movement_history_and_lists(self):
+        spec = index_spec()
+        keys = {name: [entry["keys"] for entry in entries] for name, entries in spec.items()}
+        assert [("recurso_id", 1), ("tipo_recurso", 1), ("created_at", -1)] in keys["movimentos"]
+        for name in LIST_SORT_KEYS:
+            assert all(index in keys[name] for index in list_indexes(name))
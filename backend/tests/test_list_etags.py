@@ -0,0 +1,144 @@
+"""
+Test conditional GETs on list endpoints
+- list responses carry an ETag built from the collection version and the query
+- If-None-Match with the current ETag returns 304 with no body
+- writes (including movements that touch a resource) change the ETag of the affected lists
+- ChangeVersions and If-None-Match parsing (unit)
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+import requests
+
+from server import ChangeVersions, etag_matches
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestListETags(TestAuth):
+    """Test ETag / If-None-Match on live list routes"""
+
+    def get(self, headers, path, etag=None, **params):
+        extra = {"If-None-Match": etag} if etag else {}
+        return requests.get(f"{BASE_URL}/api/{path}", params=params, headers={**headers, **extra})
+
+    def test_not_modified(self, headers):
+        """Test the same request with If-None-Match returns 304"""
+        first = self.get(headers, "materiais")
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+        second = self.get(headers, "materiais", etag)
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+        print("✓ 304 on unchanged list")
+
+    def test_query_is_part_of_etag(self, headers):
+        """Test different filters and pages get different ETags"""
+        base = self.get(headers, "equipamentos").headers["ETag"]
+        filtered = self.get(headers, "equipamentos", em_manutencao="true").headers["ETag"]
+        paged = self.get(headers, "equipamentos", limit=1).headers["ETag"]
+        assert len({base, filtered, paged}) == 3
+        assert self.get(headers, "equipamentos", base, limit=1).status_code == 200
+        print("✓ ETag depends on the query")
+
+    def test_writes_change_etag(self, headers):
+        """Test create, movement and delete invalidate the affected lists"""
+        etag = self.get(headers, "equipamentos").headers["ETag"]
+        equipamento = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"TEST_ETAG_{uuid.uuid4().hex[:8]}", "descricao": "ETag"
+        }, headers=headers).json()
+        response = self.get(headers, "equipamentos", etag)
+        assert response.status_code == 200
+        assert equipamento["id"] in [i["id"] for i in response.json()]
+
+        obra = requests.post(f"{BASE_URL}/api/obras", json={
+            "codigo": f"TEST_ETAG_{uuid.uuid4().hex[:8]}", "nome": "Obra ETag"
+        }, headers=headers).json()
+        etag = response.headers["ETag"]
+        movimentos_etag = self.get(headers, "movimentos").headers["ETag"]
+        requests.post(f"{BASE_URL}/api/movimentos/atribuir", json={
+            "recurso_id": equipamento["id"], "tipo_recurso": "equipamento", "obra_id": obra["id"]
+        }, headers=headers)
+        assert self.get(headers, "equipamentos", etag).status_code == 200
+        assert self.get(headers, "movimentos", movimentos_etag).status_code == 200
+
+        etag = self.get(headers, "equipamentos").headers["ETag"]
+        requests.delete(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", headers=headers)
+        requests.delete(f"{BASE_URL}/api/obras/{obra['id']}", headers=headers)
+        assert self.get(headers, "equipamentos", etag).status_code == 200
+        print("✓ Writes change the ETag")
+
+    def test_stock_movement_changes_materiais(self, headers):
+        """Test a stock movement invalidates the materiais list (stock_atual changed)"""
+        material = requests.post(f"{BASE_URL}/api/materiais", json={
+            "codigo": f"TEST_ETAG_{uuid.uuid4().hex[:8]}", "descricao": "Areia"
+        }, headers=headers).json()
+        etag = self.get(headers, "materiais").headers["ETag"]
+        requests.post(f"{BASE_URL}/api/movimentos/stock", json={
+            "material_id": material["id"], "tipo_movimento": "Entrada", "quantidade": 5
+        }, headers=headers)
+        assert self.get(headers, "materiais", etag).status_code == 200
+        requests.delete(f"{BASE_URL}/api/materiais/{material['id']}", headers=headers)
+        print("✓ Stock movement changes materiais ETag")
+
+
+class TestETagHelpers:
+    """Unit tests for version tracking and header parsing"""
+
+    def test_etag_matches(self):
+        assert etag_matches('W/"abc"', 'W/"abc"')
+        assert etag_matches('W/"abc"', '"x", "abc"')
+        assert etag_matches('W/"abc"', "*")
+        assert not etag_matches('W/"abc"', '"abd"')
+        assert not etag_matches('W/"abc"', None)
+
+    def test_versions(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        database = mongomock_motor.AsyncMongoMockClient()["etags"]
+
+        async def scenario():
+            versions = ChangeVersions(database, ttl=60)
+            other = ChangeVersions(database, ttl=60)
+            start = await versions.get("obras")
+            await versions.bump("obras")
+            local = await versions.get("obras")
+            # Outro worker escreve: só visível depois do refresh
+            await other.bump("obras")
+            cached = await versions.get("obras")
+            await versions.refresh()
+            refreshed = await versions.get("obras")
+            return start, local, cached, refreshed
+
+        start, local, cached, refreshed = asyncio.run(scenario())
+        assert start == ".0"
+        assert local.endswith(".1") and cached == local
+        assert refreshed == local[:-1] + "2"
+
+    def test_refresh_never_goes_back(self):
+        versions = ChangeVersions(None, ttl=60)
+        versions._merge("viaturas", "e1", 5)
+        versions._merge("viaturas", "e1", 4)
+        assert versions.versions["viaturas"] == ("e1", 5)
+        # Base de dados reposta: novo epoch prevalece
+        versions._merge("viaturas", "e2", 1)
+        assert versions.versions["viaturas"] == ("e2", 1)
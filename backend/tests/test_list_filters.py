@@ -0,0 +1,182 @@
+"""
+Test server-side filtering and sorting on /api/equipamentos and /api/viaturas
+- typed filters (categoria, em_manutencao, obra_id, atribuido, combustivel) return only matching rows
+- ?sort= orders by a declared field, ascending or descending, and pages by cursor in that order
+- unknown sort fields are rejected, and cursors only work with the sort they came from
+- every filter and sort field has a supporting index (unit)
+"""
+import os
+import uuid
+
+import pytest
+import requests
+
+from server import LIST_FILTER_FIELDS, LIST_SORT_FIELDS, list_indexes, resource_filters
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestEquipamentoFilters(TestAuth):
+    """Test filters and sort on equipamentos"""
+
+    @pytest.fixture(scope="class")
+    def categoria(self, headers):
+        categoria = f"TEST_CAT_{uuid.uuid4().hex[:8]}"
+        obra = requests.post(f"{BASE_URL}/api/obras", json={
+            "codigo": f"TEST_OBRA_{uuid.uuid4().hex[:8]}",
+            "nome": "Obra filtros"
+        }, headers=headers).json()
+        ids = []
+        for codigo, extra in [("B", {}), ("C", {"em_manutencao": True}), ("A", {"obra_id": obra["id"]})]:
+            response = requests.post(f"{BASE_URL}/api/equipamentos", json={
+                "codigo": f"{categoria}_{codigo}",
+                "descricao": "Equipamento filtros",
+                "categoria": categoria,
+                **extra
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["id"])
+        yield {"categoria": categoria, "obra_id": obra["id"]}
+        for item_id in ids:
+            requests.delete(f"{BASE_URL}/api/equipamentos/{item_id}", headers=headers)
+        requests.delete(f"{BASE_URL}/api/obras/{obra['id']}", headers=headers)
+
+    def get(self, headers, **params):
+        response = requests.get(f"{BASE_URL}/api/equipamentos", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    def test_filter_by_categoria(self, headers, categoria):
+        """Test ?categoria= returns only that category"""
+        items = self.get(headers, categoria=categoria["categoria"])
+        assert len(items) == 3
+        assert all(i["categoria"] == categoria["categoria"] for i in items)
+        print("✓ Categoria filter")
+
+    def test_filter_em_manutencao(self, headers, categoria):
+        """Test ?em_manutencao= in both directions"""
+        em = self.get(headers, categoria=categoria["categoria"], em_manutencao="true")
+        fora = self.get(headers, categoria=categoria["categoria"], em_manutencao="false")
+        assert [i["codigo"][-1] for i in em] == ["C"]
+        assert sorted(i["codigo"][-1] for i in fora) == ["A", "B"]
+        print("✓ em_manutencao filter")
+
+    def test_filter_obra(self, headers, categoria):
+        """Test ?obra_id= and ?atribuido="""
+        na_obra = self.get(headers, obra_id=categoria["obra_id"])
+        assert [i["codigo"][-1] for i in na_obra] == ["A"]
+        livres = self.get(headers, categoria=categoria["categoria"], atribuido="false")
+        assert sorted(i["codigo"][-1] for i in livres) == ["B", "C"]
+        atribuidos = self.get(headers, categoria=categoria["categoria"], atribuido="true")
+        assert [i["codigo"][-1] for i in atribuidos] == ["A"]
+        print("✓ Obra filters")
+
+    def test_sort_by_codigo(self, headers, categoria):
+        """Test ?sort=codigo and ?sort=-codigo"""
+        asc = self.get(headers, categoria=categoria["categoria"], sort="codigo")
+        desc = self.get(headers, categoria=categoria["categoria"], sort="-codigo")
+        assert [i["codigo"][-1] for i in asc] == ["A", "B", "C"]
+        assert [i["codigo"][-1] for i in desc] == ["C", "B", "A"]
+        print("✓ Sort by codigo")
+
+    def test_sorted_pages_follow_cursor(self, headers, categoria):
+        """Test cursor paging keeps the requested sort order"""
+        seen = []
+        params = {"categoria": categoria["categoria"], "sort": "codigo", "limit": 1}
+        while True:
+            response = requests.get(f"{BASE_URL}/api/equipamentos", params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            page = response.json()
+            seen.extend(i["codigo"][-1] for i in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        assert seen == ["A", "B", "C"]
+
+        # O mesmo cursor não serve para outra ordenação
+        first = requests.get(f"{BASE_URL}/api/equipamentos", params={**params, "limit": 1, "cursor": None},
+                             headers=headers)
+        cursor = first.json()["next_cursor"]
+        response = requests.get(f"{BASE_URL}/api/equipamentos", params={"sort": "-codigo", "cursor": cursor},
+                                headers=headers)
+        assert response.status_code == 400
+        print("✓ Sorted cursor paging")
+
+    def test_unknown_sort_rejected(self, headers):
+        """Test sort fields outside the declared set are rejected"""
+        response = requests.get(f"{BASE_URL}/api/equipamentos", params={"sort": "numero_serie"}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Unknown sort rejected")
+
+
+class TestViaturaFilters(TestAuth):
+    """Test filters and sort on viaturas"""
+
+    @pytest.fixture(scope="class")
+    def combustivel(self, headers):
+        combustivel = f"TEST_FUEL_{uuid.uuid4().hex[:8]}"
+        ids = []
+        for kms in [5000, 100, 42000]:
+            response = requests.post(f"{BASE_URL}/api/viaturas", json={
+                "matricula": f"TF-{uuid.uuid4().hex[:6]}",
+                "combustivel": combustivel,
+                "kms_atual": kms
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["id"])
+        yield combustivel
+        for item_id in ids:
+            requests.delete(f"{BASE_URL}/api/viaturas/{item_id}", headers=headers)
+
+    def test_filter_and_sort_by_kms(self, headers, combustivel):
+        """Test ?combustivel= with ?sort=-kms_atual"""
+        response = requests.get(f"{BASE_URL}/api/viaturas", params={
+            "combustivel": combustivel, "sort": "-kms_atual"
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        assert [v["kms_atual"] for v in response.json()] == [42000, 5000, 100]
+        print("✓ Viaturas filtered by combustivel and sorted by kms")
+
+    def test_invalid_bool_rejected(self, headers):
+        """Test typed boolean filters reject garbage"""
+        response = requests.get(f"{BASE_URL}/api/viaturas", params={"ativa": "talvez"}, headers=headers)
+        assert response.status_code == 422
+        print("✓ Typed filters validated")
+
+
+class TestFilterHelpers:
+    """Unit tests for query building and declared indexes"""
+
+    def test_resource_filters(self):
+        assert resource_filters(None, None, None, categoria=None) == {}
+        assert resource_filters(None, False, False, ativo=True) == {
+            "ativo": True,
+            "obra_id": {"$in": [None, ""]},
+            "em_manutencao": {"$ne": True},
+        }
+        # obra_id explícito prevalece sobre atribuido
+        assert resource_filters("o1", False, None) == {"obra_id": "o1"}
+
+    def test_every_filter_and_sort_is_indexed(self):
+        for name, fields in LIST_FILTER_FIELDS.items():
+            leading = {tuple(keys)[0][0] for keys in list_indexes(name)}
+            assert set(fields) <= leading
+            assert set(LIST_SORT_FIELDS[name]) <= leading
@@ -0,0 +1,140 @@
+"""
+Test cursor (keyset) pagination on the list endpoints
+- ?limit= returns {"items", "next_cursor"}; next_cursor points at the next page
+- without limit or cursor the full list comes back as a plain array (no silent cap)
+- walking every cursor returns each row exactly once, newest first
+- invalid cursors and page sizes are rejected
+- keyset filter handles ties and rows missing the sort field (unit)
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+import requests
+
+from server import LIST_MAX_PAGE_SIZE, decode_cursor, encode_cursor, paginate
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestListPagination(TestAuth):
+    """Test paging through /api/obras"""
+
+    @pytest.fixture(scope="class")
+    def obra_ids(self, headers):
+        ids = []
+        for i in range(5):
+            response = requests.post(f"{BASE_URL}/api/obras", json={
+                "codigo": f"TEST_PAGE_{uuid.uuid4().hex[:8]}",
+                "nome": f"Obra paginação {i}"
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["id"])
+        yield ids
+        for obra_id in ids:
+            requests.delete(f"{BASE_URL}/api/obras/{obra_id}", headers=headers)
+
+    def test_first_page(self, headers, obra_ids):
+        """Test ?limit=2 returns two rows and a next cursor"""
+        response = requests.get(f"{BASE_URL}/api/obras", params={"limit": 2}, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) == 2
+        assert page["next_cursor"]
+        print("✓ First page has a next cursor")
+
+    def test_unpaged_returns_everything(self, headers, obra_ids):
+        """Test a plain GET still returns the whole list as an array"""
+        response = requests.get(f"{BASE_URL}/api/obras", headers=headers)
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        assert set(obra_ids) <= {o["id"] for o in response.json()}
+        print("✓ Unpaged list is complete")
+
+    def test_walk_all_pages(self, headers, obra_ids):
+        """Test following cursors visits every row once, newest first"""
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}/api/obras", params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            page = response.json()
+            seen.extend(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        ids = [o["id"] for o in seen]
+        assert len(ids) == len(set(ids)), "Rows repeated across pages"
+        assert set(obra_ids) <= set(ids)
+        created = [o["created_at"] for o in seen]
+        assert created == sorted(created, reverse=True)
+        print(f"✓ Walked {len(ids)} obras without gaps or repeats")
+
+    def test_invalid_cursor(self, headers):
+        """Test garbage cursors are rejected"""
+        response = requests.get(f"{BASE_URL}/api/movimentos", params={"cursor": "nope"}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Invalid cursor rejected")
+
+    def test_cursor_from_other_list_rejected(self, headers):
+        """Test a cursor for a different sort key is rejected"""
+        cursor = encode_cursor("created_at", "2024-01-01", "x")
+        response = requests.get(f"{BASE_URL}/api/movimentos/stock", params={"cursor": cursor}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Foreign cursor rejected")
+
+    def test_limit_bounds(self, headers):
+        """Test page sizes outside 1..LIST_MAX_PAGE_SIZE are rejected"""
+        for limit in [0, LIST_MAX_PAGE_SIZE + 1]:
+            response = requests.get(f"{BASE_URL}/api/equipamentos", params={"limit": limit}, headers=headers)
+            assert response.status_code == 422
+        print("✓ Page size bounds enforced")
+
+
+class TestKeyset:
+    """Unit tests for the keyset helpers"""
+
+    def test_cursor_roundtrip(self):
+        cursor = encode_cursor("data_hora", "2024-05-01T10:00:00", "abc")
+        assert decode_cursor(cursor, "data_hora") == ("2024-05-01T10:00:00", "abc")
+
+    def test_ties_and_missing_sort_field(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        docs = [{"id": f"{i:02d}", "created_at": "2024-01-01"} for i in range(4)]
+        docs += [{"id": "10", "created_at": "2024-02-01"}, {"id": "11"}, {"id": "12", "created_at": None}]
+
+        async def walk(direction):
+            collection = mongomock_motor.AsyncMongoMockClient()["pagination"][f"items{direction}"]
+            await collection.insert_many([dict(d) for d in docs])
+            seen = []
+            cursor = None
+            while True:
+                page = await paginate(collection, {}, "created_at", direction, 2, cursor)
+                seen.extend(d["id"] for d in page["items"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return seen
+
+        assert asyncio.run(walk(-1)) == ["10", "03", "02", "01", "00", "12", "11"]
+        assert asyncio.run(walk(1)) == ["11", "12", "00", "01", "02", "03", "10"]
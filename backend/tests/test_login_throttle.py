@@ -0,0 +1,80 @@
+"""
+Test login throttling (token bucket per email and per client IP)
+- Repeated failed logins for one email are rejected with 429 + Retry-After
+- Successful logins do not consume the per-email budget
+- TokenBucketLimiter refill, refund and LRU bound (unit)
+"""
+import asyncio
+import os
+import uuid
+
+import requests
+
+import server
+from server import TokenBucketLimiter
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucketLimiter:
+    def test_burst_then_reject_then_refill(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(server.time, "time", clock)
+        limiter = TokenBucketLimiter("test", capacity=3, per_minute=60)
+        assert [asyncio.run(limiter.take("k")) for _ in range(3)] == [0.0, 0.0, 0.0]
+        retry_after = asyncio.run(limiter.take("k"))
+        assert 0 < retry_after <= 1.0
+        clock.now += 1.0
+        assert asyncio.run(limiter.take("k")) == 0.0
+        assert limiter.stats()["rejected"] == 1
+        assert limiter.stats()["allowed"] == 4
+
+    def test_keys_are_independent_and_refund(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(server.time, "time", clock)
+        limiter = TokenBucketLimiter("test", capacity=1, per_minute=1)
+        assert asyncio.run(limiter.take("a")) == 0.0
+        assert asyncio.run(limiter.take("b")) == 0.0
+        assert asyncio.run(limiter.take("a")) > 0
+        asyncio.run(limiter.refund("a"))
+        assert asyncio.run(limiter.take("a")) == 0.0
+
+    def test_tracked_keys_are_bounded(self):
+        limiter = TokenBucketLimiter("test", capacity=1, per_minute=1, maxsize=2)
+        for key in ["a", "b", "c"]:
+            asyncio.run(limiter.take(key))
+        assert limiter.stats()["tracked_keys"] == 2
+
+
+class TestLoginThrottle:
+    """Integration test against the running API"""
+
+    def test_failed_logins_are_throttled(self):
+        email = f"TEST_throttle_{uuid.uuid4().hex[:8]}@test.com"
+        statuses = []
+        response = None
+        for _ in range(10):
+            response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": "wrong"})
+            statuses.append(response.status_code)
+            if response.status_code == 429:
+                break
+        assert statuses[0] == 401
+        assert statuses[-1] == 429, f"Expected throttling, got {statuses}"
+        assert int(response.headers["Retry-After"]) >= 1
+        print(f"✓ Throttled after {len(statuses) - 1} failed attempts")
+
+    def test_successful_logins_not_throttled(self):
+        email = f"TEST_throttle_ok_{uuid.uuid4().hex[:8]}@test.com"
+        requests.post(f"{BASE_URL}/api/auth/register", json={"name": "Throttle", "email": email, "password": "ok12345"})
+        for _ in range(8):
+            response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": "ok12345"})
+            assert response.status_code == 200, f"Login unexpectedly failed: {response.text}"
+        print("✓ Successful logins do not consume the email budget")
@@ -0,0 +1,151 @@
+"""
+Test the versioned schema migration runner
+- backfill_defaults fills only missing fields, in batches, and resumes after an interruption
+- MigrationRunner applies pending migrations once, records version and history, and honours the lock
+"""
+import asyncio
+
+import pytest
+
+from server import (
+    EQUIPAMENTO_DEFAULTS, MIGRATIONS, VIATURA_DEFAULTS, MigrationRunner, backfill_defaults, migrate_updated_at,
+    migrate_upload_count
+)
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def make_db():
+    return mongomock_motor.AsyncMongoMockClient()["migrations"]
+
+
+class TestBackfillDefaults:
+    """Unit tests for the batched backfill"""
+
+    def test_fills_only_missing_fields(self):
+        database = make_db()
+
+        async def scenario():
+            await database.equipamentos.insert_many([
+                {"id": "e1", "codigo": "EQ-1"},
+                {"id": "e2", "codigo": "EQ-2", "em_manutencao": True, "manual_url": "/api/uploads/m.pdf"},
+                {"id": "e3", "codigo": "EQ-3", **EQUIPAMENTO_DEFAULTS},
+            ])
+            updated = await backfill_defaults(database, "equipamentos", EQUIPAMENTO_DEFAULTS, batch_size=1)
+            docs = await database.equipamentos.find({}, {"_id": 0}).sort("id", 1).to_list(10)
+            return updated, docs
+
+        updated, docs = asyncio.run(scenario())
+        assert updated == 2
+        assert all(set(EQUIPAMENTO_DEFAULTS) <= set(d) for d in docs)
+        assert docs[0]["em_manutencao"] is False
+        # Valores existentes não são tocados
+        assert docs[1]["em_manutencao"] is True
+        assert docs[1]["manual_url"] == "/api/uploads/m.pdf"
+
+    def test_resumes_after_interruption(self):
+        database = make_db()
+
+        async def scenario():
+            await database.viaturas.insert_many([{"id": f"v{i}", "matricula": f"AA-{i:02d}-BB"} for i in range(5)])
+            # Simula uma execução interrompida a meio: só alguns documentos ficaram migrados
+            await database.viaturas.update_many({"id": {"$in": ["v0", "v1"]}}, {"$set": VIATURA_DEFAULTS})
+            updated = await backfill_defaults(database, "viaturas", VIATURA_DEFAULTS, batch_size=2)
+            again = await backfill_defaults(database, "viaturas", VIATURA_DEFAULTS, batch_size=2)
+            missing = await database.viaturas.count_documents({"kms_atual": {"$exists": False}})
+            return updated, again, missing
+
+        assert asyncio.run(scenario()) == (3, 0, 0)
+
+    def test_updated_at_from_creation_date(self):
+        database = make_db()
+
+        async def scenario():
+            await database.obras.insert_many([
+                {"id": "o1", "created_at": "2024-01-01T00:00:00+00:00"},
+                {"id": "o2", "created_at": "2024-02-01T00:00:00+00:00", "updated_at": "2024-03-01T00:00:00+00:00"},
+            ])
+            await database.movimentos_stock.insert_one({"id": "s1", "data_hora": "2024-04-01T00:00:00+00:00"})
+            updated = await migrate_updated_at(database)
+            docs = {}
+            for name in ["obras", "movimentos_stock"]:
+                async for doc in database[name].find({}, {"_id": 0, "id": 1, "updated_at": 1}):
+                    docs[doc["id"]] = doc["updated_at"]
+            return updated, docs
+
+        updated, docs = asyncio.run(scenario())
+        assert updated == 2
+        assert docs == {
+            "o1": "2024-01-01T00:00:00+00:00",
+            "o2": "2024-03-01T00:00:00+00:00",
+            "s1": "2024-04-01T00:00:00+00:00",
+        }
+
+
+    def test_upload_count_renamed(self):
+        database = make_db()
+
+        async def scenario():
+            await database.uploads.insert_many([{"_id": "a", "refs": 3}, {"_id": "b", "upload_count": 1}])
+            renamed = await migrate_upload_count(database)
+            return renamed, await database.uploads.find({}).sort("_id", 1).to_list(10)
+
+        renamed, docs = asyncio.run(scenario())
+        assert renamed == 1
+        assert docs == [{"_id": "a", "upload_count": 3}, {"_id": "b", "upload_count": 1}]
+
+
+class TestMigrationRunner:
+    """Unit tests for version tracking and locking"""
+
+    def test_applies_pending_once(self):
+        database = make_db()
+        runner = MigrationRunner(database, MIGRATIONS, lock_seconds=60)
+
+        async def scenario():
+            await database.equipamentos.insert_one({"id": "e1", "codigo": "EQ-1"})
+            await database.viaturas.insert_one({"id": "v1", "matricula": "AA-00-BB"})
+            first = await runner.run()
+            second = await runner.run()
+            state = await database.schema_migrations.find_one({"_id": "schema"})
+            lock = await database.schema_migrations.find_one({"_id": "lock"})
+            return first, second, state, lock, await runner.pending()
+
+        first, second, state, lock, pending = asyncio.run(scenario())
+        assert [e["version"] for e in first] == [v for v, _ in MIGRATIONS]
+        # Defaults de equipamentos, de viaturas, updated_at nos dois e nenhum upload a renomear
+        assert [e["documents"] for e in first] == [1, 1, 2, 0]
+        assert second == []
+        assert state["version"] == MIGRATIONS[-1][0]
+        assert [e["name"] for e in state["history"]] == [m.__name__ for _, m in MIGRATIONS]
+        assert lock is None
+        assert pending == []
+
+    def test_only_newer_versions_run(self):
+        database = make_db()
+        calls = []
+
+        async def migration(db):
+            calls.append(1)
+            return 0
+
+        async def scenario():
+            await database.schema_migrations.insert_one({"_id": "schema", "version": 1, "history": []})
+            return await MigrationRunner(database, [(1, migration), (2, migration)], lock_seconds=60).run()
+
+        applied = asyncio.run(scenario())
+        assert [e["version"] for e in applied] == [2]
+        assert len(calls) == 1
+
+    def test_waits_for_lock(self):
+        database = make_db()
+
+        async def scenario():
+            other = MigrationRunner(database, [], lock_seconds=60)
+            assert await other._acquire()
+            runner = MigrationRunner(database, MIGRATIONS, lock_seconds=60)
+            with pytest.raises(RuntimeError):
+                await runner.run(wait_seconds=0)
+            return await runner.version()
+
+        assert asyncio.run(scenario()) == 0
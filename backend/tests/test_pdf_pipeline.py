@@ -0,0 +1,134 @@
+"""
+Test background PDF processing (first-page preview + extracted text)
+- process_pdf renders a WEBP preview and extracts text (unit)
+- Uploaded PDFs get a preview at /api/uploads/{filename}/preview and text at /text
+"""
+import io
+import os
+import time
+
+import pytest
+import requests
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import server
+from server import process_pdf
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+requires_pdfium = pytest.mark.skipif(server.pdfium is None, reason="pypdfium2 not installed")
+
+
+def make_pdf(pages):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for text in pages:
+        pdf.drawString(72, 750, text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+@requires_pdfium
+class TestProcessPdf:
+    """Unit tests for the worker function"""
+
+    def test_preview_and_text(self, tmp_path):
+        src = tmp_path / "doc.pdf"
+        src.write_bytes(make_pdf(["Manual da Betoneira", "Segunda pagina"]))
+        preview = tmp_path / "preview.webp"
+
+        result = process_pdf(str(src), str(preview), 400, 80, 10000)
+
+        assert result["pages"] == 2
+        assert "Manual da Betoneira" in result["text"]
+        assert "Segunda pagina" in result["text"]
+        with Image.open(preview) as img:
+            assert img.format == "WEBP"
+            assert img.width == 400
+
+    def test_text_truncated(self, tmp_path):
+        src = tmp_path / "doc.pdf"
+        src.write_bytes(make_pdf(["A" * 50, "B" * 50]))
+        result = process_pdf(str(src), str(tmp_path / "p.webp"), 100, 80, 20)
+        assert len(result["text"]) == 20
+
+    def test_invalid_pdf_raises(self, tmp_path):
+        src = tmp_path / "bad.pdf"
+        src.write_bytes(b"%PDF-1.4 not really")
+        with pytest.raises(Exception):
+            process_pdf(str(src), str(tmp_path / "p.webp"), 100, 80, 100)
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+@requires_pdfium
+class TestPdfPipeline(TestAuth):
+    """Test previews and text for uploaded PDFs"""
+
+    def wait_for_text(self, headers, filename, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = requests.get(f"{BASE_URL}/api/uploads/{filename}/text", headers=headers)
+            assert response.status_code == 200, response.text
+            data = response.json()
+            if data["status"] in ("done", "failed"):
+                return data
+            time.sleep(0.3)
+        pytest.fail("PDF was not processed in time")
+
+    def test_upload_generates_preview_and_text(self, headers):
+        """Test a new PDF is processed in the background"""
+        marker = f"Certificado {os.urandom(4).hex()}"
+        files = {"file": ("certificado.pdf", io.BytesIO(make_pdf([marker])), "application/pdf")}
+        response = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers)
+        assert response.status_code == 200, response.text
+        upload = response.json()
+        assert upload["preview_url"] == f"/api/uploads/{upload['filename']}/preview"
+
+        data = self.wait_for_text(headers, upload["filename"])
+        assert data["status"] == "done"
+        assert data["pages"] == 1
+        assert marker in data["text"]
+
+        preview = requests.get(f"{BASE_URL}{upload['preview_url']}")
+        assert preview.status_code == 200
+        assert preview.headers["content-type"] == "image/webp"
+
+        thumb = requests.get(f"{BASE_URL}{upload['preview_url']}?w=128")
+        assert thumb.status_code == 200
+        assert Image.open(io.BytesIO(thumb.content)).width == 128
+        print(f"✓ PDF processed: {data['pages']} page(s)")
+
+    def test_invalid_pdf_marked_failed(self, headers):
+        """Test a corrupt PDF is marked as failed and has no preview"""
+        files = {"file": ("estragado.pdf", io.BytesIO(b"%PDF-1.4 " + os.urandom(256)), "application/pdf")}
+        upload = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers).json()
+        data = self.wait_for_text(headers, upload["filename"])
+        assert data["status"] == "failed"
+        assert requests.get(f"{BASE_URL}{upload['preview_url']}").status_code == 404
+        print("✓ Corrupt PDF marked as failed")
+
+    def test_unknown_document(self, headers):
+        """Test text/preview for unknown documents return 404"""
+        response = requests.get(f"{BASE_URL}/api/uploads/{'0' * 64}.pdf/text", headers=headers)
+        assert response.status_code == 404
+        assert requests.get(f"{BASE_URL}/api/uploads/{'0' * 64}.pdf/preview").status_code == 404
+        print("✓ Unknown document returns 404")
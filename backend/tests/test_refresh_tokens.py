@@ -0,0 +1,116 @@
+"""
+Test short-lived access tokens with refresh tokens
+- Login returns an access/refresh token pair
+- POST /api/auth/refresh rotates the pair (old refresh token is revoked)
+- Concurrent refreshes with the same token: exactly one succeeds
+- POST /api/auth/logout revokes the access and refresh tokens
+- Refresh tokens are not accepted as access tokens
+"""
+import base64
+import json
+import pytest
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def decode_claims(token):
+    """Read JWT payload without verifying the signature"""
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))
+
+
+class TestRefreshTokens:
+    """Test token pair lifecycle with a dedicated user"""
+
+    @pytest.fixture
+    def tokens(self):
+        email = f"TEST_refresh_{uuid.uuid4().hex[:8]}@test.com"
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "name": "Refresh Tester",
+            "email": email,
+            "password": "refresh123"
+        })
+        assert response.status_code == 200, f"Register failed: {response.text}"
+        return response.json()
+
+    def test_login_returns_token_pair(self, tokens):
+        """Test access token is short-lived and refresh token is separate"""
+        access = decode_claims(tokens["access_token"])
+        refresh = decode_claims(tokens["refresh_token"])
+        assert access["type"] == "access"
+        assert refresh["type"] == "refresh"
+        assert access["jti"] != refresh["jti"]
+        assert access["exp"] < refresh["exp"]
+        assert tokens["expires_in"] > 0
+        print(f"✓ Token pair issued, access expires in {tokens['expires_in']}s")
+
+    def test_refresh_rotates_tokens(self, tokens):
+        """Test refresh issues a new pair and revokes the used refresh token"""
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200, f"Refresh failed: {response.text}"
+        new_tokens = response.json()
+        assert new_tokens["access_token"] != tokens["access_token"]
+        assert new_tokens["refresh_token"] != tokens["refresh_token"]
+
+        headers = {"Authorization": f"Bearer {new_tokens['access_token']}"}
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=headers).status_code == 200
+
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 401, "Used refresh token must not be accepted again"
+        print("✓ Refresh rotated token pair")
+
+    def test_concurrent_refresh_single_use(self, tokens):
+        """Test replaying one refresh token in parallel yields a single new pair"""
+        def refresh(_):
+            return requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(refresh, range(8)))
+        statuses = sorted(r.status_code for r in responses)
+        assert statuses == [200] + [401] * 7, statuses
+        print("✓ Refresh token used exactly once under concurrency")
+
+    def test_refresh_token_not_accepted_as_access(self, tokens):
+        """Test refresh token cannot authorize API calls"""
+        headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers=headers)
+        assert response.status_code == 401
+        print("✓ Refresh token rejected as access token")
+
+    def test_access_token_not_accepted_for_refresh(self, tokens):
+        """Test access token cannot be used on /auth/refresh"""
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": tokens["access_token"]})
+        assert response.status_code == 401
+        print("✓ Access token rejected on refresh")
+
+    def test_logout_revokes_pair(self, tokens):
+        """Test logout revokes both tokens of the session"""
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        response = requests.post(f"{BASE_URL}/api/auth/logout", headers=headers,
+                                 json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=headers).status_code == 401
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 401
+        print("✓ Logout revoked access and refresh tokens")
+
+    def test_logout_all_revokes_other_sessions(self, tokens):
+        """Test logout-all invalidates tokens from every session"""
+        claims = decode_claims(tokens["access_token"])
+        login = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": claims["email"], "password": "refresh123"
+        })
+        assert login.status_code == 200
+        other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert requests.post(f"{BASE_URL}/api/auth/logout-all", headers=headers).status_code == 200
+        assert requests.get(f"{BASE_URL}/api/auth/me", headers=other_headers).status_code == 401
+        response = requests.post(f"{BASE_URL}/api/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+        assert response.status_code == 401
+        print("✓ Logout-all revoked every session")
@@ -0,0 +1,142 @@
+"""
+Test resumable upload sessions
+- create a session, PUT chunks by offset, query the offset and complete
+- a dropped request keeps the bytes received and can be resumed
+- wrong offsets, oversize and incomplete uploads are rejected
+"""
+import hashlib
+import os
+import time
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestResumableUploads(TestAuth):
+    """Test the session protocol"""
+
+    def create_session(self, headers, content, content_type="application/pdf", filename="seguro.pdf"):
+        response = requests.post(f"{BASE_URL}/api/upload/sessions", json={
+            "filename": filename,
+            "size": len(content),
+            "content_type": content_type
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        session = response.json()
+        assert session["offset"] == 0
+        return session
+
+    def put(self, headers, session_id, offset, data):
+        return requests.put(f"{BASE_URL}/api/upload/sessions/{session_id}",
+                            params={"offset": offset}, data=data, headers=headers)
+
+    def test_chunked_upload(self, headers):
+        """Test uploading in chunks and completing"""
+        content = b"%PDF-1.4\n" + os.urandom(3 * 1024 * 1024)
+        session = self.create_session(headers, content)
+        chunk = 1024 * 1024 + 123
+        offset = 0
+        while offset < len(content):
+            response = self.put(headers, session["id"], offset, content[offset:offset + chunk])
+            assert response.status_code == 200, response.text
+            offset = response.json()["offset"]
+            status = requests.get(f"{BASE_URL}/api/upload/sessions/{session['id']}", headers=headers).json()
+            assert status["offset"] == offset
+
+        response = requests.post(f"{BASE_URL}/api/upload/sessions/{session['id']}/complete", headers=headers)
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert result["sha256"] == hashlib.sha256(content).hexdigest()
+        assert result["original_name"] == "seguro.pdf"
+        assert result["preview_url"].endswith("/preview")
+        assert requests.get(f"{BASE_URL}{result['url']}").content == content
+
+        # A sessão deixa de existir depois de finalizada
+        assert requests.get(f"{BASE_URL}/api/upload/sessions/{session['id']}", headers=headers).status_code == 404
+        print("✓ Chunked upload completed")
+
+    def test_resume_after_dropped_request(self, headers):
+        """Test bytes received before a dropped connection are kept"""
+        content = b"%PDF-1.4\n" + os.urandom(2 * 1024 * 1024)
+        session = self.create_session(headers, content)
+
+        def dropping_body():
+            yield content[:512 * 1024]
+            raise IOError("rede em baixo")
+
+        with pytest.raises(Exception):
+            self.put(headers, session["id"], 0, dropping_body())
+
+        # Como o cliente: o servidor pode ainda estar a gravar o pedido perdido, por isso
+        # um 409 leva a reler o offset e tentar outra vez
+        for _ in range(20):
+            status = requests.get(f"{BASE_URL}/api/upload/sessions/{session['id']}", headers=headers).json()
+            offset = status["offset"]
+            assert 0 <= offset <= 512 * 1024
+            response = self.put(headers, session["id"], offset, content[offset:])
+            if response.status_code != 409:
+                break
+            time.sleep(0.1)
+        assert response.status_code == 200, response.text
+        result = requests.post(f"{BASE_URL}/api/upload/sessions/{session['id']}/complete", headers=headers).json()
+        assert result["sha256"] == hashlib.sha256(content).hexdigest()
+        print(f"✓ Resumed from offset {offset}")
+
+    def test_wrong_offset_rejected(self, headers):
+        """Test a chunk at the wrong offset returns 409 with the expected offset"""
+        content = os.urandom(1000)
+        session = self.create_session(headers, content, "image/jpeg", "foto.jpg")
+        assert self.put(headers, session["id"], 0, content[:400]).status_code == 200
+        response = self.put(headers, session["id"], 0, content[:400])
+        assert response.status_code == 409
+        assert "400" in response.json()["detail"]
+        print("✓ Wrong offset rejected")
+
+    def test_incomplete_and_oversize(self, headers):
+        """Test completing early and sending past the declared size fail"""
+        content = os.urandom(1000)
+        session = self.create_session(headers, content, "image/png", "foto.png")
+        assert self.put(headers, session["id"], 0, content[:500]).status_code == 200
+        response = requests.post(f"{BASE_URL}/api/upload/sessions/{session['id']}/complete", headers=headers)
+        assert response.status_code == 409
+        assert self.put(headers, session["id"], 500, content[500:] + b"extra").status_code == 400
+        print("✓ Incomplete and oversize uploads rejected")
+
+    def test_session_limits(self, headers):
+        """Test type and size limits are applied when creating the session"""
+        response = requests.post(f"{BASE_URL}/api/upload/sessions", json={
+            "filename": "grande.pdf", "size": 11 * 1024 * 1024, "content_type": "application/pdf"
+        }, headers=headers)
+        assert response.status_code == 400
+        response = requests.post(f"{BASE_URL}/api/upload/sessions", json={
+            "filename": "script.exe", "size": 10, "content_type": "application/octet-stream"
+        }, headers=headers)
+        assert response.status_code == 400
+        print("✓ Session limits enforced")
+
+    def test_cancel(self, headers):
+        """Test cancelling a session"""
+        session = self.create_session(headers, b"%PDF-1.4 abc")
+        url = f"{BASE_URL}/api/upload/sessions/{session['id']}"
+        assert requests.delete(url, headers=headers).status_code == 200
+        assert requests.get(url, headers=headers).status_code == 404
+        print("✓ Session cancelled")
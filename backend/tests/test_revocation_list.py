@@ -0,0 +1,110 @@
+"""
+Unit tests for the in-memory mirror of revoked_tokens (RevocationList)
+- local revocation is visible immediately and persisted
+- sync only loads revocations newer than the last watermark
+- expired entries are pruned from memory
+- claim() lets exactly one worker win a refresh token, even before any sync
+"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import server
+from pymongo.errors import DuplicateKeyError
+from server import RevocationList
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._docs:
+            raise StopAsyncIteration
+        return self._docs.pop(0)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.queries = []
+
+    async def insert_one(self, doc):
+        # Como o índice único em jti
+        if any(d["jti"] == doc["jti"] for d in self.docs):
+            raise DuplicateKeyError("duplicate jti")
+        self.docs.append(dict(doc))
+
+    async def update_one(self, query, update, upsert=False):
+        if not any(d["jti"] == query["jti"] for d in self.docs):
+            self.docs.append(dict(update["$setOnInsert"]))
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        since = query.get("revoked_at", {}).get("$gte")
+        return FakeCursor(d for d in self.docs if since is None or d["revoked_at"] >= since)
+
+
+class FakeDb:
+    def __init__(self):
+        self.revoked_tokens = FakeCollection()
+
+
+def future_exp(minutes=15):
+    return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).timestamp()
+
+
+class TestRevocationList:
+    def test_revoke_is_local_and_persisted(self, monkeypatch):
+        fake_db = FakeDb()
+        monkeypatch.setattr(server, "db", fake_db)
+        revoked = RevocationList()
+        asyncio.run(revoked.revoke({"jti": "abc", "sub": "u1", "exp": future_exp()}))
+        assert "abc" in revoked
+        assert len(fake_db.revoked_tokens.docs) == 1
+        assert fake_db.revoked_tokens.docs[0]["user_id"] == "u1"
+
+    def test_sync_is_incremental(self, monkeypatch):
+        fake_db = FakeDb()
+        monkeypatch.setattr(server, "db", fake_db)
+        now = datetime.now(timezone.utc)
+        expires = now + timedelta(minutes=15)
+        fake_db.revoked_tokens.docs.append({"jti": "a", "expires_at": expires, "revoked_at": now})
+
+        other_worker = RevocationList()
+        asyncio.run(other_worker.sync())
+        assert "a" in other_worker
+        assert fake_db.revoked_tokens.queries[0] == {}
+
+        fake_db.revoked_tokens.docs.append(
+            {"jti": "b", "expires_at": expires, "revoked_at": now + timedelta(seconds=1)})
+        asyncio.run(other_worker.sync())
+        assert "b" in other_worker
+        assert fake_db.revoked_tokens.queries[1] == {"revoked_at": {"$gte": now}}
+        assert other_worker.stats() == {"size": 2, "syncs": 2}
+
+    def test_expired_entries_are_pruned(self, monkeypatch):
+        fake_db = FakeDb()
+        monkeypatch.setattr(server, "db", fake_db)
+        now = datetime.now(timezone.utc)
+        fake_db.revoked_tokens.docs.append(
+            {"jti": "old", "expires_at": now - timedelta(minutes=1), "revoked_at": now})
+        revoked = RevocationList()
+        asyncio.run(revoked.sync())
+        assert "old" not in revoked
+
+    def test_claim_single_winner_across_workers(self, monkeypatch):
+        fake_db = FakeDb()
+        monkeypatch.setattr(server, "db", fake_db)
+        payload = {"jti": "r1", "sub": "u1", "exp": future_exp()}
+        first, second = RevocationList(), RevocationList()
+
+        async def scenario():
+            return await asyncio.gather(first.claim(payload), second.claim(payload))
+
+        assert sorted(asyncio.run(scenario())) == [False, True]
+        assert "r1" in first and "r1" in second
+        assert asyncio.run(first.claim(payload)) is False
+        assert len(fake_db.revoked_tokens.docs) == 1
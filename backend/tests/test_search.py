@@ -0,0 +1,191 @@
+"""
+Test global search over equipamentos, viaturas, materiais and obras
+- GET /api/search?q= finds assets by serial number, plate, code or name, ranked by relevance
+- the index follows creates, updates and deletes without a rebuild
+- SearchIndex prefix matching, normalization, rebuild and latency on ~20k assets (unit)
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+import requests
+
+from server import SEARCH_FIELDS, MirroredIndex, SearchIndex, search_terms
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestSearchEndpoint(TestAuth):
+    """Test /api/search against live data"""
+
+    @pytest.fixture(scope="class")
+    def assets(self, headers):
+        tag = uuid.uuid4().hex[:6]
+        equipamento = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"TEST_SRCH_{tag}",
+            "descricao": "Martelo demolidor",
+            "numero_serie": f"SN{tag}X"
+        }, headers=headers).json()
+        viatura = requests.post(f"{BASE_URL}/api/viaturas", json={
+            "matricula": f"ZZ-{tag[:2]}-QQ",
+            "marca": "Iveco",
+            "modelo": f"Daily{tag}"
+        }, headers=headers).json()
+        yield {"tag": tag, "equipamento": equipamento, "viatura": viatura}
+        requests.delete(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", headers=headers)
+        requests.delete(f"{BASE_URL}/api/viaturas/{viatura['id']}", headers=headers)
+
+    def search(self, headers, **params):
+        response = requests.get(f"{BASE_URL}/api/search", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()["results"]
+
+    def test_find_by_serial_number(self, headers, assets):
+        """Test a serial number finds its equipamento first"""
+        results = self.search(headers, q=f"sn{assets['tag']}x")
+        assert results[0]["id"] == assets["equipamento"]["id"]
+        assert results[0]["tipo"] == "equipamento"
+        print("✓ Found by serial number")
+
+    def test_find_plate_without_separators(self, headers, assets):
+        """Test a plate typed without dashes finds the viatura"""
+        plate = assets["viatura"]["matricula"].replace("-", "").lower()
+        results = self.search(headers, q=plate, tipo="viatura")
+        assert [r["id"] for r in results] == [assets["viatura"]["id"]]
+        print("✓ Plate found without separators")
+
+    def test_updates_and_deletes_are_indexed(self, headers, assets):
+        """Test edits show up in search immediately"""
+        equipamento = assets["equipamento"]
+        novo = f"Compactador {assets['tag']}"
+        response = requests.put(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", json={
+            "codigo": equipamento["codigo"],
+            "descricao": novo
+        }, headers=headers)
+        assert response.status_code == 200
+        assert [r["id"] for r in self.search(headers, q=novo)] == [equipamento["id"]]
+        assert not self.search(headers, q=f"sn{assets['tag']}x")
+
+        material = requests.post(f"{BASE_URL}/api/materiais", json={
+            "codigo": f"TEST_MAT_{assets['tag']}",
+            "descricao": "Cimento"
+        }, headers=headers).json()
+        assert self.search(headers, q=f"test_mat_{assets['tag']}", tipo="material")
+        requests.delete(f"{BASE_URL}/api/materiais/{material['id']}", headers=headers)
+        assert not self.search(headers, q=f"test_mat_{assets['tag']}", tipo="material")
+        print("✓ Index follows writes")
+
+    def test_invalid_tipo(self, headers):
+        """Test unknown tipo is rejected"""
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "x", "tipo": "barco"}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Invalid tipo rejected")
+
+    def test_requires_auth(self):
+        """Test search needs a token"""
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "x"})
+        assert response.status_code in (401, 403)
+        print("✓ Search requires auth")
+
+
+def make_index(docs):
+    index = SearchIndex(SEARCH_FIELDS)
+    for name, doc in docs:
+        index.put(name, doc)
+    return index
+
+
+class TestSearchIndex:
+    """Unit tests for the inverted index"""
+
+    def test_normalization(self):
+        assert search_terms("Betoneira ELÉTRICA  nº5") == ["betoneira", "eletrica", "no5"]
+
+    def test_prefix_and_ranking(self):
+        index = make_index([
+            ("equipamentos", {"id": "e1", "codigo": "EQ-001", "descricao": "Gerador diesel", "marca": "Honda"}),
+            ("equipamentos", {"id": "e2", "codigo": "EQ-002", "descricao": "Geradores antigos", "marca": "Gera"}),
+            ("obras", {"id": "o1", "codigo": "OB-9", "nome": "Escola Geral"}),
+        ])
+        assert {r["id"] for r in index.search("gera")} == {"e1", "e2", "o1"}
+        # Termo exato pesa mais do que um prefixo do mesmo campo
+        assert [r["id"] for r in index.search("gerador")] == ["e1", "e2"]
+        assert [r["id"] for r in index.search("gerador honda")] == ["e1"]
+        assert [r["id"] for r in index.search("eq001")] == ["e1"]
+        assert [r["id"] for r in index.search("gera", {"obras"})] == ["o1"]
+
+    def test_remove_and_update(self):
+        index = make_index([("viaturas", {"id": "v1", "matricula": "AA-00-BB", "marca": "Renault"})])
+        index.put("viaturas", {"id": "v1", "matricula": "AA-00-BB", "marca": "Ford"})
+        assert not index.search("renault")
+        assert index.search("ford")
+        index.remove("viaturas", "v1")
+        assert not index.search("aa00bb")
+        assert index.stats()["terms"] == 0
+
+    def test_rebuild_replays_concurrent_writes(self):
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        database = mongomock_motor.AsyncMongoMockClient()["search"]
+
+        async def scenario():
+            await database.obras.insert_one({"id": "o1", "codigo": "OB-1", "nome": "Ponte"})
+            index = SearchIndex(SEARCH_FIELDS)
+            rebuild = asyncio.create_task(index.rebuild(database))
+            await asyncio.sleep(0)
+            index.put("obras", {"id": "o2", "codigo": "OB-2", "nome": "Tunel"})
+            await rebuild
+            return index
+
+        index = asyncio.run(scenario())
+        assert [r["id"] for r in index.search("ponte")] == ["o1"]
+        assert [r["id"] for r in index.search("tunel")] == ["o2"]
+
+    def test_subclass_must_implement_hooks(self):
+        class Incomplete(MirroredIndex):
+            def _put(self, name, doc):
+                pass
+
+        with pytest.raises(TypeError):
+            Incomplete(SEARCH_FIELDS)
+
+    def test_latency_on_20k_assets(self):
+        marcas = ["Hilti", "Bosch", "Makita", "Stihl", "Honda", "Caterpillar", "Volvo", "Iveco"]
+        docs = []
+        for i in range(15000):
+            docs.append(("equipamentos", {
+                "id": f"e{i}", "codigo": f"EQ-{i:05d}", "numero_serie": f"SN{i * 7919:09d}",
+                "descricao": f"Equipamento {marcas[i % 8]} serie {i % 97}", "marca": marcas[i % 8], "modelo": f"M{i % 300}"
+            }))
+        for i in range(5000):
+            docs.append(("viaturas", {
+                "id": f"v{i}", "matricula": f"{i % 90 + 10:02d}-{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}-{i % 100:02d}",
+                "marca": marcas[i % 8], "modelo": f"T{i % 50}"
+            }))
+        index = make_index(docs)
+        queries = ["eq-01234", "sn000079190", "makita", "hilti m12", "20ka", "volvo t1", "equip"]
+        start = time.perf_counter()
+        for _ in range(10):
+            for q in queries:
+                assert index.search(q)
+        per_query_ms = (time.perf_counter() - start) * 1000 / (10 * len(queries))
+        print(f"✓ {per_query_ms:.2f} ms per query over {len(docs)} assets")
+        assert per_query_ms < 10
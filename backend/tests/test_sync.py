@@ -0,0 +1,137 @@
+"""
+Test delta sync for offline clients
+- GET /api/sync without a token returns everything with reset=true and a token
+- with the token, only documents changed since then and ids deleted since then come back
+- writes maintain updated_at, deletes leave tombstones, and pages follow more=true
+- malformed tokens are rejected (unit)
+"""
+import os
+import time
+import uuid
+
+import pytest
+import requests
+
+from fastapi import HTTPException
+
+from server import SYNC_SETTLE_SECONDS, decode_sync_token, encode_sync_token, initial_positions
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+def settle():
+    time.sleep(SYNC_SETTLE_SECONDS + 0.5)
+
+
+class TestSync(TestAuth):
+    """Test /api/sync against live data"""
+
+    def sync(self, headers, since=None, limit=2000):
+        """Segue more=true e junta as páginas, como faria o cliente"""
+        pages = []
+        while True:
+            response = requests.get(f"{BASE_URL}/api/sync", params={"since": since, "limit": limit},
+                                    headers=headers)
+            assert response.status_code == 200, response.text
+            page = response.json()
+            pages.append(page)
+            since = page["token"]
+            if not page["more"]:
+                return pages
+
+    @staticmethod
+    def ids(pages, key, name):
+        return [item if key == "deleted" else item["id"] for page in pages for item in page[key].get(name, [])]
+
+    def test_full_then_delta(self, headers):
+        """Test a delta after a full sync only carries what changed"""
+        tag = uuid.uuid4().hex[:8]
+        obra = requests.post(f"{BASE_URL}/api/obras", json={"codigo": f"TEST_SYNC_{tag}", "nome": "Obra sync"},
+                             headers=headers).json()
+        material = requests.post(f"{BASE_URL}/api/materiais", json={"codigo": f"TEST_SYNC_{tag}", "descricao": "Brita"},
+                                 headers=headers).json()
+        settle()
+        full = self.sync(headers)
+        assert full[0]["reset"] is True
+        assert obra["id"] in self.ids(full, "changes", "obras")
+        token = full[-1]["token"]
+
+        equipamento = requests.post(f"{BASE_URL}/api/equipamentos", json={
+            "codigo": f"TEST_SYNC_{tag}", "descricao": "Vibrador"
+        }, headers=headers).json()
+        requests.post(f"{BASE_URL}/api/movimentos/stock", json={
+            "material_id": material["id"], "tipo_movimento": "Entrada", "quantidade": 3
+        }, headers=headers)
+        requests.delete(f"{BASE_URL}/api/obras/{obra['id']}", headers=headers)
+        settle()
+
+        delta = self.sync(headers, token)
+        assert all(page["reset"] is False for page in delta)
+        assert self.ids(delta, "changes", "equipamentos") == [equipamento["id"]]
+        [changed] = [m for page in delta for m in page["changes"].get("materiais", [])]
+        assert changed["id"] == material["id"] and changed["stock_atual"] == 3
+        assert len(self.ids(delta, "changes", "movimentos_stock")) == 1
+        assert self.ids(delta, "deleted", "obras") == [obra["id"]]
+        assert "obras" not in delta[-1]["changes"]
+
+        # Nada mudou desde o último token
+        again = self.sync(headers, delta[-1]["token"])
+        assert again[-1]["changes"] == {} and again[-1]["deleted"] == {}
+
+        requests.delete(f"{BASE_URL}/api/equipamentos/{equipamento['id']}", headers=headers)
+        requests.delete(f"{BASE_URL}/api/materiais/{material['id']}", headers=headers)
+        print("✓ Delta carries only changes and tombstones")
+
+    def test_pages_cover_everything(self, headers):
+        """Test small pages with more=true add up to the full sync"""
+        ids = [requests.post(f"{BASE_URL}/api/viaturas", json={"matricula": f"SY-{uuid.uuid4().hex[:6]}"},
+                             headers=headers).json()["id"] for _ in range(4)]
+        settle()
+        full = self.sync(headers)
+        paged = self.sync(headers, limit=3)
+        assert len(paged) > 1
+        for name in ["equipamentos", "viaturas", "obras"]:
+            assert sorted(self.ids(paged, "changes", name)) == sorted(self.ids(full, "changes", name))
+        for item_id in ids:
+            requests.delete(f"{BASE_URL}/api/viaturas/{item_id}", headers=headers)
+        print(f"✓ {len(paged)} pages match the full sync")
+
+    def test_invalid_token(self, headers):
+        response = requests.get(f"{BASE_URL}/api/sync", params={"since": "nao-e-um-token"}, headers=headers)
+        assert response.status_code == 400
+        print("✓ Invalid token rejected")
+
+
+class TestSyncToken:
+    """Unit tests for token encoding"""
+
+    def test_round_trip(self):
+        positions = initial_positions("2026-01-01T00:00:00+00:00")
+        positions["obras"] = ("2025-12-31T23:00:00+00:00", "o1")
+        assert decode_sync_token(encode_sync_token(positions)) == positions
+
+    def test_rejects_tampered_positions(self):
+        positions = initial_positions("2026-01-01T00:00:00+00:00")
+        for broken in [{"obras": 5}, {"obras": ["x"]}, {"-obras": [None, ""]}, {"obras": ["x", 7]}]:
+            with pytest.raises(HTTPException) as exc:
+                decode_sync_token(encode_sync_token({**positions, **broken}))
+            assert exc.value.status_code == 400
+        with pytest.raises(HTTPException):
+            decode_sync_token(encode_sync_token({"obras": [None, ""]}))
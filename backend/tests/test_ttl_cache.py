@@ -0,0 +1,81 @@
+"""
+Unit tests for the in-process TTLCache used by the user cache
+- expiry after ttl
+- LRU eviction order at maxsize
+- hits/misses/evictions/hit_ratio counters
+"""
+import server
+from server import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(monkeypatch, maxsize=3, ttl=10):
+    clock = FakeClock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    return TTLCache(maxsize, ttl), clock
+
+
+class TestTTLCache:
+    def test_get_returns_stored_value(self, monkeypatch):
+        cache, _ = make_cache(monkeypatch)
+        cache.set("a", {"id": "a"})
+        assert cache.get("a") == {"id": "a"}
+        assert cache.get("missing") is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_entry_expires_after_ttl(self, monkeypatch):
+        cache, clock = make_cache(monkeypatch, ttl=10)
+        cache.set("a", 1)
+        clock.now += 9.9
+        assert cache.get("a") == 1
+        clock.now += 0.2
+        assert cache.get("a") is None
+        assert cache.stats()["size"] == 0, "Expired entry should be dropped"
+        assert cache.misses == 1
+
+    def test_lru_eviction_order(self, monkeypatch):
+        cache, _ = make_cache(monkeypatch, maxsize=3)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+        # Touch "a" so "b" becomes the least recently used entry
+        assert cache.get("a") == 1
+        cache.set("d", 4)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.get("d") == 4
+        assert cache.evictions == 1
+        assert cache.stats()["size"] == 3
+
+    def test_invalidate_and_clear(self, monkeypatch):
+        cache, _ = make_cache(monkeypatch)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.invalidate("a")
+        cache.invalidate("unknown")
+        assert cache.get("a") is None
+        cache.clear()
+        assert cache.get("b") is None
+        assert cache.stats()["size"] == 0
+
+    def test_hit_ratio(self, monkeypatch):
+        cache, _ = make_cache(monkeypatch)
+        assert cache.stats()["hit_ratio"] == 0.0
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.75
@@ -0,0 +1,83 @@
+"""
+Test multi-file batch upload (/api/upload/batch)
+- images and PDFs in one request, each with its own result
+- invalid files fail individually without affecting the others
+- identical files in the same batch are stored once
+"""
+import hashlib
+import io
+import os
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestBatchUpload(TestAuth):
+    """Test batch upload results"""
+
+    def test_mixed_batch(self, headers):
+        """Test a photo, a manual, a certificate and an invalid file in one request"""
+        photo = b"\xff\xd8\xff\xe0" + os.urandom(4096)
+        manual = b"%PDF-1.4\n" + os.urandom(8192)
+        certificado = b"%PDF-1.4\n" + os.urandom(8192)
+        files = [
+            ("files", ("foto.jpg", io.BytesIO(photo), "image/jpeg")),
+            ("files", ("manual.pdf", io.BytesIO(manual), "application/pdf")),
+            ("files", ("certificado.pdf", io.BytesIO(certificado), "application/pdf")),
+            ("files", ("notas.txt", io.BytesIO(b"texto"), "text/plain")),
+        ]
+        response = requests.post(f"{BASE_URL}/api/upload/batch", files=files, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["uploaded"] == 3
+        assert data["failed"] == 1
+
+        results = data["results"]
+        assert [r["original_name"] for r in results] == ["foto.jpg", "manual.pdf", "certificado.pdf", "notas.txt"]
+        assert results[0]["sha256"] == hashlib.sha256(photo).hexdigest()
+        assert results[1]["filename"].endswith(".pdf")
+        assert "preview_url" in results[1]
+        assert "preview_url" not in results[0]
+        assert results[3]["ok"] is False and results[3]["error"]
+
+        for result, content in zip(results[:3], [photo, manual, certificado]):
+            assert requests.get(f"{BASE_URL}{result['url']}").content == content
+        print("✓ Mixed batch uploaded with per-file results")
+
+    def test_identical_files_in_batch(self, headers):
+        """Test the same content twice in one batch resolves to one stored file"""
+        content = b"%PDF-1.4\n" + os.urandom(4096)
+        files = [("files", (f"copia{i}.pdf", io.BytesIO(content), "application/pdf")) for i in range(4)]
+        data = requests.post(f"{BASE_URL}/api/upload/batch", files=files, headers=headers).json()
+        assert data["uploaded"] == 4
+        assert len({r["filename"] for r in data["results"]}) == 1
+        print("✓ Identical files deduplicated within a batch")
+
+    def test_oversize_file_fails_alone(self, headers):
+        """Test an oversize PDF fails without affecting the rest of the batch"""
+        files = [
+            ("files", ("grande.pdf", io.BytesIO(b"%PDF" + b"0" * (10 * 1024 * 1024 + 1)), "application/pdf")),
+            ("files", ("foto.png", io.BytesIO(os.urandom(512)), "image/png")),
+        ]
+        data = requests.post(f"{BASE_URL}/api/upload/batch", files=files, headers=headers).json()
+        assert [r["ok"] for r in data["results"]] == [False, True]
+        print("✓ Oversize file rejected individually")
@@ -0,0 +1,76 @@
+"""
+Test content-addressed upload storage (SHA-256 deduplication)
+- Identical uploads return the same filename and are flagged as deduplicated
+- Different content gets a different filename
+- Stored filenames are the content hash
+"""
+import hashlib
+import io
+import os
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUploadDedup(TestAuth):
+    """Test SHA-256 based deduplication"""
+
+    def upload_pdf(self, headers, content, name="manual.pdf"):
+        files = {"file": (name, io.BytesIO(content), "application/pdf")}
+        response = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers)
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        return response.json()
+
+    def test_same_content_deduplicated(self, headers):
+        """Test uploading identical content twice reuses the stored file"""
+        content = b"%PDF-1.4\n" + os.urandom(64 * 1024)
+        first = self.upload_pdf(headers, content, "manual_maquina_1.pdf")
+        second = self.upload_pdf(headers, content, "manual_maquina_2.pdf")
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        assert first["sha256"] == sha256
+        assert first["filename"] == f"{sha256}.pdf"
+        assert first["deduplicated"] is False
+        assert second["filename"] == first["filename"]
+        assert second["deduplicated"] is True
+        assert second["original_name"] == "manual_maquina_2.pdf"
+
+        served = requests.get(f"{BASE_URL}{second['url']}")
+        assert served.content == content
+        print(f"✓ Duplicate upload reused {first['filename']}")
+
+    def test_different_content_different_file(self, headers):
+        """Test different content is stored separately"""
+        first = self.upload_pdf(headers, b"%PDF-1.4\n" + os.urandom(1024))
+        second = self.upload_pdf(headers, b"%PDF-1.4\n" + os.urandom(1024))
+        assert first["filename"] != second["filename"]
+        print("✓ Different content stored separately")
+
+    def test_image_dedup(self, headers):
+        """Test image uploads are deduplicated too"""
+        content = b"\xff\xd8\xff\xe0" + os.urandom(4096)
+        files = lambda: {"file": ("foto.jpg", io.BytesIO(content), "image/jpeg")}
+        first = requests.post(f"{BASE_URL}/api/upload", files=files(), headers=headers).json()
+        second = requests.post(f"{BASE_URL}/api/upload", files=files(), headers=headers).json()
+        assert first["filename"] == second["filename"]
+        assert second["deduplicated"] is True
+        print("✓ Image deduplicated")
@@ -0,0 +1,122 @@
+"""
+Unit tests for the orphaned-upload garbage collector
+- unreferenced files past the grace period are quarantined, then deleted
+- referenced files, recent files, PDF previews and kept originals of referenced uploads are kept
+- a quarantined file that becomes referenced again is restored, not deleted
+- progress is checkpointed in batches and only one instance holds the lease
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from server import LocalStorage, UploadGC, upload_key_from_url, upload_owner_stem
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+OLD = time.time() - 7 * 24 * 3600
+
+
+def make_file(directory, name, mtime=OLD):
+    path = directory / name
+    path.write_bytes(b"x")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def make_gc(db, directory, batch_size=100, quarantine_seconds=3600):
+    return UploadGC(db, LocalStorage(directory), batch_size, grace_seconds=3600,
+                    quarantine_seconds=quarantine_seconds, lease_seconds=60)
+
+
+async def expire_quarantine(db):
+    await db.upload_quarantine.update_many({}, {"$set": {"quarantined_at": "2000-01-01T00:00:00+00:00"}})
+
+
+def test_helpers():
+    assert upload_key_from_url("/api/uploads/abc.jpg") == "abc.jpg"
+    assert upload_key_from_url("https://host/api/uploads/abc.jpg?w=128") == "abc.jpg"
+    assert upload_key_from_url("") is None
+    assert upload_key_from_url(None) is None
+    assert upload_owner_stem("abc_preview.webp") == "abc"
+    assert upload_owner_stem("abc_original.png") == "abc"
+    assert upload_owner_stem("abc.jpg") == "abc"
+
+
+def test_quarantine_then_delete(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gc"]
+        await db.equipamentos.insert_one({"id": "e1", "foto": "/api/uploads/used.jpg", "manual_url": "/api/uploads/doc.pdf"})
+        await db.viaturas.insert_one({"id": "v1", "dua_url": "https://api.example/api/uploads/dua.pdf"})
+        for name in ["used.jpg", "used_original.png", "doc.pdf", "doc_preview.webp", "dua.pdf",
+                     "orphan.jpg", "orphan_preview.webp"]:
+            make_file(tmp_path, name)
+        make_file(tmp_path, "recent.jpg", mtime=time.time())
+        (tmp_path / ".tmp").mkdir()
+
+        gc = make_gc(db, tmp_path)
+        summary = await gc.step()
+        assert summary["quarantined"] == 2
+        assert summary["pass_complete"] is True
+        quarantined = [d["_id"] for d in await db.upload_quarantine.find().to_list(None)]
+        assert sorted(quarantined) == ["orphan.jpg", "orphan_preview.webp"]
+        assert (tmp_path / "orphan.jpg").exists(), "quarantine does not delete immediately"
+
+        await expire_quarantine(db)
+        summary = await gc.step()
+        assert summary["deleted"] == 2
+        remaining = sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith("."))
+        assert remaining == ["doc.pdf", "doc_preview.webp", "dua.pdf", "recent.jpg", "used.jpg", "used_original.png"]
+        assert await db.upload_quarantine.count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_rereferenced_file_is_restored(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gc"]
+        make_file(tmp_path, "foto.jpg")
+        gc = make_gc(db, tmp_path)
+        assert (await gc.step())["quarantined"] == 1
+
+        # Entretanto alguém volta a usar a foto
+        await db.viaturas.insert_one({"id": "v1", "foto": "/api/uploads/foto.jpg"})
+        await expire_quarantine(db)
+        summary = await gc.step()
+        assert summary["deleted"] == 0
+        assert summary["restored"] == 1
+        assert (tmp_path / "foto.jpg").exists()
+
+    asyncio.run(scenario())
+
+
+def test_checkpointed_batches(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gc"]
+        for index in range(5):
+            make_file(tmp_path, f"f{index}.jpg")
+        gc = make_gc(db, tmp_path, batch_size=2)
+
+        first = await gc.step()
+        assert first["scanned"] == 2 and first["pass_complete"] is False
+        assert (await db.upload_gc_state.find_one({"_id": "gc"}))["cursor"] == "f1.jpg"
+
+        # Outra instância (novo objeto) retoma do checkpoint depois de o lease expirar
+        await db.upload_gc_state.update_one({"_id": "gc"}, {"$set": {"lease_until": "2000-01-01T00:00:00+00:00"}})
+        other = make_gc(db, tmp_path, batch_size=2)
+        totals = await other.run_pass()
+        assert totals["scanned"] == 3
+        assert await db.upload_quarantine.count_documents({}) == 5
+
+    asyncio.run(scenario())
+
+
+def test_lease_blocks_second_instance(tmp_path):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["gc"]
+        make_file(tmp_path, "a.jpg")
+        await make_gc(db, tmp_path).step()
+        assert (await make_gc(db, tmp_path).step()) == {"skipped": True}
+
+    asyncio.run(scenario())
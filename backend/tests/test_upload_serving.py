@@ -0,0 +1,107 @@
+"""
+Test efficient serving of /api/uploads/{filename}
+- ETag / Last-Modified / immutable Cache-Control headers
+- If-None-Match and If-Modified-Since return 304
+- Range requests return 206 with the requested bytes, 416 when unsatisfiable
+"""
+import io
+import os
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUploadServing(TestAuth):
+    """Test caching and range support"""
+
+    @pytest.fixture(scope="class")
+    def uploaded(self, headers):
+        content = b"%PDF-1.4\n" + os.urandom(200 * 1024)
+        files = {"file": ("manual.pdf", io.BytesIO(content), "application/pdf")}
+        response = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers)
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        return {"url": f"{BASE_URL}{response.json()['url']}", "content": content}
+
+    def test_cache_headers(self, uploaded):
+        """Test uploads are served with validators and immutable caching"""
+        response = requests.get(uploaded["url"])
+        assert response.status_code == 200
+        assert response.content == uploaded["content"]
+        assert response.headers["Content-Type"] == "application/pdf"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert response.headers["Accept-Ranges"] == "bytes"
+        assert response.headers.get("ETag")
+        assert response.headers.get("Last-Modified")
+        print(f"✓ Cache headers: ETag={response.headers['ETag']}")
+
+    def test_if_none_match_returns_304(self, uploaded):
+        """Test matching ETag returns 304 without body"""
+        etag = requests.get(uploaded["url"]).headers["ETag"]
+        response = requests.get(uploaded["url"], headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        print("✓ If-None-Match -> 304")
+
+    def test_if_modified_since_returns_304(self, uploaded):
+        """Test If-Modified-Since at Last-Modified returns 304"""
+        last_modified = requests.get(uploaded["url"]).headers["Last-Modified"]
+        response = requests.get(uploaded["url"], headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        print("✓ If-Modified-Since -> 304")
+
+    def test_range_request(self, uploaded):
+        """Test byte range returns partial content"""
+        size = len(uploaded["content"])
+        response = requests.get(uploaded["url"], headers={"Range": "bytes=100-1123"})
+        assert response.status_code == 206
+        assert response.content == uploaded["content"][100:1124]
+        assert response.headers["Content-Range"] == f"bytes 100-1123/{size}"
+
+        response = requests.get(uploaded["url"], headers={"Range": "bytes=-500"})
+        assert response.status_code == 206
+        assert response.content == uploaded["content"][-500:]
+
+        response = requests.get(uploaded["url"], headers={"Range": f"bytes={size - 10}-"})
+        assert response.status_code == 206
+        assert response.content == uploaded["content"][-10:]
+        print("✓ Range requests return 206")
+
+    def test_unsatisfiable_range(self, uploaded):
+        """Test range past end of file returns 416"""
+        size = len(uploaded["content"])
+        response = requests.get(uploaded["url"], headers={"Range": f"bytes={size + 10}-"})
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == f"bytes */{size}"
+        print("✓ Unsatisfiable range -> 416")
+
+    def test_stale_if_range_returns_full_file(self, uploaded):
+        """Test If-Range with another ETag ignores the Range header"""
+        response = requests.get(uploaded["url"], headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert response.content == uploaded["content"]
+        print("✓ Stale If-Range -> full file")
+
+    def test_missing_file_404(self):
+        """Test unknown or hidden files return 404"""
+        assert requests.get(f"{BASE_URL}/api/uploads/does-not-exist.pdf").status_code == 404
+        assert requests.get(f"{BASE_URL}/api/uploads/.tmp").status_code == 404
+        print("✓ Missing file -> 404")
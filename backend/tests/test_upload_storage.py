@@ -0,0 +1,88 @@
+"""
+Unit tests for the upload storage backends
+- LocalStorage round trip: put_file, exists, stat, iter_range, local_copy, delete
+- S3Storage against an S3-compatible endpoint (MinIO), when S3_TEST_ENDPOINT_URL is set
+- GridFSStorage against a real MongoDB, when GRIDFS_TEST_MONGO_URL is set
+"""
+import asyncio
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+
+from server import GridFSStorage, LocalStorage, S3Storage
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 17)  # mais de um bloco de leitura
+
+
+async def collect(iterator):
+    return b"".join([chunk async for chunk in iterator])
+
+
+async def round_trip(storage, tmp_path):
+    """Exercita a interface comum a todos os backends"""
+    key = f"{uuid.uuid4().hex}.pdf"
+    src = tmp_path / "upload.part"
+    src.write_bytes(CONTENT)
+
+    assert await storage.exists(key) is False
+    assert await storage.stat(key) is None
+
+    await storage.put_file(key, src, "application/pdf")
+    assert not src.exists(), "put_file consumes the temporary file"
+    assert await storage.exists(key) is True
+
+    info = await storage.stat(key)
+    assert info["size"] == len(CONTENT)
+    assert info["mtime"] > 0 and info["mtime_ns"] > 0
+
+    assert await collect(storage.iter_range(key, 0, len(CONTENT) - 1)) == CONTENT
+    assert await collect(storage.iter_range(key, 100, 199)) == CONTENT[100:200]
+    assert await collect(storage.iter_range(key, len(CONTENT) - 5, len(CONTENT) - 1)) == CONTENT[-5:]
+
+    async with storage.local_copy(key) as path:
+        assert Path(path).read_bytes() == CONTENT
+
+    await storage.delete(key)
+    assert await storage.exists(key) is False
+
+
+class TestLocalStorage:
+    def test_round_trip(self, tmp_path):
+        directory = tmp_path / "uploads"
+        directory.mkdir()
+        storage = LocalStorage(directory)
+        asyncio.run(round_trip(storage, tmp_path))
+
+    def test_local_path(self, tmp_path):
+        storage = LocalStorage(tmp_path)
+        assert storage.local_path("a.jpg") == tmp_path / "a.jpg"
+
+
+@pytest.mark.skipif(not os.environ.get("S3_TEST_ENDPOINT_URL"), reason="S3_TEST_ENDPOINT_URL not set")
+class TestS3Storage:
+    def test_round_trip(self, tmp_path):
+        storage = S3Storage(
+            os.environ.get("S3_TEST_BUCKET", "uploads-test"),
+            prefix="test/",
+            endpoint_url=os.environ["S3_TEST_ENDPOINT_URL"]
+        )
+        assert storage.local_path("a.jpg") is None
+        asyncio.run(round_trip(storage, tmp_path))
+
+
+@pytest.mark.skipif(not os.environ.get("GRIDFS_TEST_MONGO_URL"), reason="GRIDFS_TEST_MONGO_URL not set")
+class TestGridFSStorage:
+    def test_round_trip(self, tmp_path):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def scenario():
+            client = AsyncIOMotorClient(os.environ["GRIDFS_TEST_MONGO_URL"])
+            try:
+                storage = GridFSStorage(client["test_upload_storage"], "uploads_fs")
+                await round_trip(storage, tmp_path)
+            finally:
+                client.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,66 @@
+"""
+Test streamed uploads
+- POST /api/upload/pdf rejects files over 10MB while streaming
+- Multi-chunk uploads are stored intact and served back byte for byte
+"""
+import io
+import os
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+PDF_HEADER = b"%PDF-1.4\n"
+
+
+class TestAuth:
+    """Get authentication token for tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_token(self):
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@test.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return response.json()["access_token"]
+
+    @pytest.fixture(scope="class")
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+
+
+class TestUploadStreaming(TestAuth):
+    """Test chunked upload handling"""
+
+    def test_pdf_over_limit_rejected(self, headers):
+        """Test PDF larger than 10MB is rejected"""
+        content = PDF_HEADER + b"0" * (10 * 1024 * 1024)
+        files = {"file": ("big.pdf", io.BytesIO(content), "application/pdf")}
+        response = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers)
+        assert response.status_code == 400
+        assert "10MB" in response.json()["detail"]
+        print("✓ PDF over 10MB rejected")
+
+    def test_multi_chunk_pdf_roundtrip(self, headers):
+        """Test a PDF spanning several chunks is stored intact"""
+        content = PDF_HEADER + os.urandom(3 * 1024 * 1024 + 123)
+        files = {"file": ("manual.pdf", io.BytesIO(content), "application/pdf")}
+        response = requests.post(f"{BASE_URL}/api/upload/pdf", files=files, headers=headers)
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        served = requests.get(f"{BASE_URL}{response.json()['url']}")
+        assert served.status_code == 200
+        assert served.content == content
+        print("✓ Multi-chunk PDF stored intact")
+
+    def test_image_roundtrip(self, headers):
+        """Test image upload is stored intact"""
+        content = b"\xff\xd8\xff\xe0" + os.urandom(2 * 1024 * 1024)
+        files = {"file": ("foto.jpg", io.BytesIO(content), "image/jpeg")}
+        response = requests.post(f"{BASE_URL}/api/upload", files=files, headers=headers)
+        assert response.status_code == 200, f"Upload failed: {response.text}"
+        served = requests.get(f"{BASE_URL}{response.json()['url']}")
+        assert served.status_code == 200
+        assert served.content == content
+        print("✓ Image stored intact")
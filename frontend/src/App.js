@@ -1,4 +1,4 @@
-import { useState, useEffect, createContext, useContext } from "react";
+import { useState, useEffect, useCallback, createContext, useContext } from "react";
 import "@/App.css";
 import { BrowserRouter, Routes, Route, Navigate } from "react-router-dom";
 import axios from "axios";
@@ -24,6 +24,28 @@ import Layout from "@/components/Layout";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 export const API = `${BACKEND_URL}/api`;
 
+// URL de um upload; com width pede uma miniatura WebP redimensionada pelo backend
+export const getUploadUrl = (url, width) => {
+  if (!url) return null;
+  if (!url.startsWith('/api')) return url;
+  return width ? `${BACKEND_URL}${url}?w=${width}&fmt=webp` : `${BACKEND_URL}${url}`;
+};
+
+// Listagens são paginadas por cursor ({ items, next_cursor }); junta todas as páginas
+export const fetchAllPages = async (url, config = {}) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, {
+      ...config,
+      params: { ...config.params, limit: 500, ...(cursor ? { cursor } : {}) },
+    });
+    items.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return { data: items };
+};
+
 // Register Service Worker for PWA
 if ('serviceWorker' in navigator) {
   window.addEventListener('load', () => {
@@ -82,11 +104,66 @@ const ThemeProvider = ({ children }) => {
   );
 };
 
+// Endpoints de autenticação que não devem disparar um refresh automático
+const NO_REFRESH_URLS = ["/auth/login", "/auth/register", "/auth/refresh"];
+
 const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem("token"));
   const [loading, setLoading] = useState(true);
 
+  const storeTokens = useCallback(({ access_token, refresh_token }) => {
+    localStorage.setItem("token", access_token);
+    if (refresh_token) {
+      localStorage.setItem("refresh_token", refresh_token);
+    }
+    setToken(access_token);
+  }, []);
+
+  const clearTokens = useCallback(() => {
+    localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
+    setToken(null);
+    setUser(null);
+  }, []);
+
+  // Access tokens são de curta duração: num 401 troca o refresh token e repete o pedido
+  useEffect(() => {
+    let refreshing = null;
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const refreshToken = localStorage.getItem("refresh_token");
+        if (
+          error.response?.status !== 401 ||
+          !refreshToken ||
+          !original ||
+          original._retry ||
+          NO_REFRESH_URLS.some((url) => original.url?.includes(url))
+        ) {
+          return Promise.reject(error);
+        }
+        original._retry = true;
+        try {
+          if (!refreshing) {
+            refreshing = axios
+              .post(`${API}/auth/refresh`, { refresh_token: refreshToken })
+              .finally(() => { refreshing = null; });
+          }
+          const { data } = await refreshing;
+          storeTokens(data);
+          original.headers.Authorization = `Bearer ${data.access_token}`;
+          return axios(original);
+        } catch {
+          clearTokens();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, [storeTokens, clearTokens]);
+
   useEffect(() => {
     const verifyToken = async () => {
       if (token) {
@@ -96,38 +173,41 @@ const AuthProvider = ({ children }) => {
           });
           setUser(response.data);
         } catch {
-          localStorage.removeItem("token");
-          setToken(null);
-          setUser(null);
+          clearTokens();
         }
       }
       setLoading(false);
     };
     verifyToken();
-  }, [token]);
+  }, [token, clearTokens]);
 
   const login = async (email, password) => {
     const response = await axios.post(`${API}/auth/login`, { email, password });
-    const { access_token, user: userData } = response.data;
-    localStorage.setItem("token", access_token);
-    setToken(access_token);
+    storeTokens(response.data);
+    const userData = response.data.user;
     setUser(userData);
     return userData;
   };
 
   const register = async (name, email, password) => {
     const response = await axios.post(`${API}/auth/register`, { name, email, password });
-    const { access_token, user: userData } = response.data;
-    localStorage.setItem("token", access_token);
-    setToken(access_token);
+    storeTokens(response.data);
+    const userData = response.data.user;
     setUser(userData);
     return userData;
   };
 
   const logout = () => {
-    localStorage.removeItem("token");
-    setToken(null);
-    setUser(null);
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (token) {
+      // Revoga os tokens no servidor; a sessão local termina de imediato
+      axios.post(
+        `${API}/auth/logout`,
+        refreshToken ? { refresh_token: refreshToken } : undefined,
+        { headers: { Authorization: `Bearer ${token}` }, _retry: true }
+      ).catch(() => {});
+    }
+    clearTokens();
   };
 
   return (
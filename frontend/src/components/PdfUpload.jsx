@@ -5,9 +5,56 @@ import { toast } from "sonner";
 import { Upload, FileText, X, Loader2 } from "lucide-react";
 import { Button } from "@/components/ui/button";
 
+// Envio por sessão retomável: em redes fracas uma falha só repete o bloco em curso
+const CHUNK_SIZE = 512 * 1024;
+const MAX_RETRIES = 5;
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function uploadResumable(file, headers, onProgress) {
+  const { data: session } = await axios.post(`${API}/upload/sessions`, {
+    filename: file.name,
+    size: file.size,
+    content_type: file.type,
+  }, { headers });
+  const sessionUrl = `${API}/upload/sessions/${session.id}`;
+
+  let offset = session.offset;
+  let failures = 0;
+  let resync = false;
+  while (offset < file.size) {
+    try {
+      if (resync) {
+        // Retoma a partir do que o servidor tem de facto gravado; falhar aqui conta como mais uma tentativa
+        const { data } = await axios.get(sessionUrl, { headers });
+        offset = data.offset;
+        resync = false;
+        continue;
+      }
+      const { data } = await axios.put(sessionUrl, file.slice(offset, offset + CHUNK_SIZE), {
+        params: { offset },
+        headers: { ...headers, "Content-Type": "application/octet-stream" },
+      });
+      offset = data.offset;
+      failures = 0;
+      onProgress(Math.round((offset / file.size) * 100));
+    } catch (error) {
+      if (error.response && error.response.status !== 409) throw error;
+      failures += 1;
+      if (failures > MAX_RETRIES) throw error;
+      await wait(1000 * 2 ** (failures - 1));
+      resync = true;
+    }
+  }
+
+  const { data } = await axios.post(`${sessionUrl}/complete`, null, { headers });
+  return data;
+}
+
 export default function PdfUpload({ value, onChange, label = "Carregar PDF", isDark = true }) {
   const { token } = useAuth();
   const [uploading, setUploading] = useState(false);
+  const [progress, setProgress] = useState(0);
   const fileInputRef = useRef(null);
 
   const handleFileSelect = async (event) => {
@@ -25,17 +72,11 @@ export default function PdfUpload({ value, onChange, label = "Carregar PDF", isD
     }
 
     setUploading(true);
-    const formData = new FormData();
-    formData.append("file", file);
+    setProgress(0);
 
     try {
-      const response = await axios.post(`${API}/upload/pdf`, formData, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "multipart/form-data",
-        },
-      });
-      onChange(response.data.url);
+      const result = await uploadResumable(file, { Authorization: `Bearer ${token}` }, setProgress);
+      onChange(result.url);
       toast.success("PDF carregado com sucesso");
     } catch (error) {
       toast.error(error.response?.data?.detail || "Erro ao carregar PDF");
@@ -100,7 +141,7 @@ export default function PdfUpload({ value, onChange, label = "Carregar PDF", isD
           {uploading ? (
             <>
               <Loader2 className="h-4 w-4 mr-2 animate-spin" />
-              A carregar...
+              A carregar... {progress > 0 && `${progress}%`}
             </>
           ) : (
             <>
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, useTheme, API } from "@/App";
+import { useAuth, useTheme, API, getUploadUrl, fetchAllPages } from "@/App";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -79,8 +79,8 @@ export default function Equipamentos() {
   const fetchData = useCallback(async () => {
     try {
     const [eqRes, obrasRes] = await Promise.all([
-      axios.get(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` } }),
-      axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+      fetchAllPages(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` } }),
+      fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
     ]);
     setEquipamentos(eqRes.data);
     setObras(obrasRes.data);
@@ -221,10 +221,8 @@ export default function Equipamentos() {
     return obra ? obra.nome : null;
   };
 
-  const getPhotoUrl = (foto) => {
-    if (!foto) return null;
-    return foto.startsWith('/api') ? `${process.env.REACT_APP_BACKEND_URL}${foto}` : foto;
-  };
+  // Miniaturas de 48-64px: pede 128px para ecrãs de alta densidade
+  const getPhotoUrl = (foto) => getUploadUrl(foto, 128);
 
   // Input classes for light/dark mode
   const inputClass = isDark 
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, useTheme, API } from "@/App";
+import { useAuth, useTheme, API, fetchAllPages } from "@/App";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -70,8 +70,8 @@ export default function Materiais() {
   const fetchData = useCallback(async () => {
     try {
       const [matRes, obrasRes] = await Promise.all([
-        axios.get(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` } }),
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setMateriais(matRes.data);
       setObras(obrasRes.data);
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, API } from "@/App";
+import { useAuth, API, fetchAllPages } from "@/App";
 import axios from "axios";
 import { toast } from "sonner";
 import { Plus, ArrowLeftRight, ArrowRight, ArrowLeft } from "lucide-react";
@@ -47,10 +47,10 @@ export default function MovimentosAtivos() {
   const fetchData = useCallback(async () => {
     try {
       const [movRes, eqRes, viRes, obrasRes] = await Promise.all([
-        axios.get(`${API}/movimentos`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/movimentos`, { headers: { Authorization: `Bearer ${token}` } }),
+        fetchAllPages(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } }),
+        fetchAllPages(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } }),
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setMovimentos(movRes.data);
       setEquipamentos(eqRes.data);
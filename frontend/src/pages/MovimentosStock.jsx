@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, API } from "@/App";
+import { useAuth, API, fetchAllPages } from "@/App";
 import axios from "axios";
 import { toast } from "sonner";
 import { Plus, Package, ArrowDown, ArrowUp } from "lucide-react";
@@ -46,9 +46,9 @@ export default function MovimentosStock() {
   const fetchData = useCallback(async () => {
     try {
       const [movRes, matRes, obrasRes] = await Promise.all([
-        axios.get(`${API}/movimentos/stock`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/movimentos/stock`, { headers: { Authorization: `Bearer ${token}` } }),
+        fetchAllPages(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } }),
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setMovimentos(movRes.data);
       setMateriais(matRes.data);
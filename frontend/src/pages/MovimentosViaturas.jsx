@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, API } from "@/App";
+import { useAuth, API, fetchAllPages } from "@/App";
 import axios from "axios";
 import { toast } from "sonner";
 import { Plus, Truck, Gauge } from "lucide-react";
@@ -43,9 +43,9 @@ export default function MovimentosViaturas() {
   const fetchData = useCallback(async () => {
     try {
       const [movRes, viatRes, obrasRes] = await Promise.all([
-        axios.get(`${API}/movimentos/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/movimentos/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
+        fetchAllPages(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } }),
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setMovimentos(movRes.data);
       setViaturas(viatRes.data);
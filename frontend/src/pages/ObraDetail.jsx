@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, useTheme, API } from "@/App";
+import { useAuth, useTheme, API, getUploadUrl, fetchAllPages } from "@/App";
 import { useParams, useNavigate, Link } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -67,14 +67,14 @@ export default function ObraDetail() {
     try {
       const [obraRes, equipRes, viatRes, matRes] = await Promise.all([
         axios.get(`${API}/obras/${id}`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/equipamentos`, { headers: { Authorization: `Bearer ${token}` }, params: { atribuido: false, fields: "picker" } }),
+        fetchAllPages(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` }, params: { atribuido: false, fields: "picker" } }),
+        fetchAllPages(`${API}/materiais`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
 
       setObraData(obraRes.data);
-      setEquipamentosDisponiveis(equipRes.data.filter(e => !e.obra_id));
-      setViaturasDisponiveis(viatRes.data.filter(v => !v.obra_id));
+      setEquipamentosDisponiveis(equipRes.data);
+      setViaturasDisponiveis(viatRes.data);
       setMateriais(matRes.data);
     } catch (error) {
       toast.error("Erro ao carregar dados da obra");
@@ -320,7 +320,7 @@ export default function ObraDetail() {
                       <div className="flex items-center gap-4">
                         {item.foto ? (
                           <img 
-                            src={item.foto.startsWith('/api') ? `${process.env.REACT_APP_BACKEND_URL}${item.foto}` : item.foto}
+                            src={getUploadUrl(item.foto, 128)}
                             alt={item.codigo}
                             className="h-12 w-12 object-cover rounded-lg"
                           />
@@ -387,7 +387,7 @@ export default function ObraDetail() {
                       <div className="flex items-center gap-4">
                         {item.foto ? (
                           <img 
-                            src={item.foto.startsWith('/api') ? `${process.env.REACT_APP_BACKEND_URL}${item.foto}` : item.foto}
+                            src={getUploadUrl(item.foto, 128)}
                             alt={item.matricula}
                             className="h-12 w-12 object-cover rounded-lg"
                           />
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, API } from "@/App";
+import { useAuth, API, fetchAllPages } from "@/App";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -55,7 +55,7 @@ export default function Obras() {
 
   const fetchData = useCallback(async () => {
     try {
-      const response = await axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } });
+      const response = await fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } });
       setObras(response.data);
     } catch (error) {
       toast.error("Erro ao carregar obras");
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from "react";
-import { useAuth, useTheme, API } from "@/App";
+import { useAuth, useTheme, API, fetchAllPages } from "@/App";
 import { Link } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -74,7 +74,7 @@ export default function Reports() {
     try {
       const [summaryRes, obrasRes] = await Promise.all([
         axios.get(`${API}/summary`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setSummary(summaryRes.data);
       setObras(obrasRes.data);
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from "react";
-import { useAuth, useTheme, API } from "@/App";
+import { useAuth, useTheme, API, getUploadUrl, fetchAllPages } from "@/App";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
 import { toast } from "sonner";
@@ -90,8 +90,8 @@ export default function Viaturas() {
   const fetchData = useCallback(async () => {
     try {
       const [vRes, obrasRes] = await Promise.all([
-        axios.get(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` } })
+        fetchAllPages(`${API}/viaturas`, { headers: { Authorization: `Bearer ${token}` } }),
+        fetchAllPages(`${API}/obras`, { headers: { Authorization: `Bearer ${token}` }, params: { fields: "picker" } })
       ]);
       setViaturas(vRes.data);
       setObras(obrasRes.data);
@@ -321,7 +321,7 @@ export default function Viaturas() {
                   <td className="py-2 px-4">
                     {item.foto ? (
                       <img 
-                        src={item.foto.startsWith('/api') ? `${process.env.REACT_APP_BACKEND_URL}${item.foto}` : item.foto}
+                        src={getUploadUrl(item.foto, 128)}
                         alt={item.matricula}
                         className="h-12 w-12 object-cover rounded-lg"
                         onError={(e) => { e.target.style.display = 'none'; }}
@@ -404,7 +404,7 @@ export default function Viaturas() {
               <div className="flex gap-3 mb-3">
                 {item.foto ? (
                   <img 
-                    src={item.foto.startsWith('/api') ? `${process.env.REACT_APP_BACKEND_URL}${item.foto}` : item.foto}
+                    src={getUploadUrl(item.foto, 128)}
                     alt={item.matricula}
                     className="h-16 w-16 object-cover rounded-lg flex-shrink-0"
                   />